@@ -0,0 +1,275 @@
+"""
+Admission control for the OCR API
+Limits how many requests may run each model at the same time and keeps a
+bounded FIFO queue per model. When the queue is full, requests are shed
+immediately with 429. When a queued request waits longer than the queue
+timeout, it gets 503. Both responses carry a Retry-After header estimated
+from the model's recent service time.
+
+Settings are read from the environment:
+    OCR_MODEL_CONCURRENCY: Concurrent requests per model (default: OCR_CONCURRENCY or 1)
+    OCR_MODEL_LIMITS: JSON object with per-model concurrency overrides,
+        e.g. {"SwinTextSpotter": 1, "EasyOCR": 2}
+    OCR_MAX_QUEUE: Maximum number of waiting requests per model (default: 8)
+    OCR_QUEUE_TIMEOUT: Maximum queue wait in seconds (default: 10)
+"""
+
+import asyncio
+import json
+import math
+import os
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, Optional
+
+from fastapi import HTTPException
+
+# Weight of the latest sample in the service time moving average
+EWMA_ALPHA = 0.2
+
+
+class ModelGate:
+    """Concurrency limit and bounded FIFO wait queue for one model"""
+
+    def __init__(self, name: str, limit: int, max_queue: int):
+        self.name = name
+        self.limit = max(1, limit)
+        self.max_queue = max(0, max_queue)
+        self.active = 0
+        self._waiters = deque()
+        # Moving average of the time a request holds a slot, in seconds
+        self.service_time_s: Optional[float] = None
+        self.shed = 0
+        self.timed_out = 0
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter.done())
+
+    def retry_after(self) -> int:
+        """Estimated seconds until a new request would get a slot"""
+        service_time = self.service_time_s or 1.0
+        return max(1, math.ceil(service_time * (self.waiting + 1) / self.limit))
+
+    def has_room(self) -> bool:
+        """Whether a new request would be admitted (run now or queued)"""
+        return self.active < self.limit or self.waiting < self.max_queue
+
+    def overloaded_error(self, status_code: int, reason: str) -> HTTPException:
+        return HTTPException(
+            status_code=status_code,
+            detail=f"{self.name} is overloaded: {reason}",
+            headers={"Retry-After": str(self.retry_after())},
+        )
+
+    async def acquire(self, timeout: float) -> float:
+        """
+        Wait for a slot
+
+        Args:
+            timeout: Maximum wait in seconds
+
+        Returns:
+            Time spent in the queue in seconds
+
+        Raises:
+            HTTPException: 429 if the queue is full
+            asyncio.TimeoutError: no slot became free within the timeout
+        """
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+            return 0.0
+        if self.waiting >= self.max_queue:
+            self.shed += 1
+            raise self.overloaded_error(429, "queue is full")
+
+        start = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except BaseException:
+            # Timed out or cancelled just as the slot was handed over (the
+            # waiter has its result): pass the slot on instead of leaking it
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        return time.perf_counter() - start
+
+    def release(self, service_time_s: Optional[float] = None):
+        """Free a slot, handing it directly to the oldest waiter if any"""
+        if service_time_s is not None:
+            if self.service_time_s is None:
+                self.service_time_s = service_time_s
+            else:
+                self.service_time_s += EWMA_ALPHA * (
+                    service_time_s - self.service_time_s
+                )
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot stays counted as active for the woken request
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> Dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_queue": self.max_queue,
+            "service_time_ms": round(self.service_time_s * 1000, 1)
+            if self.service_time_s is not None
+            else None,
+            "shed": self.shed,
+            "timed_out": self.timed_out,
+        }
+
+
+class AdmissionController:
+    """Per-model gates sharing one queue size and queue timeout"""
+
+    def __init__(
+        self,
+        limits: Dict[str, int],
+        default_limit: int = 1,
+        max_queue: int = 8,
+        queue_timeout: float = 10.0,
+    ):
+        self.limits = limits
+        self.default_limit = default_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.gates: Dict[str, ModelGate] = {}
+
+    def gate(self, model_name: str) -> ModelGate:
+        if model_name not in self.gates:
+            self.gates[model_name] = ModelGate(
+                model_name,
+                self.limits.get(model_name, self.default_limit),
+                self.max_queue,
+            )
+        return self.gates[model_name]
+
+    def check(self, model_names: Iterable[str]):
+        """
+        Shed a request up front if any of its models has a full queue, so it
+        is rejected before any model has run
+
+        Raises:
+            HTTPException: 429 with Retry-After
+        """
+        for model_name in model_names:
+            gate = self.gate(model_name)
+            if not gate.has_room():
+                gate.shed += 1
+                raise gate.overloaded_error(429, "queue is full")
+
+    async def run(
+        self,
+        model_name: str,
+        func: Callable,
+        *args,
+        timeout: Optional[float] = None,
+        deadline: Optional[float] = None,
+        timings: Optional[Dict] = None,
+    ):
+        """
+        Run func(*args, run_deadline) in a worker thread once the model has a
+        free slot
+
+        run_deadline is the time.monotonic() value at which the caller stops
+        waiting (None without timeout), so func can stop early. The slot is
+        held until func returns, even if the caller stopped waiting for it or
+        was cancelled: abandoned work keeps counting against the model's
+        limit, so new requests queue behind it instead of oversubscribing the
+        CPU.
+
+        Args:
+            model_name: Model whose slot is used
+            func: Blocking function to run
+            timeout: Maximum run time in seconds, counted once the slot is granted
+            deadline: Overall time.monotonic() deadline, including the queue wait
+            timings: Dict that receives the queue wait as "queue_wait_ms"
+
+        Raises:
+            asyncio.TimeoutError: func did not finish in time
+            HTTPException: 429 / 503 from the queue
+        """
+        gate = self.gate(model_name)
+        queue_timeout = self.queue_timeout
+        if deadline is not None:
+            queue_timeout = min(queue_timeout, max(0.0, deadline - time.monotonic()))
+        try:
+            waited = await gate.acquire(queue_timeout)
+        except asyncio.TimeoutError:
+            if queue_timeout < self.queue_timeout:
+                # Cut short by the request deadline, not an overload
+                raise
+            gate.timed_out += 1
+            raise gate.overloaded_error(
+                503, f"no slot became free within {self.queue_timeout:g} s"
+            )
+        if timings is not None:
+            timings["queue_wait_ms"] = round(waited * 1000, 2)
+
+        now = time.monotonic()
+        run_deadline = now + timeout if timeout is not None else None
+        if deadline is not None:
+            run_deadline = deadline if run_deadline is None else min(run_deadline, deadline)
+        if run_deadline is not None and run_deadline <= now:
+            gate.release()
+            raise asyncio.TimeoutError()
+
+        start = time.perf_counter()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(
+                None, func, *args, run_deadline
+            )
+        except BaseException:
+            gate.release()
+            raise
+        future.add_done_callback(
+            lambda _: gate.release(time.perf_counter() - start)
+        )
+        # shield() keeps the worker's future alive when the wait is cancelled
+        return await asyncio.wait_for(
+            asyncio.shield(future),
+            run_deadline - now if run_deadline is not None else None,
+        )
+
+    def stats(self) -> Dict[str, Dict]:
+        return {name: gate.stats() for name, gate in self.gates.items()}
+
+
+def load_admission_controller(backends: Optional[Dict] = None) -> AdmissionController:
+    """
+    Build the admission controller from the environment
+
+    Args:
+        backends: Registered backends by name; backends that are not
+            thread-safe get a limit of 1
+    """
+    default_limit = int(
+        os.environ.get("OCR_MODEL_CONCURRENCY")
+        or os.environ.get("OCR_CONCURRENCY")
+        or 1
+    )
+    limits = {}
+    for name, backend in (backends or {}).items():
+        if not backend.thread_safe:
+            limits[name] = 1
+    if os.environ.get("OCR_MODEL_LIMITS"):
+        limits.update(
+            {name: int(limit) for name, limit in json.loads(os.environ["OCR_MODEL_LIMITS"]).items()}
+        )
+    return AdmissionController(
+        limits,
+        default_limit=default_limit,
+        max_queue=int(os.environ.get("OCR_MAX_QUEUE", "8")),
+        queue_timeout=float(os.environ.get("OCR_QUEUE_TIMEOUT", "10")),
+    )
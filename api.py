@@ -5,18 +5,60 @@ Provides REST API endpoints for OCR processing using multiple models
 
 import os
 import sys
+import json
+import asyncio
+import hmac
+import re
 import tempfile
+import uuid
+from functools import partial
 from pathlib import Path
-from typing import List, Optional
+from typing import Callable, List, Optional
 from datetime import datetime
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Query
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Header, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
+# Split the CPU between the OCR libraries before they create their thread pools
+# (OCR_CPU_THREADS / OCR_CONCURRENCY, see thread_budget.py). The budget is
+# divided again at startup between every model's admission slots
+from thread_budget import configure_thread_budget, get_thread_settings
+
+configure_thread_budget()
+
 # Import the OCR tester
 from test_ocr_models import OCRTester
+from serialization import dumps, negotiate_response
+from result_normalization import export_response
+from upload_handling import (
+    RequestSizeLimitMiddleware,
+    check_image_dimensions,
+    max_upload_bytes,
+    save_upload,
+    sniff_image_type,
+)
+from archive_ingest import (
+    ZIP_SPOOL_MEMORY_BYTES,
+    ChunkReader,
+    archive_concurrency,
+    iter_archive_images,
+    max_archive_bytes,
+    max_archive_images,
+)
+from admission import AdmissionController, load_admission_controller
+from fusion import fuse_results
+from results_store import content_hash, file_hash
+from profiling import RequestProfiler
+from single_flight import SingleFlight, load_single_flight
+from memory_budget import (
+    AllocationTracker,
+    MemoryBudget,
+    load_allocation_tracker,
+    load_memory_budget,
+    process_rss_mb,
+)
 
 # Fix Windows console encoding for Unicode characters
 if sys.platform == "win32":
@@ -49,10 +91,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Maximum number of files per /ocr/batch request
+MAX_BATCH_FILES = 10
+
+
+def request_body_limit(path: str) -> int:
+    """Maximum POST body size in bytes for a request path"""
+    if path.endswith("/archive"):
+        return max_archive_bytes()
+    max_files = MAX_BATCH_FILES if path.endswith("/batch") else 1
+    # Allow some room for the multipart framing
+    return max_files * max_upload_bytes() + 64 * 1024
+
+
+# Rejects oversized uploads from Content-Length, and while the body is
+# received when there is none
+app.add_middleware(RequestSizeLimitMiddleware, limit_for=request_body_limit)
+
+
 # Global OCR tester instance
 ocr_tester: Optional[OCRTester] = None
 # Store initialization errors
 initialization_errors: dict = {}
+# Per-model concurrency limits and wait queues (see admission.py)
+admission: Optional[AdmissionController] = None
+# Warm-up state: status is "pending", "running", "done", "failed" or "disabled"
+warmup_state: dict = {"status": "pending", "models": {}, "duration_ms": None}
+# Per-request profiling settings, None when profiling is disabled
+profiling_config: Optional[dict] = None
+# Process memory budget and per-request allocation tracking (see
+# memory_budget.py), None when disabled
+memory_budget: Optional[MemoryBudget] = None
+allocation_tracker: Optional[AllocationTracker] = None
+# Coalescing of identical in-flight requests, None when disabled
+single_flight: Optional[SingleFlight] = None
 
 
 class ModelStatus(BaseModel):
@@ -62,6 +134,15 @@ class ModelStatus(BaseModel):
     available: bool
     initialized: bool
     error: Optional[str] = None
+    threads: Optional[dict] = None
+    capabilities: Optional[dict] = None
+    memory_estimate_mb: Optional[float] = None
+    resident_memory_mb: Optional[float] = None
+    resident_memory_breakdown_mb: Optional[dict] = None
+    import_time_ms: Optional[float] = None
+    load_time_ms: Optional[float] = None
+    languages: Optional[List[str]] = None
+    health: Optional[dict] = None
 
 
 class OCRResponse(BaseModel):
@@ -69,19 +150,276 @@ class OCRResponse(BaseModel):
 
     success: bool
     image_name: str
+    image_id: Optional[str] = None
     timestamp: str
     models: dict
     processing_time_ms: Optional[float] = None
+    queue_wait_ms: Optional[float] = None
+    timed_out_models: Optional[List[str]] = None
+    ensemble: Optional[dict] = None
+    profile: Optional[dict] = None
+    memory: Optional[dict] = None
+    coalesced: Optional[bool] = None
     error: Optional[str] = None
 
 
+def load_input_limits() -> dict:
+    """
+    Read input downscaling limits from the environment
+
+    - OCR_MAX_SIDE / OCR_MAX_PIXELS: default limits for all models
+    - OCR_INPUT_LIMITS: JSON object with per-model overrides,
+      e.g. {"EasyOCR": {"max_side": 1600}, "TrOCR": {"max_pixels": 1000000}}
+    """
+    limits = {}
+    default_limits = {}
+    if os.environ.get("OCR_MAX_SIDE"):
+        default_limits["max_side"] = int(os.environ["OCR_MAX_SIDE"])
+    if os.environ.get("OCR_MAX_PIXELS"):
+        default_limits["max_pixels"] = int(os.environ["OCR_MAX_PIXELS"])
+    if default_limits:
+        limits["default"] = default_limits
+    if os.environ.get("OCR_INPUT_LIMITS"):
+        limits.update(json.loads(os.environ["OCR_INPUT_LIMITS"]))
+    return limits
+
+
+def load_tiling_config() -> dict:
+    """
+    Read tiled processing settings from the environment
+
+    Tiling is enabled by OCR_TILE_MIN_SIDE (longest side in pixels from which
+    images are tiled). OCR_TILE_SIZE, OCR_TILE_OVERLAP and OCR_TILE_WORKERS
+    tune the tiles.
+    """
+    env_keys = {
+        "min_side": "OCR_TILE_MIN_SIDE",
+        "tile_size": "OCR_TILE_SIZE",
+        "overlap": "OCR_TILE_OVERLAP",
+        "max_workers": "OCR_TILE_WORKERS",
+    }
+    return {
+        key: int(os.environ[env_key])
+        for key, env_key in env_keys.items()
+        if os.environ.get(env_key)
+    }
+
+
+def load_trocr_options() -> dict:
+    """
+    Read TrOCR fast-inference options from the environment
+
+    - OCR_TROCR_FAST: comma-separated options (quantize, bf16, compile, onnx)
+    - OCR_TROCR_PARITY_IMAGES: comma-separated sample images for the parity
+      check (default: synthetic text lines)
+    - OCR_TROCR_DECODING: decoding profile (default, greedy, short, beam)
+    """
+    options = {
+        name.strip(): True
+        for name in os.environ.get("OCR_TROCR_FAST", "").split(",")
+        if name.strip()
+    }
+    if os.environ.get("OCR_TROCR_DECODING"):
+        options["decoding"] = os.environ["OCR_TROCR_DECODING"].strip()
+    if options and os.environ.get("OCR_TROCR_PARITY_IMAGES"):
+        options["parity_images"] = [
+            path.strip()
+            for path in os.environ["OCR_TROCR_PARITY_IMAGES"].split(",")
+            if path.strip()
+        ]
+    return options
+
+
+def load_timeouts() -> dict:
+    """
+    Read model timeouts (seconds) from the environment
+
+    - OCR_MODEL_TIMEOUT: default timeout per model (default: 60)
+    - OCR_MODEL_TIMEOUTS: JSON object with per-model overrides,
+      e.g. {"SwinTextSpotter": 120}
+    - OCR_REQUEST_TIMEOUT: timeout for all models of one request (default: 120)
+
+    A value of 0 disables the timeout.
+    """
+    timeouts = {
+        "default": float(os.environ.get("OCR_MODEL_TIMEOUT", "60")),
+        "request": float(os.environ.get("OCR_REQUEST_TIMEOUT", "120")),
+    }
+    if os.environ.get("OCR_MODEL_TIMEOUTS"):
+        timeouts.update(
+            {
+                name: float(timeout)
+                for name, timeout in json.loads(os.environ["OCR_MODEL_TIMEOUTS"]).items()
+            }
+        )
+    return {name: timeout for name, timeout in timeouts.items() if timeout > 0}
+
+
+def load_dedup_config() -> Optional[dict]:
+    """
+    Read near-duplicate result reuse settings from the environment
+
+    - OCR_DEDUP: set to 1 to enable reuse (default: disabled)
+    - OCR_DEDUP_MAX_DISTANCE: maximum perceptual hash distance, 0-64 (default: 4)
+    - OCR_DEDUP_CAPACITY: maximum number of remembered images (default: 10000)
+    - OCR_DEDUP_VERIFY: set to 0 to reuse perceptually similar images without
+      a content hash match (default: 1; unsafe for images that differ only in
+      small text such as prices)
+    """
+    if os.environ.get("OCR_DEDUP", "0").lower() not in ("1", "true", "yes"):
+        return None
+    return {
+        "max_distance": int(os.environ.get("OCR_DEDUP_MAX_DISTANCE", "4")),
+        "capacity": int(os.environ.get("OCR_DEDUP_CAPACITY", "10000")),
+        "verify_content": os.environ.get("OCR_DEDUP_VERIFY", "1").lower()
+        not in ("0", "false", "no"),
+    }
+
+
+def load_search_config() -> Optional[dict]:
+    """
+    Read search index settings from the environment
+
+    - OCR_SEARCH_INDEX: set to 0 to disable indexing and /search (default: enabled)
+    - OCR_SEARCH_NGRAM: character n-gram length for fuzzy search, 0 to
+      disable fuzzy search (default: 3)
+    - OCR_SEARCH_CAPACITY: maximum number of indexed images, the least
+      recently indexed are dropped first, 0 for no limit (default: 100000)
+    """
+    if os.environ.get("OCR_SEARCH_INDEX", "1").lower() in ("0", "false", "no"):
+        return None
+    capacity = int(os.environ.get("OCR_SEARCH_CAPACITY", "100000"))
+    return {
+        "ngram_size": int(os.environ.get("OCR_SEARCH_NGRAM", "3")),
+        "capacity": capacity or None,
+    }
+
+
+def load_results_db() -> Optional[str]:
+    """
+    Read the results store location from the environment
+
+    - OCR_RESULTS_STORE: set to 0 to keep no results history (default: enabled)
+    - OCR_RESULTS_DB: SQLite database file (default: ocr_results/results.db)
+    """
+    if os.environ.get("OCR_RESULTS_STORE", "1").lower() in ("0", "false", "no"):
+        return None
+    return os.environ.get("OCR_RESULTS_DB", "ocr_results/results.db")
+
+
+def load_profiling_config() -> Optional[dict]:
+    """
+    Read per-request profiling settings from the environment
+
+    - OCR_PROFILING: set to 1 to allow profiling requests (default: disabled)
+    - OCR_PROFILE_TOKEN: if set, profiling requests must send it in the
+      X-Profile-Token header
+    - OCR_PROFILE_DIR: directory for the collapsed-stack files
+      (default: ocr_results/profiles)
+    - OCR_PROFILE_INTERVAL_MS: sampling interval (default: 5)
+    """
+    if os.environ.get("OCR_PROFILING", "0").lower() not in ("1", "true", "yes"):
+        return None
+    return {
+        "token": os.environ.get("OCR_PROFILE_TOKEN") or None,
+        "dir": os.environ.get("OCR_PROFILE_DIR", "ocr_results/profiles"),
+        "interval": float(os.environ.get("OCR_PROFILE_INTERVAL_MS", "5")) / 1000,
+    }
+
+
+def check_profiling_access(token: Optional[str]):
+    """Raise 403 unless profiling is enabled and the token (if required) matches"""
+    if profiling_config is None:
+        raise HTTPException(
+            status_code=403, detail="Profiling is disabled (set OCR_PROFILING=1)"
+        )
+    expected = profiling_config["token"]
+    if expected and not hmac.compare_digest(token or "", expected):
+        raise HTTPException(status_code=403, detail="Invalid profiling token")
+
+
+def load_warmup_sizes() -> list:
+    """
+    Read the warm-up image sizes from the environment
+
+    OCR_WARMUP_SIZES is a comma-separated list of WxH sizes (default:
+    640x480,1280x960). OCR_WARMUP=0 disables the warm-up.
+    """
+    if os.environ.get("OCR_WARMUP", "1").lower() in ("0", "false", "no"):
+        return []
+    sizes = []
+    for size in os.environ.get("OCR_WARMUP_SIZES", "640x480,1280x960").split(","):
+        if size.strip():
+            width, height = size.lower().strip().split("x")
+            sizes.append((int(width), int(height)))
+    return sizes
+
+
+def run_warmup(sizes: list):
+    """Warm up all loaded models (runs in a worker thread after startup)"""
+    import time
+
+    warmup_state["status"] = "running"
+    start_time = time.time()
+    try:
+        warmup_state["models"] = ocr_tester.warm_up_models(sizes)
+        warmup_state["status"] = "done"
+        print("OCR models warmed up")
+    except Exception as e:
+        warmup_state["status"] = "failed"
+        warmup_state["error"] = str(e)
+        print(f"[ERROR] Warm-up failed: {e}")
+    warmup_state["duration_ms"] = round((time.time() - start_time) * 1000, 2)
+
+
+def is_ready() -> bool:
+    """Models are loaded and warm (or warm-up is disabled / failed)"""
+    return ocr_tester is not None and warmup_state["status"] in (
+        "done",
+        "failed",
+        "disabled",
+    )
+
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize OCR models on startup"""
-    global ocr_tester, initialization_errors
+    global ocr_tester, initialization_errors, admission, profiling_config
+    global memory_budget, allocation_tracker, single_flight
     print("Initializing OCR models...")
-    ocr_tester = OCRTester()
+    ocr_tester = OCRTester(
+        input_limits=load_input_limits(),
+        tiling=load_tiling_config(),
+        trocr_options=load_trocr_options(),
+        timeouts=load_timeouts(),
+        max_abandoned_calls=int(os.environ.get("OCR_MAX_ABANDONED_CALLS", "2")),
+        dedup=load_dedup_config(),
+        reader_pool_size=int(os.environ.get("OCR_READER_POOL_SIZE", "2")),
+        batch_size=int(os.environ.get("OCR_BATCH_SIZE", "8")),
+        search_index=load_search_config(),
+        results_db=load_results_db(),
+    )
+    # Every model has its own admission gate, so up to the sum of their
+    # limits can run at once; each of those slots gets its share of the CPU
+    admission = load_admission_controller(ocr_tester.backends)
+    budget_threads(
+        [name for name, backend in ocr_tester.backends.items() if not backend.library_error()]
+    )
     ocr_tester.initialize_models()
+    # Models that failed to load take no slots
+    budget_threads(
+        [
+            name
+            for name, backend in ocr_tester.backends.items()
+            if backend.loaded or (not backend.preloaded and not backend.library_error())
+        ]
+    )
+
+    # The search index lives in memory; refill it with the most recent
+    # images of the results store so /search survives restarts
+    if ocr_tester.text_index is not None and ocr_tester.results_store is not None:
+        indexed = ocr_tester.text_index.index_store(ocr_tester.results_store)
+        print(f"Search index rebuilt from the results store: {indexed} images")
 
     # Capture initialization errors from OCRTester
     initialization_errors = ocr_tester.init_errors.copy()
@@ -91,6 +429,46 @@ async def startup_event():
 
     print("OCR models initialized successfully!")
 
+    profiling_config = load_profiling_config()
+    memory_budget = load_memory_budget()
+    allocation_tracker = load_allocation_tracker()
+    single_flight = load_single_flight()
+
+    # Warm up in the background so /health answers during the warm-up;
+    # /ready reports 503 until it is finished
+    warmup_sizes = load_warmup_sizes()
+    if warmup_sizes:
+        asyncio.get_event_loop().run_in_executor(None, run_warmup, warmup_sizes)
+    else:
+        warmup_state["status"] = "disabled"
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Write buffered results to the results store"""
+    if ocr_tester is not None and ocr_tester.results_store is not None:
+        ocr_tester.results_store.close()
+
+
+def record_results(image_path: str, response: dict, image_hash: Optional[str] = None):
+    """Add an /ocr response to the search index and the results store"""
+    if ocr_tester.text_index is None and ocr_tester.results_store is None:
+        return
+    # The store keeps JSON; the index reads the same converted copy
+    response = export_response(response)
+    ocr_tester.index_results(
+        response["image_id"],
+        response["models"],
+        response["image_name"],
+        response.get("ensemble"),
+    )
+    if ocr_tester.results_store is not None:
+        ocr_tester.results_store.add(
+            dict(response, image_path=response["image_name"]),
+            image_id=response["image_id"],
+            image_hash=image_hash or file_hash(image_path),
+        )
+
 
 @app.get("/")
 async def root():
@@ -101,21 +479,83 @@ async def root():
         "status": "running",
         "endpoints": {
             "health": "/health",
+            "ready": "/ready",
             "models": "/models",
             "ocr": "/ocr",
+            "archive": "/ocr/archive",
+            "search": "/search",
+            "profiles": "/profiles/{profile_id}",
             "docs": "/docs",
         },
     }
 
 
+def budget_threads(model_names: List[str]):
+    """Divide the CPU thread budget between the admission slots of these models"""
+    slots = sum(admission.gate(name).limit for name in model_names)
+    settings = configure_thread_budget(concurrency=max(1, slots))
+    print(
+        f"CPU threads: {settings['total_threads']} total, {settings['concurrency']} "
+        f"inference slots, {settings['threads_per_slot']} per slot"
+        + (f" (overrides: {settings['overrides']})" if settings["overrides"] else "")
+    )
+
+
+def model_slots(model_name: str) -> Optional[int]:
+    """Concurrency limit of a model in the admission controller"""
+    return admission.gate(model_name).limit if admission is not None else None
+
+
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
+    """Health check endpoint (liveness, plus model and warm-up status)"""
+    rss_mb = process_rss_mb()
+    backends_health = (
+        {
+            name: backend.health(model_slots(name))
+            for name, backend in ocr_tester.backends.items()
+            if backend.loaded
+        }
+        if ocr_tester is not None
+        else {}
+    )
+    degraded = any(not health["healthy"] for health in backends_health.values())
     return {
-        "status": "healthy",
+        "status": "degraded" if degraded else "healthy",
         "timestamp": datetime.now().isoformat(),
         "models_initialized": ocr_tester is not None,
+        "warm": warmup_state["status"] == "done",
+        "ready": is_ready(),
+        "warmup": warmup_state,
+        "admission": admission.stats() if admission is not None else {},
+        "models": backends_health,
+        "dedup": ocr_tester.dedup_index.stats()
+        if ocr_tester is not None and ocr_tester.dedup_index is not None
+        else None,
+        "search_index": ocr_tester.text_index.stats()
+        if ocr_tester is not None and ocr_tester.text_index is not None
+        else None,
+        "results_store": ocr_tester.results_store.stats()
+        if ocr_tester is not None and ocr_tester.results_store is not None
+        else None,
+        "single_flight": single_flight.stats() if single_flight is not None else None,
+        "memory": {
+            "rss_mb": round(rss_mb, 1) if rss_mb is not None else None,
+            "budget": memory_budget.stats() if memory_budget is not None else None,
+            "tracemalloc": allocation_tracker is not None,
+        },
+    }
+
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness endpoint: 200 once models are loaded and warmed up, else 503"""
+    body = {
+        "ready": is_ready(),
+        "models_initialized": ocr_tester is not None,
+        "warmup_status": warmup_state["status"],
     }
+    return JSONResponse(content=body, status_code=200 if body["ready"] else 503)
 
 
 @app.get("/models", response_model=List[ModelStatus])
@@ -126,58 +566,44 @@ async def get_models_status():
 
     models_status = []
 
-    # Check EasyOCR
-    easyocr_initialized = ocr_tester.easyocr_reader is not None
-    models_status.append(
-        ModelStatus(
-            model="EasyOCR",
-            available=easyocr_initialized,
-            initialized=easyocr_initialized,
-            error=(
-                initialization_errors.get("EasyOCR")
-                if not easyocr_initialized
-                else None
-            ),
-        )
-    )
-
-    # Check PaddleOCR
-    paddleocr_initialized = ocr_tester.paddleocr_reader is not None
-    models_status.append(
-        ModelStatus(
-            model="PaddleOCR",
-            available=paddleocr_initialized,
-            initialized=paddleocr_initialized,
-            error=(
-                initialization_errors.get("PaddleOCR")
-                if not paddleocr_initialized
-                else None
-            ),
-        )
-    )
-
-    # Check TrOCR
-    trocr_initialized = (
-        ocr_tester.trocr_processor is not None and ocr_tester.trocr_model is not None
-    )
-    models_status.append(
-        ModelStatus(
-            model="TrOCR",
-            available=trocr_initialized,
-            initialized=trocr_initialized,
-            error=initialization_errors.get("TrOCR") if not trocr_initialized else None,
-        )
-    )
+    # Effective per-library thread settings, reported per model
+    thread_settings = get_thread_settings()
+    library_threads = {
+        "torch": thread_settings.get("torch"),
+        "paddle": {"cpu_threads": thread_settings.get("paddle")},
+        "opencv": thread_settings.get("opencv"),
+    }
+    # Thread variables set by the operator, which the budget leaves alone
+    env_overrides = thread_settings.get("overrides", {})
 
-    # Check SwinTextSpotter (always available but may fail at runtime)
-    models_status.append(
-        ModelStatus(
-            model="SwinTextSpotter",
-            available=True,  # Available but may fail at runtime
-            initialized=True,
-            error=None,
+    for name, backend in ocr_tester.backends.items():
+        initialized = backend.loaded
+        startup_timing = backend.startup_timing()
+        models_status.append(
+            ModelStatus(
+                model=name,
+                available=initialized,
+                initialized=initialized,
+                error=initialization_errors.get(name) if not initialized else None,
+                threads={
+                    **{
+                        library: library_threads.get(library)
+                        for library in backend.thread_libraries
+                    },
+                    "slots": thread_settings.get("concurrency"),
+                    "threads_per_slot": thread_settings.get("threads_per_slot"),
+                    "overrides": env_overrides,
+                },
+                capabilities=backend.capabilities(),
+                memory_estimate_mb=backend.memory_estimate_mb(),
+                resident_memory_mb=backend.resident_memory_mb(),
+                resident_memory_breakdown_mb=backend.memory_mb,
+                import_time_ms=startup_timing["import_ms"],
+                load_time_ms=startup_timing["load_ms"],
+                languages=backend.loaded_languages(),
+                health=backend.health(model_slots(name)) if initialized else None,
+            )
         )
-    )
 
     return models_status
 
@@ -189,15 +615,105 @@ async def process_ocr(
         None,
         description="Comma-separated list of models to use (EasyOCR, PaddleOCR, TrOCR, SwinTextSpotter). If not specified, all models will be used.",
     ),
+    timeout: Optional[float] = Query(
+        None,
+        gt=0,
+        description="Timeout in seconds for all models together (capped by the server's OCR_REQUEST_TIMEOUT). Models that do not finish in time are returned with timed_out: true.",
+    ),
+    reuse: bool = Query(
+        True,
+        description="Reuse earlier results for near-duplicate images (same photo recompressed or resized)",
+    ),
+    lang: Optional[str] = Query(
+        None,
+        description="Comma-separated language codes, e.g. 'en' or 'en,fa' (default: en,fa for EasyOCR, en for PaddleOCR). Readers for other languages are loaded on demand.",
+    ),
+    ensemble: bool = Query(
+        False,
+        description="Also return one merged result that fuses the regions of all models by confidence-weighted voting",
+    ),
+    profile: bool = Query(
+        False,
+        description="Profile this request and return the top functions (requires OCR_PROFILING=1 on the server)",
+    ),
+    accept: Optional[str] = Header(None),
+    x_profile_token: Optional[str] = Header(None),
 ):
     """
     Process an image with OCR models
 
     - **file**: Image file to process (jpg, png, etc.)
     - **models**: Optional comma-separated list of models to use (e.g., "EasyOCR,PaddleOCR")
+    - **timeout**: Optional request timeout in seconds
+    - **reuse**: Reuse results of near-duplicate images processed before
+    - **lang**: Optional comma-separated language codes (e.g., "en")
+    - **ensemble**: Add a fused result of all models
+    - **profile**: Profile the request (sampling profiler over the model work)
+
+    Returns OCR results from all specified models. Send
+    `Accept: application/msgpack` for the compact binary encoding.
+    """
+    profiler = None
+    if profile:
+        check_profiling_access(x_profile_token)
+        profiler = RequestProfiler(profiling_config["interval"])
+        profiler.start()
+    try:
+        response = await run_ocr(file, models, timeout, reuse, lang, ensemble, profiler)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+
+    if profiler is not None:
+        # Named after the image ID so the profile can be matched to the results;
+        # coalesced requests share the image ID but ran no model work of their own
+        profile_id = (
+            uuid.uuid4().hex
+            if response.get("coalesced")
+            else response.get("image_id") or uuid.uuid4().hex
+        )
+        profiler.save(os.path.join(profiling_config["dir"], f"{profile_id}.collapsed"))
+        response["profile"] = dict(profiler.summary(), id=profile_id)
 
-    Returns OCR results from all specified models.
+    # The result dict is generated internally and already matches OCRResponse,
+    # so it is serialized directly instead of being re-validated by pydantic
+    return negotiate_response(response, accept)
+
+
+def parse_models(models: Optional[str]) -> List[str]:
+    """Model names of the comma-separated models parameter (default: all models)"""
+    if not models:
+        return ocr_tester.run_order()
+    selected_models = [m.strip() for m in models.split(",")]
+    valid_models = ocr_tester.model_names()
+    invalid_models = [m for m in selected_models if m not in valid_models]
+    if invalid_models:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid model names: {', '.join(invalid_models)}. Valid models: {', '.join(valid_models)}",
+        )
+    return selected_models
+
+
+async def run_ocr(
+    file: UploadFile,
+    models: Optional[str] = None,
+    timeout: Optional[float] = None,
+    reuse: bool = True,
+    lang: Optional[str] = None,
+    ensemble: bool = False,
+    profiler: Optional[RequestProfiler] = None,
+    precomputed: Optional[dict] = None,
+) -> dict:
+    """
+    Run OCR on an uploaded file and return the OCRResponse fields as a dict
+
+    With a profiler, the worker threads running the models are sampled.
+    precomputed holds results of models already run on this image as part
+    of a batch (see run_batch_models).
     """
+    # Model work runs in worker threads; those are the ones to profile
+    tracked = profiler.wrap if profiler is not None else (lambda func: func)
     if ocr_tester is None:
         raise HTTPException(status_code=503, detail="OCR models not initialized")
 
@@ -210,84 +726,353 @@ async def process_ocr(
             detail=f"Unsupported file type. Allowed: {', '.join(allowed_extensions)}",
         )
 
-    # Save uploaded file to temporary location
+    selected_models = parse_models(models)
+
+    # Shed the request before reading the upload if a model queue is full or
+    # the process is over its memory budget
+    admission.check(selected_models)
+    if memory_budget is not None:
+        memory_budget.check(selected_models)
+
+    # Stream uploaded file to temporary location (size-capped, type sniffed
+    # from the magic bytes) and validate its dimensions from the header
     import time
 
     start_time = time.time()
 
+    # The request deadline covers queue waits and all models; each model is
+    # additionally bounded by its own timeout
+    request_timeout = ocr_tester.timeouts.get("request")
+    if timeout is not None:
+        request_timeout = min(timeout, request_timeout or timeout)
+    request_deadline = (
+        time.monotonic() + request_timeout if request_timeout is not None else None
+    )
+
+    tmp_file_path, _, _ = await save_upload(file)
+    # Cleared once process_upload() has taken over the file
+    owns_file = True
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as tmp_file:
-            content = await file.read()
-            tmp_file.write(content)
-            tmp_file_path = tmp_file.name
-
-        # Parse models parameter
-        selected_models = None
-        if models:
-            selected_models = [m.strip() for m in models.split(",")]
-            valid_models = {"EasyOCR", "PaddleOCR", "TrOCR", "SwinTextSpotter"}
-            invalid_models = [m for m in selected_models if m not in valid_models]
-            if invalid_models:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Invalid model names: {', '.join(invalid_models)}. Valid models: {', '.join(valid_models)}",
+        check_image_dimensions(tmp_file_path)
+        image_hash = None
+
+        def process():
+            nonlocal owns_file
+            owns_file = False
+            return process_upload(
+                tmp_file_path,
+                file.filename,
+                selected_models,
+                start_time,
+                request_deadline,
+                reuse,
+                lang,
+                ensemble,
+                tracked,
+                image_hash,
+                precomputed,
+            )
+
+        # Batched results are specific to this request, not shared
+        if single_flight is None or precomputed:
+            return await process()
+
+        # Concurrent requests for the same image content, models and options
+        # (retries, the same image uploaded by many users) share one run
+        image_hash = await asyncio.get_running_loop().run_in_executor(
+            None, file_hash, tmp_file_path
+        )
+        key = (image_hash, tuple(sorted(selected_models)), lang, reuse, ensemble, request_timeout)
+        response, shared = await single_flight.run(key, process)
+        # Every caller gets its own copy to add its profile to
+        response = dict(response)
+        if shared:
+            response["image_name"] = file.filename
+            response["coalesced"] = True
+        return response
+    finally:
+        if owns_file and os.path.exists(tmp_file_path):
+            os.unlink(tmp_file_path)
+
+
+async def process_upload(
+    image,
+    filename: str,
+    selected_models: List[str],
+    start_time: float,
+    request_deadline: Optional[float],
+    reuse: bool,
+    lang: Optional[str],
+    ensemble: bool,
+    tracked: Callable,
+    image_hash: Optional[str] = None,
+    precomputed: Optional[dict] = None,
+) -> dict:
+    """
+    Run the selected models on an image and return the response dict
+
+    Args:
+        image: Path of the saved upload, or encoded image bytes (archive
+            member)
+        precomputed: Results of models already run on this image as part of
+            a batch, by model name; these models are not run again
+
+    A saved upload is deleted when done, also when the request that started
+    it is no longer waiting for the result.
+    """
+    import time
+
+    allocations = allocation_tracker.start() if allocation_tracker is not None else None
+    try:
+        # Process with OCR. Each model runs in a worker thread once the
+        # admission controller grants it a slot, so the event loop stays free.
+        # Models that time out are reported as such next to the finished ones.
+        timestamp = datetime.now().isoformat()
+        model_results = {}
+        queue_wait_ms = 0.0
+        timed_out = []
+        tiled = ocr_tester.should_tile(image)
+
+        # Near-duplicates of earlier uploads reuse their results
+        hashes, reused = await asyncio.get_running_loop().run_in_executor(
+            None,
+            tracked(ocr_tester.find_reusable_results),
+            image,
+            selected_models,
+            lang,
+        )
+        if not reuse:
+            reused = {}
+
+        for model_name in selected_models:
+            if model_name in reused:
+                model_results[model_name] = dict(reused[model_name], queue_wait_ms=0.0)
+                continue
+            if precomputed and model_name in precomputed:
+                result = model_results[model_name] = precomputed[model_name]
+                if result.get("timed_out"):
+                    timed_out.append(model_name)
+                queue_wait_ms += result.get("queue_wait_ms", 0.0)
+                continue
+            backend = ocr_tester.get_backend(model_name)
+            if request_deadline is not None and time.monotonic() >= request_deadline:
+                model_results[model_name] = backend._timeout_error(
+                    f"{model_name} skipped, request timeout reached"
                 )
+                timed_out.append(model_name)
+                continue
 
-        # Process with OCR
-        if selected_models:
-            # Process only selected models
-            results = {
-                "image_path": file.filename,
-                "timestamp": datetime.now().isoformat(),
-                "models": {},
-            }
+            # Abandoned calls of a model that cannot stop early keep their
+            # slots; fail fast instead of queueing behind them
+            if not backend.healthy(model_slots(model_name)):
+                model_results[model_name] = dict(
+                    backend._unhealthy_error(), queue_wait_ms=0.0
+                )
+                continue
 
-            for model_name in selected_models:
-                if model_name == "EasyOCR":
-                    results["models"]["EasyOCR"] = ocr_tester.test_easyocr(
-                        tmp_file_path
-                    )
-                elif model_name == "PaddleOCR":
-                    results["models"]["PaddleOCR"] = ocr_tester.test_paddleocr(
-                        tmp_file_path
-                    )
-                elif model_name == "TrOCR":
-                    results["models"]["TrOCR"] = ocr_tester.test_trocr(tmp_file_path)
-                elif model_name == "SwinTextSpotter":
-                    results["models"]["SwinTextSpotter"] = (
-                        ocr_tester.test_swintextspotter(tmp_file_path)
-                    )
-        else:
-            # Process all models
-            results = ocr_tester.test_all_models(tmp_file_path)
+            timings = {"queue_wait_ms": 0.0}
+            model_start = time.perf_counter()
+            try:
+                result = await admission.run(
+                    model_name,
+                    tracked(partial(ocr_tester.run_model, lang=lang)),
+                    model_name,
+                    image,
+                    tiled,
+                    timeout=ocr_tester.model_timeout(model_name),
+                    deadline=request_deadline,
+                    timings=timings,
+                )
+            except asyncio.TimeoutError:
+                result = backend._timeout_error(f"{model_name} timed out")
+            if result.get("timed_out"):
+                timed_out.append(model_name)
+            result["queue_wait_ms"] = timings["queue_wait_ms"]
+            # Time from getting the slot until the result (or the timeout)
+            result["processing_time_ms"] = round(
+                (time.perf_counter() - model_start) * 1000 - timings["queue_wait_ms"], 2
+            )
+            queue_wait_ms += timings["queue_wait_ms"]
+            model_results[model_name] = result
 
-        processing_time = (time.time() - start_time) * 1000  # Convert to milliseconds
+        ocr_tester.remember_results(hashes, model_results, lang=lang)
 
-        # Clean up temporary file
-        os.unlink(tmp_file_path)
+        fused = fuse_results(model_results) if ensemble else None
+
+        processing_time = (time.time() - start_time) * 1000  # Convert to milliseconds
 
-        return OCRResponse(
-            success=True,
-            image_name=file.filename,
-            timestamp=results["timestamp"],
-            models=results["models"],
-            processing_time_ms=round(processing_time, 2),
+        response = {
+            "success": True,
+            "image_name": filename,
+            "image_id": uuid.uuid4().hex,
+            "timestamp": timestamp,
+            "models": model_results,
+            "processing_time_ms": round(processing_time, 2),
+            "queue_wait_ms": round(queue_wait_ms, 2),
+            "timed_out_models": timed_out,
+            "error": None,
+        }
+        if fused is not None:
+            response["ensemble"] = fused
+        if allocations is not None:
+            response["memory"] = allocation_tracker.stop(allocations)
+            allocations = None
+        await asyncio.get_running_loop().run_in_executor(
+            None, record_results, image, response, image_hash
         )
+        return response
 
     except HTTPException:
         raise
     except Exception as e:
-        # Clean up temporary file if it exists
-        if "tmp_file_path" in locals() and os.path.exists(tmp_file_path):
-            os.unlink(tmp_file_path)
+        return {
+            "success": False,
+            "image_name": filename,
+            "timestamp": datetime.now().isoformat(),
+            "models": {},
+            "processing_time_ms": None,
+            "error": str(e),
+        }
+    finally:
+        if allocations is not None:
+            allocation_tracker.stop(allocations)
+        # Clean up temporary file. Work abandoned after a timeout that still
+        # needs the file fails fast instead of running to completion
+        if isinstance(image, str) and os.path.exists(image):
+            os.unlink(image)
 
-        return OCRResponse(
-            success=False,
-            image_name=file.filename,
-            timestamp=datetime.now().isoformat(),
-            models={},
-            error=str(e),
-        )
+
+@app.get("/search")
+async def search_text(
+    q: str = Query(..., min_length=1, description="Words to search for; every word must match"),
+    fuzzy: bool = Query(
+        False,
+        description="Also match similar words (character n-grams), for OCR errors and Persian spelling variants",
+    ),
+    model: Optional[str] = Query(
+        None, description="Only match text recognized by this model (or Ensemble)"
+    ),
+    limit: int = Query(20, ge=1, le=200, description="Maximum number of images"),
+):
+    """
+    Search the text of processed images
+
+    - **q**: Words to search for
+    - **fuzzy**: Also match similar words
+    - **model**: Optional model name to search in
+    - **limit**: Maximum number of images returned
+
+    Returns the matching image IDs (as returned by /ocr), ranked by
+    relevance, with the matching text regions and their bboxes.
+    """
+    if ocr_tester is None:
+        raise HTTPException(status_code=503, detail="OCR models not initialized")
+    if ocr_tester.text_index is None:
+        raise HTTPException(status_code=404, detail="Search index is disabled (OCR_SEARCH_INDEX=0)")
+    return ocr_tester.text_index.search(q, fuzzy=fuzzy, model=model, limit=limit)
+
+
+PROFILE_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+@app.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_profile(profile_id: str, x_profile_token: Optional[str] = Header(None)):
+    """
+    Download the collapsed stacks of a profiled /ocr request
+
+    The profile ID is the image_id of the profiled response. The text is in
+    the collapsed-stack format of flamegraph.pl and speedscope.
+    """
+    check_profiling_access(x_profile_token)
+    path = Path(profiling_config["dir"]) / f"{profile_id}.collapsed"
+    if not PROFILE_ID_PATTERN.match(profile_id) or not path.exists():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(path.read_text(encoding="utf-8"))
+
+
+async def read_batch_images(files: List[UploadFile]) -> List[Optional[bytes]]:
+    """Content of each upload for run_batch_models (None if too large or not an image)"""
+    images = []
+    for file in files:
+        data = await file.read(max_upload_bytes() + 1)
+        await file.seek(0)
+        valid = len(data) <= max_upload_bytes() and sniff_image_type(data[:16]) is not None
+        images.append(data if valid else None)
+    return images
+
+
+async def run_batch_models(
+    images: List[Optional[bytes]], selected_models: List[str], lang: Optional[str]
+) -> dict:
+    """
+    Run the selected models that support batching once on several images
+
+    Each model holds one admission slot for the whole batch; its timeout is
+    the per-image timeout times the number of images. Images given as None
+    are left out; they and all images of a model that is unhealthy or has
+    no free slot get None and run on their own later.
+
+    Args:
+        images: Encoded image bytes, or None for images to leave out
+
+    Returns:
+        Dictionary mapping model name to one result (or None) per image
+    """
+    import time
+
+    model_names = [
+        model_name
+        for model_name in selected_models
+        if ocr_tester.get_backend(model_name).supports_batch
+    ]
+    indices = [index for index, data in enumerate(images) if data is not None]
+    if len(indices) < 2 or not model_names:
+        return {}
+    try:
+        admission.check(model_names)
+        if memory_budget is not None:
+            memory_budget.check(model_names)
+    except HTTPException:
+        # Reported per upload by run_ocr
+        return {}
+
+    batched = {}
+    for model_name in model_names:
+        backend = ocr_tester.get_backend(model_name)
+        if not backend.healthy(model_slots(model_name)):
+            continue
+
+        def run_batch(model_name, batch, deadline):
+            timeout = None
+            if deadline is not None:
+                timeout = max(0.0, deadline - time.monotonic()) / len(batch)
+            return ocr_tester.run_model_batch(model_name, batch, timeout=timeout, lang=lang)
+
+        model_timeout = ocr_tester.model_timeout(model_name)
+        timings = {"queue_wait_ms": 0.0}
+        try:
+            batch_results = await admission.run(
+                model_name,
+                run_batch,
+                model_name,
+                [images[index] for index in indices],
+                timeout=model_timeout * len(indices) if model_timeout is not None else None,
+                timings=timings,
+            )
+        except asyncio.TimeoutError:
+            batch_results = [
+                backend._timeout_error(f"{model_name} timed out") for _ in indices
+            ]
+        except HTTPException:
+            # Queue full or no slot in time: each image queues on its own
+            continue
+        model_results = [None] * len(images)
+        for index, result in zip(indices, batch_results):
+            result["queue_wait_ms"] = timings["queue_wait_ms"]
+            result["batch_size"] = len(indices)
+            model_results[index] = result
+        batched[model_name] = model_results
+    return batched
 
 
 @app.post("/ocr/batch")
@@ -296,28 +1081,48 @@ async def process_ocr_batch(
     models: Optional[str] = Query(
         None, description="Comma-separated list of models to use"
     ),
+    lang: Optional[str] = Query(
+        None, description="Comma-separated language codes, e.g. 'en'"
+    ),
+    accept: Optional[str] = Header(None),
 ):
     """
     Process multiple images with OCR models
 
     - **files**: List of image files to process
     - **models**: Optional comma-separated list of models to use
+    - **lang**: Optional comma-separated language codes
 
-    Returns OCR results for all images.
+    Returns OCR results for all images (JSON, or MessagePack with
+    `Accept: application/msgpack`).
     """
     if ocr_tester is None:
         raise HTTPException(status_code=503, detail="OCR models not initialized")
 
-    if len(files) > 10:  # Limit batch size
-        raise HTTPException(status_code=400, detail="Maximum 10 files per batch")
+    if len(files) > MAX_BATCH_FILES:  # Limit batch size
+        raise HTTPException(
+            status_code=400, detail=f"Maximum {MAX_BATCH_FILES} files per batch"
+        )
+
+    # Models that support batching (TrOCR) run once on all images
+    selected_models = parse_models(models)
+    batched = {}
+    if len(files) > 1 and any(
+        ocr_tester.get_backend(model_name).supports_batch for model_name in selected_models
+    ):
+        batched = await run_batch_models(await read_batch_images(files), selected_models, lang)
 
     results = []
 
-    for file in files:
+    for index, file in enumerate(files):
+        precomputed = {
+            model_name: model_results[index]
+            for model_name, model_results in batched.items()
+            if model_results[index] is not None
+        }
         try:
             # Reuse the single OCR endpoint logic
-            result = await process_ocr(file, models)
-            results.append(result.dict())
+            results.append(await run_ocr(file, models, lang=lang, precomputed=precomputed))
         except Exception as e:
             results.append(
                 {
@@ -329,7 +1134,236 @@ async def process_ocr_batch(
                 }
             )
 
-    return {"success": True, "total_images": len(files), "results": results}
+    return negotiate_response(
+        {"success": True, "total_images": len(files), "results": results}, accept
+    )
+
+
+@app.post("/ocr/archive")
+async def process_ocr_archive(
+    request: Request,
+    models: Optional[str] = Query(
+        None, description="Comma-separated list of models to use"
+    ),
+    lang: Optional[str] = Query(
+        None, description="Comma-separated language codes, e.g. 'en'"
+    ),
+    timeout: Optional[float] = Query(
+        None,
+        gt=0,
+        description="Timeout in seconds for all models on one image (capped by the server's OCR_REQUEST_TIMEOUT)",
+    ),
+    reuse: bool = Query(
+        True, description="Reuse earlier results for near-duplicate images"
+    ),
+    ensemble: bool = Query(
+        False, description="Also return a fused result of all models per image"
+    ),
+):
+    """
+    Process every image in a tar (.tar, .tar.gz, .tar.bz2, .tar.xz) or zip archive
+
+    The archive is sent as the raw request body, not as multipart form data.
+    Members are decompressed one at a time and processed from memory, nothing
+    is extracted to disk. Results are streamed back as newline-delimited
+    JSON: one /ocr response per image (with its "index" in the archive) in
+    the order they finish, then a {"summary": ...} line.
+
+    On servers implementing ASGI 2.4 results stream while the body is still
+    arriving. Older servers watch the receive channel for disconnects while
+    a response streams, so there the body is buffered first (memory up to
+    ZIP_SPOOL_MEMORY_BYTES, then a temporary file). At most
+    archive_concurrency() finished results wait for the client; a client
+    that reads slowly holds up processing (and the upload) instead of
+    results piling up in memory.
+    """
+    import time
+
+    if ocr_tester is None:
+        raise HTTPException(status_code=503, detail="OCR models not initialized")
+    selected_models = parse_models(models)
+    admission.check(selected_models)
+    if memory_budget is not None:
+        memory_budget.check(selected_models)
+
+    # The request timeout applies to each image
+    request_timeout = ocr_tester.timeouts.get("request")
+    if timeout is not None:
+        request_timeout = min(timeout, request_timeout or timeout)
+
+    loop = asyncio.get_running_loop()
+    start_time = time.time()
+    body = request.stream().__aiter__()
+    concurrency = archive_concurrency()
+    results: asyncio.Queue = asyncio.Queue(maxsize=concurrency)
+    summary = {"images": 0, "succeeded": 0, "failed": 0, "error": None}
+
+    spec_version = request.scope.get("asgi", {}).get("spec_version", "2.0")
+    spool = None
+    if tuple(map(int, spec_version.split("."))) >= (2, 4):
+
+        def next_chunk() -> bytes:
+            """Next piece of the request body for the decompressing thread"""
+            try:
+                return asyncio.run_coroutine_threadsafe(body.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return b""
+
+        source = ChunkReader(next_chunk, max_archive_bytes())
+    else:
+        spool = source = tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_MEMORY_BYTES)
+        size = 0
+        try:
+            async for chunk in body:
+                size += len(chunk)
+                if size > max_archive_bytes():
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Archive is larger than the limit of {max_archive_bytes()} bytes",
+                    )
+                await loop.run_in_executor(None, spool.write, chunk)
+            spool.seek(0)
+        except BaseException:
+            spool.close()
+            raise
+
+    members = iter_archive_images(
+        source,
+        max_member_bytes=max_upload_bytes(),
+        max_images=max_archive_images(),
+    )
+    try:
+        # Reading the first member tells whether the body is an archive at all
+        first_member = await loop.run_in_executor(None, next, members, None)
+    except ValueError as e:
+        if spool is not None:
+            spool.close()
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def failed_member(member: dict, error: str, status_code: int) -> dict:
+        return {
+            "success": False,
+            "image_name": member["name"],
+            "timestamp": datetime.now().isoformat(),
+            "models": {},
+            "error": error,
+            "status_code": status_code,
+        }
+
+    async def process_member(member: dict, precomputed: dict):
+        try:
+            if "error" in member:
+                raise HTTPException(status_code=413, detail=member["error"])
+            if memory_budget is not None:
+                memory_budget.check(selected_models)
+            data = member["data"]
+            if sniff_image_type(data[:16]) is None:
+                raise HTTPException(
+                    status_code=415,
+                    detail="File content is not a supported image (JPEG, PNG, BMP, TIFF, WebP)",
+                )
+            check_image_dimensions(data)
+            image_hash = await loop.run_in_executor(None, content_hash, data)
+            response = await process_upload(
+                data,
+                member["name"],
+                selected_models,
+                time.time(),
+                time.monotonic() + request_timeout if request_timeout is not None else None,
+                reuse,
+                lang,
+                ensemble,
+                lambda func: func,
+                image_hash,
+                precomputed,
+            )
+        # Reported per image, the other images of the archive still run
+        except HTTPException as e:
+            response = failed_member(member, e.detail, e.status_code)
+        except Exception as e:
+            response = failed_member(member, str(e), 500)
+        response["index"] = member["index"]
+        summary["images"] += 1
+        summary["succeeded" if response["success"] else "failed"] += 1
+        # Waits while the client is behind
+        await results.put(response)
+
+    async def dispatch():
+        """Decompress members in a worker thread and process a few at a time"""
+        running = set()
+        member = first_member
+        group_size = 1
+        if any(ocr_tester.get_backend(name).supports_batch for name in selected_models):
+            group_size = ocr_tester.batch_size
+        try:
+            while member is not None:
+                # Members are taken in groups so models that support batching
+                # (TrOCR) run once per group. The next members are
+                # decompressed while earlier ones are processed.
+                group = []
+                while member is not None and len(group) < group_size:
+                    group.append(member)
+                    member = await loop.run_in_executor(None, next, members, None)
+                batched = await run_batch_models(
+                    [
+                        group_member.get("data")
+                        if sniff_image_type(group_member.get("data", b"")[:16]) is not None
+                        else None
+                        for group_member in group
+                    ],
+                    selected_models,
+                    lang,
+                )
+                for index, group_member in enumerate(group):
+                    while len(running) >= concurrency:
+                        _, running = await asyncio.wait(
+                            running, return_when=asyncio.FIRST_COMPLETED
+                        )
+                    precomputed = {
+                        model_name: model_results[index]
+                        for model_name, model_results in batched.items()
+                        if model_results[index] is not None
+                    }
+                    running.add(asyncio.create_task(process_member(group_member, precomputed)))
+            if spool is None:
+                # Padding after the end of the archive
+                async for _ in body:
+                    pass
+            if running:
+                await asyncio.wait(running)
+        except HTTPException as e:
+            # The body grew past the limit after results started streaming
+            summary["error"] = e.detail
+            if running:
+                await asyncio.wait(running)
+        except Exception as e:
+            summary["error"] = str(e)
+            if running:
+                await asyncio.wait(running)
+        finally:
+            # Only left running when the client went away
+            for task in running:
+                task.cancel()
+            if spool is not None:
+                spool.close()
+        await results.put(None)
+
+    dispatcher = asyncio.create_task(dispatch())
+
+    async def stream():
+        try:
+            while True:
+                response = await results.get()
+                if response is None:
+                    break
+                yield dumps(export_response(response)) + b"\n"
+            summary["processing_time_ms"] = round((time.time() - start_time) * 1000, 2)
+            yield dumps({"summary": summary}) + b"\n"
+        finally:
+            # Stops decompressing and processing if the client disconnected
+            dispatcher.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 
 if __name__ == "__main__":
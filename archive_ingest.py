@@ -0,0 +1,196 @@
+"""
+Archive ingestion
+Reads the images of a tar (plain, .gz, .bz2, .xz) or zip archive one member
+at a time, decompressing as the archive is read, so bulk drops of thousands
+of images are processed from one upload or file without extracting them to
+disk first. Members are returned as encoded image bytes, which the OCR
+pipeline accepts in place of a path.
+
+tar archives are read strictly sequentially and can come from a
+non-seekable stream (an HTTP request body). The zip directory is stored at
+the end of the file, so a zip stream is spooled first (in memory up to
+ZIP_SPOOL_MEMORY_BYTES, then in one temporary file) and its members are
+decompressed from there.
+
+Limits are read from the environment:
+    OCR_MAX_ARCHIVE_MB: Maximum archive size in MB (default: 2048)
+    OCR_MAX_ARCHIVE_IMAGES: Maximum number of images per archive (default: 10000)
+    OCR_ARCHIVE_CONCURRENCY: Images of one archive processed at the same time
+        by the API (default: 2)
+
+Usage:
+    with open("drop.tar.gz", "rb") as f:
+        for member in iter_archive_images(f):
+            results = tester.test_all_models(member["data"], name=member["name"])
+"""
+
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from pathlib import PurePosixPath
+from typing import Callable, Dict, Iterator, Optional
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
+ZIP_SIGNATURE = b"PK\x03\x04"
+ZIP_SPOOL_MEMORY_BYTES = 64 * 1024 * 1024
+
+
+def max_archive_bytes() -> int:
+    """Maximum archive size in bytes"""
+    return int(float(os.environ.get("OCR_MAX_ARCHIVE_MB", "2048")) * 1024 * 1024)
+
+
+def max_archive_images() -> int:
+    """Maximum number of images per archive"""
+    return int(os.environ.get("OCR_MAX_ARCHIVE_IMAGES", "10000"))
+
+
+def archive_concurrency() -> int:
+    """Images of one archive request processed at the same time"""
+    return max(1, int(os.environ.get("OCR_ARCHIVE_CONCURRENCY", "2")))
+
+
+class ChunkReader(io.RawIOBase):
+    """
+    Readable binary stream over a function returning successive chunks
+
+    Args:
+        next_chunk: Returns the next chunk of the stream, b"" at the end
+        max_bytes: Stream size limit; reading past it raises ValueError
+    """
+
+    def __init__(self, next_chunk: Callable[[], bytes], max_bytes: Optional[int] = None):
+        self._next_chunk = next_chunk
+        self._buffer = b""
+        self._eof = False
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._buffer and not self._eof:
+            chunk = self._next_chunk()
+            if not chunk:
+                self._eof = True
+                break
+            self.bytes_read += len(chunk)
+            if self.max_bytes is not None and self.bytes_read > self.max_bytes:
+                raise ValueError(f"Archive is larger than the limit of {self.max_bytes} bytes")
+            self._buffer = chunk
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def is_image_member(name: str) -> bool:
+    """Whether an archive member looks like an image (by extension)"""
+    path = PurePosixPath(name)
+    # Resource forks and metadata added by macOS archivers
+    if path.name.startswith("._") or "__MACOSX" in path.parts:
+        return False
+    return path.suffix.lower() in IMAGE_EXTENSIONS
+
+
+def iter_archive_images(
+    fileobj,
+    max_member_bytes: Optional[int] = None,
+    max_images: Optional[int] = None,
+) -> Iterator[Dict]:
+    """
+    Yield the image members of a tar or zip archive in archive order
+
+    Only one member is held in memory at a time. Directories and files
+    without an image extension are skipped.
+
+    Args:
+        fileobj: Binary file object positioned at the start of the archive;
+            it does not need to be seekable
+        max_member_bytes: Members larger than this are reported with an
+            error instead of being read
+        max_images: Maximum number of image members
+
+    Yields:
+        Dictionary with "index" (position among the images), "name" (path in
+        the archive) and either "data" (encoded image bytes) or "error"
+
+    Raises:
+        ValueError: The data is not a tar or zip archive, or the archive
+            holds more than max_images images
+    """
+    if not hasattr(fileobj, "peek"):
+        fileobj = io.BufferedReader(fileobj)
+    if fileobj.peek(len(ZIP_SIGNATURE))[: len(ZIP_SIGNATURE)] == ZIP_SIGNATURE:
+        members = _iter_zip(fileobj, max_member_bytes)
+    else:
+        members = _iter_tar(fileobj, max_member_bytes)
+
+    for index, member in enumerate(members):
+        if max_images is not None and index >= max_images:
+            raise ValueError(f"Archive holds more than {max_images} images")
+        member["index"] = index
+        yield member
+
+
+def _too_large(name: str, size: int, max_member_bytes: int) -> Dict:
+    return {
+        "name": name,
+        "error": f"Image is larger than the limit of {max_member_bytes} bytes ({size} bytes)",
+    }
+
+
+def _iter_tar(fileobj, max_member_bytes: Optional[int]) -> Iterator[Dict]:
+    try:
+        # "r|*": sequential stream, compression detected from the data
+        archive = tarfile.open(fileobj=fileobj, mode="r|*")
+    except tarfile.TarError as e:
+        raise ValueError(f"Not a tar or zip archive: {e}")
+    with archive:
+        for member in archive:
+            if not member.isfile() or not is_image_member(member.name):
+                continue
+            if max_member_bytes is not None and member.size > max_member_bytes:
+                yield _too_large(member.name, member.size, max_member_bytes)
+                continue
+            yield {"name": member.name, "data": archive.extractfile(member).read()}
+
+
+def _iter_zip(fileobj, max_member_bytes: Optional[int]) -> Iterator[Dict]:
+    spool = None
+    if not fileobj.seekable():
+        spool = tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_MEMORY_BYTES)
+        shutil.copyfileobj(fileobj, spool)
+        spool.seek(0)
+        fileobj = spool
+
+    try:
+        try:
+            archive = zipfile.ZipFile(fileobj)
+        except zipfile.BadZipFile as e:
+            raise ValueError(f"Not a tar or zip archive: {e}")
+        with archive:
+            yield from _iter_zip_members(archive, max_member_bytes)
+    finally:
+        if spool is not None:
+            spool.close()
+
+
+def _iter_zip_members(archive: zipfile.ZipFile, max_member_bytes: Optional[int]) -> Iterator[Dict]:
+    for info in archive.infolist():
+        if info.is_dir() or not is_image_member(info.filename):
+            continue
+        if max_member_bytes is not None and info.file_size > max_member_bytes:
+            yield _too_large(info.filename, info.file_size, max_member_bytes)
+            continue
+        with archive.open(info) as member:
+            # The declared size is not trusted for the limit
+            data = member.read(max_member_bytes + 1 if max_member_bytes is not None else -1)
+        if max_member_bytes is not None and len(data) > max_member_bytes:
+            yield _too_large(info.filename, len(data), max_member_bytes)
+            continue
+        yield {"name": info.filename, "data": data}
@@ -3,22 +3,31 @@ Compare and visualize OCR results from different models
 """
 
 import json
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
 from pathlib import Path
-import cv2
 import numpy as np
 from typing import Dict, List
 
+from results_store import ResultsStore
 
-def load_results(results_file: str = "ocr_results/all_results.json") -> List[Dict]:
-    """Load OCR results from JSON file"""
+
+def load_results(results_file: str = "ocr_results/results.db") -> List[Dict]:
+    """Load OCR results from the SQLite results store or a JSON file"""
+    if Path(results_file).suffix == '.db':
+        store = ResultsStore(results_file)
+        try:
+            return store.load_results()
+        finally:
+            store.close()
     with open(results_file, 'r', encoding='utf-8') as f:
         return json.load(f)
 
 
 def visualize_results(image_path: str, results: Dict, output_path: str = None):
     """Visualize OCR results on the image"""
+    # Plotting libraries are only needed here, import them on first use
+    import cv2
+    import matplotlib.pyplot as plt
+
     img = cv2.imread(image_path)
     if img is None:
         print(f"Could not load image: {image_path}")
@@ -181,15 +190,35 @@ def generate_summary_report(results: List[Dict], output_file: str = "ocr_results
 
 def main():
     """Main function to compare results"""
-    results_file = Path("ocr_results/all_results.json")
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare OCR results of all models")
+    parser.add_argument(
+        "--parquet",
+        type=str,
+        default=None,
+        help="Also export the results as partitioned Parquet to this directory (requires pyarrow)",
+    )
+    args = parser.parse_args()
+
+    # Results store written by test_ocr_models.py, or the JSON file of --json runs
+    results_file = Path("ocr_results/results.db")
+    if not results_file.exists():
+        results_file = Path("ocr_results/all_results.json")
     
     if not results_file.exists():
-        print(f"Results file not found: {results_file}")
+        print("Results not found: ocr_results/results.db or ocr_results/all_results.json")
         print("Please run test_ocr_models.py first to generate results.")
         return
     
     results = load_results(str(results_file))
     
+    if args.parquet:
+        from parquet_export import export_results
+
+        run_id = export_results(results, args.parquet)
+        print(f"Parquet export (run {run_id}) saved to {args.parquet}")
+    
     # Print comparison table
     print_comparison_table(results)
     
@@ -3,6 +3,7 @@ Example usage of the OCR testing framework
 """
 
 from test_ocr_models import OCRTester
+from fusion import fuse_results
 from pathlib import Path
 
 # Example 1: Test a single image
@@ -66,6 +67,14 @@ def example_model_comparison():
     print(f"EasyOCR unique: {len(easyocr_texts - paddleocr_texts)}")
     print(f"PaddleOCR unique: {len(paddleocr_texts - easyocr_texts)}")
 
+    # Fuse both models region by region (confidence-weighted text vote)
+    fused = fuse_results({"EasyOCR": easyocr_result, "PaddleOCR": paddleocr_result})
+    # Regions are kept as arrays: texts, scores, polygons, votes and sources
+    agreed = int((fused['votes'] == 2).sum())
+    print(f"\nFused regions: {fused['num_detections']} ({agreed} agreed by both models)")
+    for text, confidence, sources in list(zip(fused['texts'], fused['scores'], fused['sources']))[:5]:
+        print(f"  '{text}' (confidence: {confidence:.2f}, from: {', '.join(sources)})")
+
 
 # Example 4: Extract structured data (e.g., menu items)
 def example_extract_menu_items():
@@ -81,13 +90,13 @@ def example_extract_menu_items():
     if 'PaddleOCR' in result['models']:
         paddle_result = result['models']['PaddleOCR']
         if paddle_result.get('success'):
-            texts = paddle_result.get('texts', [])
+            scores = paddle_result['scores']
             
+            # One line per menu item, with its price in reading order
             print("Detected menu items:")
-            for i, text_item in enumerate(texts, 1):
-                text = text_item.get('text', '')
-                confidence = text_item.get('confidence', 0)
-                print(f"  {i}. {text} (confidence: {confidence:.2f})")
+            for i, line in enumerate(paddle_result.get('lines', []), 1):
+                confidence = float(scores[line['regions']].mean())
+                print(f"  {i}. {line['text']} (confidence: {confidence:.2f})")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,205 @@
+"""
+Ensemble fusion of OCR results
+Matches text regions across models and votes on their text, weighted by
+confidence, to produce one merged result.
+
+Candidate matches are found through a uniform grid over the region bounds,
+so each region is only compared with regions in the grid cells it covers
+instead of with every region of every other model.
+"""
+
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from layout import apply_layout
+from result_normalization import EMPTY_POLYGONS, EMPTY_SCORES, region_arrays, stack_polygons
+from tiling import polygon_bounds
+
+
+class GridIndex:
+    """Uniform grid spatial index over axis-aligned bounds"""
+
+    def __init__(self, cell_size: float):
+        self.cell_size = max(float(cell_size), 1.0)
+        self.cells: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+
+    def _cell_range(self, bounds) -> Tuple[range, range]:
+        x0, y0, x1, y1 = (np.asarray(bounds, dtype=np.float64) // self.cell_size).astype(int)
+        return range(x0, x1 + 1), range(y0, y1 + 1)
+
+    def insert(self, item_id: int, bounds):
+        columns, rows = self._cell_range(bounds)
+        for row in rows:
+            for column in columns:
+                self.cells[(column, row)].append(item_id)
+
+    def query(self, bounds) -> Set[int]:
+        """Ids of all items sharing at least one cell with the bounds"""
+        columns, rows = self._cell_range(bounds)
+        found = set()
+        for row in rows:
+            for column in columns:
+                found.update(self.cells.get((column, row), ()))
+        return found
+
+
+def _iou(bounds: np.ndarray, i: int, others: np.ndarray) -> np.ndarray:
+    """Intersection over union of box i with the boxes at the given indices"""
+    x0, y0, x1, y1 = bounds.T
+    inter_w = np.maximum(np.minimum(x1[i], x1[others]) - np.maximum(x0[i], x0[others]), 0)
+    inter_h = np.maximum(np.minimum(y1[i], y1[others]) - np.maximum(y0[i], y0[others]), 0)
+    inter = inter_w * inter_h
+    areas = (x1 - x0) * (y1 - y0)
+    union = np.maximum(areas[i] + areas[others] - inter, 1e-6)
+    return inter / union
+
+
+def _normalize_text(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+
+def fuse_results(
+    model_results: Dict[str, Dict],
+    weights: Optional[Dict[str, float]] = None,
+    iou_threshold: float = 0.3,
+    min_votes: int = 1,
+) -> Dict:
+    """
+    Merge the region results of several models into one result
+
+    Regions are clustered greedily: the most confident unassigned region seeds
+    a cluster and takes the best-overlapping unassigned region of every other
+    model. Each cluster's text is chosen by confidence-weighted vote (texts
+    compared case- and whitespace-insensitively), its bbox is the
+    confidence-weighted mean of the regions that voted for the winning text.
+
+    Models without region bboxes (TrOCR) and failed results are skipped.
+
+    Args:
+        model_results: Dictionary mapping model name to model result
+        weights: Optional per-model vote weights (default: 1.0)
+        iou_threshold: Minimum bounds IoU for two regions to match
+        min_votes: Minimum number of models that must agree on a region's
+            text for it to be kept
+
+    Returns:
+        Array-form result (model "Ensemble", see result_normalization.py)
+        with "votes" and "sources" per region and the list of fused models
+    """
+    weights = weights or {}
+
+    polygons_list, bounds_list, scores_list, texts, models = [], [], [], [], []
+    for model_name, result in model_results.items():
+        if not result.get("success") or not result.get("texts"):
+            continue
+        polygons, scores, model_texts = region_arrays(result)
+        # Regions without a bbox can't be matched spatially
+        valid = ~np.isnan(polygons).any(axis=(1, 2))
+        if not valid.any():
+            continue
+        # Point counts may differ between models, bounds are computed per model
+        polygons_list.extend(polygons[valid])
+        bounds_list.append(polygon_bounds(polygons[valid]))
+        scores_list.append(scores[valid])
+        texts.extend(text for text, ok in zip(model_texts, valid) if ok)
+        models.extend([model_name] * int(valid.sum()))
+
+    fused_models = sorted(set(models), key=list(model_results).index)
+    if not texts:
+        return {
+            "model": "Ensemble",
+            "success": True,
+            "polygons": EMPTY_POLYGONS.copy(),
+            "scores": EMPTY_SCORES.copy(),
+            "texts": [],
+            "votes": np.empty(0, dtype=np.int64),
+            "sources": [],
+            "full_text": "",
+            "num_detections": 0,
+            "models_used": fused_models,
+        }
+
+    bounds = np.concatenate(bounds_list)
+    scores = np.concatenate(scores_list)
+    model_weights = np.array([weights.get(model, 1.0) for model in models])
+    weighted_scores = scores * model_weights
+
+    # Cell size around the typical region height keeps candidate lists short
+    heights = bounds[:, 3] - bounds[:, 1]
+    grid = GridIndex(2 * float(np.median(heights)) if len(heights) else 32.0)
+    for index, box in enumerate(bounds):
+        grid.insert(index, box)
+
+    total_weight = sum(weights.get(model, 1.0) for model in fused_models)
+    assigned = np.zeros(len(texts), dtype=bool)
+    fused_polygons, fused_scores, fused_texts, fused_votes, fused_sources = [], [], [], [], []
+    for seed in np.argsort(-weighted_scores, kind="stable"):
+        if assigned[seed]:
+            continue
+        assigned[seed] = True
+        members = [seed]
+
+        candidates = np.array(
+            sorted(
+                index
+                for index in grid.query(bounds[seed])
+                if not assigned[index] and models[index] != models[seed]
+            ),
+            dtype=np.int64,
+        )
+        if candidates.size:
+            overlaps = _iou(bounds, seed, candidates)
+            # Best match per other model
+            best: Dict[str, Tuple[float, int]] = {}
+            for index, overlap in zip(candidates, overlaps):
+                if overlap >= iou_threshold and overlap > best.get(models[index], (0.0, -1))[0]:
+                    best[models[index]] = (overlap, index)
+            for _, index in best.values():
+                assigned[index] = True
+                members.append(index)
+
+        # Confidence-weighted text vote
+        votes: Dict[str, float] = defaultdict(float)
+        for index in members:
+            votes[_normalize_text(texts[index])] += weighted_scores[index]
+        winner = max(votes, key=votes.get)
+        voters = [index for index in members if _normalize_text(texts[index]) == winner]
+        if len(voters) < min_votes:
+            continue
+
+        # Display the most confident spelling of the winning text
+        best_voter = max(voters, key=lambda index: weighted_scores[index])
+        if len({len(polygons_list[index]) for index in voters}) == 1:
+            voter_weights = np.maximum(weighted_scores[voters], 1e-6)
+            bbox = np.average(
+                np.stack([polygons_list[index] for index in voters]),
+                axis=0,
+                weights=voter_weights,
+            )
+        else:
+            bbox = polygons_list[best_voter]
+
+        fused_polygons.append(bbox)
+        fused_texts.append(texts[best_voter])
+        # Share of the total vote weight behind the winning text
+        fused_scores.append(votes[winner] / total_weight)
+        fused_votes.append(len(voters))
+        fused_sources.append([models[index] for index in voters])
+
+    return apply_layout(
+        {
+            "model": "Ensemble",
+            "success": True,
+            # Point counts can differ between clusters, stack_polygons pads them
+            "polygons": stack_polygons(fused_polygons),
+            "scores": np.asarray(fused_scores, dtype=np.float64),
+            "texts": fused_texts,
+            "votes": np.asarray(fused_votes, dtype=np.int64),
+            "sources": fused_sources,
+            "full_text": " ".join(fused_texts),
+            "num_detections": len(fused_texts),
+            "models_used": fused_models,
+        }
+    )
@@ -0,0 +1,298 @@
+"""
+Near-duplicate image detection
+Computes perceptual hashes (dHash and pHash over a downscaled grayscale image)
+and keeps an index of previously processed images, so OCR results can be
+reused for images that are visually identical but byte-different (photographed
+twice, recompressed by a messaging app, resized).
+
+Lookups go through a BK-tree over the pHash (Hamming distance); candidates
+must also match on dHash and aspect ratio. A 64-bit perceptual hash cannot
+see small text changes (two menus that differ only in their prices hash the
+same, as do blank images of any color), so by default a candidate is only
+reused when its content hash (SHA-256 of the image bytes) matches as well.
+"""
+
+import copy
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from layout import apply_layout
+from preprocessing import open_image_source, rescale_polygons, rescale_texts
+from result_normalization import is_array_result
+from results_store import content_hash, file_hash
+
+HASH_SIZE = 8  # 8x8 bits = 64-bit hashes
+PHASH_IMAGE_SIZE = 32
+
+try:
+    HASH_RESAMPLE = Image.Resampling.LANCZOS
+except AttributeError:
+    HASH_RESAMPLE = Image.LANCZOS
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II matrix, so dct(x) = M @ x"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT = _dct_matrix(PHASH_IMAGE_SIZE)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def dhash(gray: Image.Image) -> int:
+    """Difference hash: sign of the horizontal gradient on a 9x8 thumbnail"""
+    pixels = np.asarray(
+        gray.resize((HASH_SIZE + 1, HASH_SIZE), HASH_RESAMPLE), dtype=np.int16
+    )
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def phash(gray: Image.Image) -> int:
+    """Perceptual hash: low-frequency DCT coefficients above their median"""
+    pixels = np.asarray(
+        gray.resize((PHASH_IMAGE_SIZE, PHASH_IMAGE_SIZE), HASH_RESAMPLE),
+        dtype=np.float64,
+    )
+    coefficients = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    # The DC term only reflects overall brightness
+    median = np.median(coefficients.ravel()[1:])
+    return _bits_to_int(coefficients > median)
+
+
+def compute_hashes(image_path: str) -> Dict:
+    """
+    Compute the perceptual hashes of an image
+
+    JPEGs are decoded at reduced resolution, only a small grayscale version
+    is needed.
+
+    Args:
+        image_path: Path to the image or encoded image bytes
+
+    Returns:
+        Dictionary with "phash", "dhash" (64-bit ints), "size" (width, height)
+        and "content" (SHA-256 of the image bytes)
+    """
+    with Image.open(open_image_source(image_path)) as img:
+        size = img.size
+        if img.format == "JPEG":
+            img.draft("L", (PHASH_IMAGE_SIZE * 2, PHASH_IMAGE_SIZE * 2))
+        gray = img.convert("L")
+    if isinstance(image_path, (bytes, bytearray, memoryview)):
+        content = content_hash(image_path)
+    else:
+        content = file_hash(image_path)
+    return {"phash": phash(gray), "dhash": dhash(gray), "size": size, "content": content}
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """BK-tree over integer hashes with Hamming distance"""
+
+    def __init__(self):
+        # Node: [hash, item ids, {distance: child node}]
+        self.root = None
+        self.size = 0
+
+    def add(self, value: int, item_id: int):
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item_id], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                node[1].append(item_id)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item_id], {}]
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, int]]:
+        """All (distance, item id) pairs within max_distance of value"""
+        matches = []
+        if self.root is None:
+            return matches
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= max_distance:
+                matches.extend((distance, item_id) for item_id in node[1])
+            # Triangle inequality: only children in this band can match
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return matches
+
+
+class NearDuplicateIndex:
+    """
+    Index of processed images and their OCR results, keyed by perceptual hash
+
+    Args:
+        max_distance: Maximum pHash Hamming distance (out of 64) of a reusable
+            match; dHash must be within twice this distance
+        max_aspect_diff: Maximum relative aspect ratio difference of a match
+        capacity: Maximum number of indexed images (oldest are dropped)
+        verify_content: Only reuse a match with the same content hash. When
+            False, perceptual similarity alone is enough, which also reuses
+            results across recompressed or resized copies but returns stale
+            text for images that differ only in small text.
+    """
+
+    def __init__(
+        self,
+        max_distance: int = 4,
+        max_aspect_diff: float = 0.02,
+        capacity: int = 10000,
+        verify_content: bool = True,
+    ):
+        self.max_distance = max_distance
+        self.max_aspect_diff = max_aspect_diff
+        self.capacity = capacity
+        self.verify_content = verify_content
+        self.entries: Dict[int, Dict] = {}
+        self.tree = BKTree()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _rebuild(self):
+        """Rebuild the tree without the dropped entries (BK-trees can't delete)"""
+        self.tree = BKTree()
+        for item_id, entry in self.entries.items():
+            self.tree.add(entry["hashes"]["phash"], item_id)
+
+    def find(self, hashes: Dict) -> Optional[Tuple[Dict, int]]:
+        """
+        Find the closest indexed near-duplicate
+
+        Returns:
+            (entry, pHash distance) or None
+        """
+        width, height = hashes["size"]
+        best = None
+        with self._lock:
+            for distance, item_id in self.tree.search(hashes["phash"], self.max_distance):
+                entry = self.entries.get(item_id)
+                if entry is None:
+                    continue
+                if self.verify_content and entry["hashes"].get("content") != hashes.get("content"):
+                    continue
+                if hamming_distance(hashes["dhash"], entry["hashes"]["dhash"]) > 2 * self.max_distance:
+                    continue
+                entry_width, entry_height = entry["hashes"]["size"]
+                aspect, entry_aspect = width / height, entry_width / entry_height
+                if abs(aspect - entry_aspect) > self.max_aspect_diff * entry_aspect:
+                    continue
+                if best is None or distance < best[1]:
+                    best = (entry, distance)
+        return best
+
+    def lookup(
+        self, hashes: Dict, model_names: Iterable[str]
+    ) -> Dict[str, Dict]:
+        """
+        Reusable results of a near-duplicate image
+
+        Bboxes are scaled to the size of the queried image. Each reused result
+        gets a "reused_from" entry with the pHash distance and whether the
+        content hash matched; the source image is not named, it may have
+        been uploaded by another client.
+
+        Returns:
+            Dictionary mapping model name to result, only for the requested
+            models the matching image has results for
+        """
+        match = self.find(hashes)
+        if match is None:
+            self.misses += 1
+            return {}
+        entry, distance = match
+        width, height = hashes["size"]
+        entry_width, entry_height = entry["hashes"]["size"]
+        scale = (width / float(entry_width), height / float(entry_height))
+
+        reused = {}
+        for model_name in model_names:
+            result = entry["results"].get(model_name)
+            if result is None:
+                continue
+            result = copy.deepcopy(result)
+            if is_array_result(result):
+                result["polygons"] = rescale_polygons(result["polygons"], scale)
+            else:
+                rescale_texts(result.get("texts", []), scale)
+            # Line and paragraph boxes follow the rescaled regions
+            apply_layout(result)
+            result["reused_from"] = {
+                "distance": distance,
+                "identical": entry["hashes"].get("content") == hashes.get("content"),
+            }
+            reused[model_name] = result
+        if reused:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return reused
+
+    def add(self, hashes: Dict, results: Dict[str, Dict]):
+        """
+        Index the results of an image
+
+        Only successful, complete results are stored. Results of an image
+        whose identical content is already indexed are merged into that entry.
+        """
+        results = {
+            model_name: copy.deepcopy(result)
+            for model_name, result in results.items()
+            if result.get("success")
+            and not result.get("timed_out")
+            and "reused_from" not in result
+        }
+        if not results:
+            return
+
+        match = self.find(hashes)
+        with self._lock:
+            if match is not None and match[0]["hashes"].get("content") == hashes.get("content"):
+                match[0]["results"].update(results)
+                return
+
+            item_id = self._next_id
+            self._next_id += 1
+            self.entries[item_id] = {"hashes": hashes, "results": results}
+            self.tree.add(hashes["phash"], item_id)
+
+            if len(self.entries) > self.capacity:
+                # Drop the oldest quarter at once to amortize the rebuild
+                for old_id in sorted(self.entries)[: max(1, self.capacity // 4)]:
+                    del self.entries[old_id]
+                self._rebuild()
+
+    def stats(self) -> Dict:
+        return {
+            "images": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "max_distance": self.max_distance,
+            "verify_content": self.verify_content,
+        }
@@ -0,0 +1,207 @@
+"""
+Reading-order reconstruction for OCR results
+Groups text regions into columns, lines and paragraphs with sort-and-sweep
+passes over the region bounds (O(n log n)), so full_text follows the page
+layout instead of the order the detector emitted regions in.
+
+Lines whose text is mostly in a right-to-left script (Persian, Arabic,
+Hebrew) are read right to left.
+"""
+
+import re
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from result_normalization import is_array_result, region_arrays, take_regions
+from tiling import polygon_bounds
+
+RTL_PATTERN = re.compile("[\u0590-\u08ff\ufb1d-\ufdff\ufe70-\ufeff]")
+LETTER_PATTERN = re.compile(r"[^\W\d_]")
+
+
+def is_rtl(text: str) -> bool:
+    """Whether most letters of the text are in a right-to-left script"""
+    letters = len(LETTER_PATTERN.findall(text))
+    return letters > 0 and len(RTL_PATTERN.findall(text)) * 2 > letters
+
+
+def find_columns(
+    bounds: np.ndarray, min_gap: float, min_width_ratio: float = 0.25
+) -> List[Tuple[float, float]]:
+    """
+    Find text columns separated by vertical gutters
+
+    Sweeps the regions' x-intervals sorted by left edge and splits wherever
+    no region covers a gap of at least min_gap. Columns narrower than
+    min_width_ratio of the text width (e.g. a price column next to item
+    names) are merged into their nearest neighbour, so they stay on the same
+    lines as the text they belong to.
+
+    Returns:
+        List of (x0, x1) column extents, left to right
+    """
+    order = np.argsort(bounds[:, 0], kind="stable")
+    columns = []
+    start, end = bounds[order[0], 0], bounds[order[0], 2]
+    for x0, x1 in bounds[order[1:]][:, [0, 2]]:
+        if x0 - end >= min_gap:
+            columns.append([start, end])
+            start, end = x0, x1
+        else:
+            end = max(end, x1)
+    columns.append([start, end])
+
+    text_width = columns[-1][1] - columns[0][0]
+    merged = True
+    while merged and len(columns) > 1:
+        merged = False
+        widths = [x1 - x0 for x0, x1 in columns]
+        narrowest = int(np.argmin(widths))
+        if widths[narrowest] >= min_width_ratio * text_width:
+            break
+        # Merge into the neighbour across the smaller gutter
+        left_gap = (
+            columns[narrowest][0] - columns[narrowest - 1][1] if narrowest > 0 else np.inf
+        )
+        right_gap = (
+            columns[narrowest + 1][0] - columns[narrowest][1]
+            if narrowest < len(columns) - 1
+            else np.inf
+        )
+        neighbour = narrowest - 1 if left_gap <= right_gap else narrowest + 1
+        low, high = sorted((narrowest, neighbour))
+        columns[low] = [columns[low][0], columns[high][1]]
+        del columns[high]
+        merged = True
+    return [(float(x0), float(x1)) for x0, x1 in columns]
+
+
+def group_lines(bounds: np.ndarray, indices: np.ndarray) -> List[List[int]]:
+    """
+    Group regions into lines
+
+    Regions are swept by vertical center; a region joins the current line
+    when its center lies within the line's vertical band, otherwise it starts
+    a new line.
+
+    Returns:
+        Lists of region indices per line, top to bottom (unordered within a line)
+    """
+    if len(indices) == 0:
+        return []
+    centers = (bounds[indices, 1] + bounds[indices, 3]) / 2
+    lines = []
+    band_sum = (0.0, 0.0)
+    for index in indices[np.argsort(centers, kind="stable")]:
+        y0, y1 = bounds[index, 1], bounds[index, 3]
+        center = (y0 + y1) / 2
+        # The line band is the mean extent of its regions, so it does not
+        # drift down a slightly skewed line
+        if lines and band_sum[0] / len(lines[-1]) <= center <= band_sum[1] / len(lines[-1]):
+            lines[-1].append(int(index))
+            band_sum = (band_sum[0] + y0, band_sum[1] + y1)
+        else:
+            lines.append([int(index)])
+            band_sum = (y0, y1)
+    return lines
+
+
+def reading_order(
+    polygons: np.ndarray,
+    texts: List[str],
+    direction: str = "auto",
+    column_gap: float = 2.5,
+    paragraph_gap: float = 0.8,
+) -> Dict:
+    """
+    Reconstruct columns, lines and paragraphs from text regions
+
+    Args:
+        polygons: (N, K, 2) region polygons
+        texts: N region texts
+        direction: "auto" (per line, from the script), "ltr" or "rtl"
+        column_gap: Minimum gutter width between columns, in median line heights
+        paragraph_gap: Vertical gap between lines that starts a new paragraph,
+            in median line heights
+
+    Returns:
+        Dictionary with "order" (region indices in reading order), "lines"
+        (text, bbox, region indices into the ordered regions, rtl flag) and
+        "paragraphs" (text, line indices)
+    """
+    if len(texts) == 0:
+        return {"order": [], "lines": [], "paragraphs": []}
+
+    bounds = polygon_bounds(polygons)
+    line_height = max(float(np.median(bounds[:, 3] - bounds[:, 1])), 1.0)
+    page_rtl = direction == "rtl" or (direction == "auto" and is_rtl(" ".join(texts)))
+
+    columns = find_columns(bounds, column_gap * line_height)
+    # Assign each region to the column containing its horizontal center
+    column_starts = np.array([x0 for x0, _ in columns])
+    centers_x = (bounds[:, 0] + bounds[:, 2]) / 2
+    column_of = np.clip(np.searchsorted(column_starts, centers_x, side="right") - 1, 0, None)
+    column_order = range(len(columns) - 1, -1, -1) if page_rtl else range(len(columns))
+
+    order, lines, paragraphs = [], [], []
+    for column in column_order:
+        previous_bottom = None
+        for line in group_lines(bounds, np.flatnonzero(column_of == column)):
+            line_text = " ".join(texts[index] for index in line)
+            rtl = direction == "rtl" or (direction == "auto" and is_rtl(line_text))
+            line = sorted(line, key=lambda index: -bounds[index, 2] if rtl else bounds[index, 0])
+
+            line_bounds = bounds[line]
+            top, bottom = float(line_bounds[:, 1].min()), float(line_bounds[:, 3].max())
+            if previous_bottom is None or top - previous_bottom > paragraph_gap * line_height:
+                paragraphs.append({"lines": []})
+            previous_bottom = bottom
+
+            paragraphs[-1]["lines"].append(len(lines))
+            lines.append(
+                {
+                    "text": " ".join(texts[index] for index in line),
+                    "bbox": [
+                        float(line_bounds[:, 0].min()),
+                        top,
+                        float(line_bounds[:, 2].max()),
+                        bottom,
+                    ],
+                    "regions": list(range(len(order), len(order) + len(line))),
+                    "rtl": rtl,
+                }
+            )
+            order.extend(line)
+
+    for paragraph in paragraphs:
+        paragraph["text"] = "\n".join(lines[index]["text"] for index in paragraph["lines"])
+    return {"order": order, "lines": lines, "paragraphs": paragraphs}
+
+
+def apply_layout(result: Dict, direction: str = "auto") -> Dict:
+    """
+    Reorder a model result's texts into reading order
+
+    Sets the regions to reading order, "full_text" to the lines joined by
+    newlines and adds "lines" and "paragraphs". Array-form results stay
+    arrays (see result_normalization.py). Results without region bboxes
+    (TrOCR) or failed results are returned unchanged.
+    """
+    texts = result.get("texts")
+    if not result.get("success") or not texts:
+        return result
+    polygons, _, strings = region_arrays(result)
+    if np.isnan(polygons).any():
+        return result
+
+    layout = reading_order(polygons, strings, direction=direction)
+    if is_array_result(result):
+        result.update(take_regions(result, layout["order"]))
+    else:
+        result["texts"] = [texts[index] for index in layout["order"]]
+    result["lines"] = layout["lines"]
+    result["paragraphs"] = layout["paragraphs"]
+    result["full_text"] = "\n".join(line["text"] for line in layout["lines"])
+    return result
+
@@ -0,0 +1,172 @@
+"""
+Memory accounting for the OCR service
+Measures the process resident set size (RSS), tracks the peak Python
+allocation of requests with tracemalloc, and refuses new requests for heavy
+models while the process is over its memory budget, so an overloaded server
+answers 503 instead of being OOM-killed.
+
+Settings are read from the environment:
+    OCR_MEMORY_BUDGET_MB: Process RSS above which heavy-model requests are
+        refused (default: 0, no budget)
+    OCR_HEAVY_MODELS: Comma-separated models refused over the budget
+        (default: all models)
+    OCR_TRACEMALLOC: Set to 1 to report the peak allocation of each request
+        (default: disabled; tracing slows down Python allocations)
+"""
+
+import os
+import sys
+import threading
+import tracemalloc
+from typing import Dict, Iterable, Optional, Set
+
+try:
+    import psutil
+
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+
+def process_rss_mb() -> Optional[float]:
+    """Resident set size of this process in MB (None if it can't be measured)"""
+    if PSUTIL_AVAILABLE:
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    if sys.platform.startswith("linux"):
+        # Second field of statm: resident pages
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    return None
+
+
+class MemoryBudget:
+    """
+    Refuses heavy-model requests while the process RSS exceeds the budget
+
+    Args:
+        budget_mb: RSS limit in MB
+        heavy_models: Models refused over the budget (None: all models)
+        retry_after: Retry-After seconds sent with the 503
+    """
+
+    def __init__(
+        self,
+        budget_mb: float,
+        heavy_models: Optional[Set[str]] = None,
+        retry_after: int = 5,
+    ):
+        self.budget_mb = budget_mb
+        self.heavy_models = heavy_models
+        self.retry_after = retry_after
+        self.refused = 0
+
+    def check(self, model_names: Iterable[str]):
+        """
+        Raises:
+            HTTPException: 503 with Retry-After if a requested model is heavy
+                and the process is over budget
+        """
+        heavy = [
+            name
+            for name in model_names
+            if self.heavy_models is None or name in self.heavy_models
+        ]
+        if not heavy:
+            return
+        rss_mb = process_rss_mb()
+        if rss_mb is None or rss_mb <= self.budget_mb:
+            return
+        # Imported here so the backends can use process_rss_mb without FastAPI
+        from fastapi import HTTPException
+
+        self.refused += 1
+        raise HTTPException(
+            status_code=503,
+            detail=(
+                f"Server memory {rss_mb:.0f} MB is over the budget of "
+                f"{self.budget_mb:.0f} MB, not accepting {', '.join(heavy)} requests"
+            ),
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+    def stats(self) -> Dict:
+        return {
+            "budget_mb": self.budget_mb,
+            "heavy_models": sorted(self.heavy_models) if self.heavy_models else "all",
+            "refused": self.refused,
+        }
+
+
+class AllocationTracker:
+    """
+    Peak traced Python allocation per request
+
+    tracemalloc has one process-wide peak, so it is only reset when no other
+    tracked request is running; requests that overlapped another one report
+    "overlapped": true and a peak that may include the other requests'
+    allocations. Memory allocated by native libraries (torch, paddle) outside
+    the Python allocator is not traced.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = 0
+        # Incremented whenever a request starts, to detect overlaps
+        self._generation = 0
+
+    def start(self) -> Dict:
+        """Begin tracking a request; pass the returned token to stop()"""
+        with self._lock:
+            if self._active == 0:
+                tracemalloc.reset_peak()
+            self._active += 1
+            self._generation += 1
+            current, _ = tracemalloc.get_traced_memory()
+            return {
+                "baseline": current,
+                "generation": self._generation,
+                "overlapped": self._active > 1,
+            }
+
+    def stop(self, token: Dict) -> Dict:
+        """
+        Returns:
+            Dictionary with peak_mb (peak traced allocation above the
+            request's baseline), retained_mb (still allocated at the end),
+            rss_mb and overlapped
+        """
+        with self._lock:
+            current, peak = tracemalloc.get_traced_memory()
+            overlapped = token["overlapped"] or self._generation != token["generation"]
+            self._active -= 1
+        rss_mb = process_rss_mb()
+        return {
+            "peak_mb": round(max(peak - token["baseline"], 0) / (1024 * 1024), 2),
+            "retained_mb": round((current - token["baseline"]) / (1024 * 1024), 2),
+            "rss_mb": round(rss_mb, 1) if rss_mb is not None else None,
+            "overlapped": overlapped,
+        }
+
+
+def load_memory_budget() -> Optional[MemoryBudget]:
+    """Build the memory budget from the environment (None without a budget)"""
+    budget_mb = float(os.environ.get("OCR_MEMORY_BUDGET_MB", "0"))
+    if budget_mb <= 0:
+        return None
+    heavy_models = None
+    if os.environ.get("OCR_HEAVY_MODELS"):
+        heavy_models = {
+            name.strip() for name in os.environ["OCR_HEAVY_MODELS"].split(",") if name.strip()
+        }
+    return MemoryBudget(budget_mb, heavy_models)
+
+
+def load_allocation_tracker() -> Optional[AllocationTracker]:
+    """Start tracemalloc and return a tracker if OCR_TRACEMALLOC is set"""
+    if os.environ.get("OCR_TRACEMALLOC", "0").lower() not in ("1", "true", "yes"):
+        return None
+    if not tracemalloc.is_tracing():
+        # One frame per trace keeps the tracing overhead low
+        tracemalloc.start(1)
+    return AllocationTracker()
@@ -0,0 +1,979 @@
+"""
+OCR backend registry
+Every OCR model is wrapped in an OCRBackend with the same interface (load,
+warm-up, predict, predict_batch, capability flags, memory estimate), so the
+API, caching, batching and concurrency layers work the same for all models.
+
+Add a new model by subclassing OCRBackend and decorating it with
+@register_backend.
+"""
+
+import importlib.util
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from layout import apply_layout
+from memory_budget import process_rss_mb
+from preprocessing import rescale_polygons
+from result_normalization import normalize_easyocr, normalize_paddleocr
+from thread_budget import apply_thread_settings, paddle_thread_kwargs
+
+# Heavy libraries (torch, easyocr, paddleocr, transformers) are only imported
+# when a backend is loaded. Availability is checked without importing them.
+def library_installed(module_name: str) -> bool:
+    """Check whether a library is installed without importing it"""
+    try:
+        return importlib.util.find_spec(module_name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+TORCH_AVAILABLE = library_installed("torch")
+if not TORCH_AVAILABLE:
+    print("Warning: PyTorch not available. Some features may not work.")
+
+EASYOCR_AVAILABLE = library_installed("easyocr")
+if not EASYOCR_AVAILABLE:
+    print("Warning: EasyOCR not available")
+
+PADDLEOCR_AVAILABLE = library_installed("paddleocr")
+if not PADDLEOCR_AVAILABLE:
+    print("Warning: PaddleOCR not available")
+
+TROCR_AVAILABLE = TORCH_AVAILABLE and library_installed("transformers")
+if not TROCR_AVAILABLE:
+    print("Warning: TrOCR not available")
+
+try:
+    # Try to import SwinTextSpotter integration
+    from swintextspotter_integration import setup_swintextspotter_path
+
+    SWINTEXTSPOTTER_AVAILABLE = setup_swintextspotter_path()
+except ImportError:
+    SWINTEXTSPOTTER_AVAILABLE = False
+    print("Warning: SwinTextSpotter requires separate setup (see README)")
+
+
+# Registered backend classes by model name, in registration order
+BACKEND_REGISTRY: Dict[str, type] = {}
+
+
+def register_backend(cls):
+    """Class decorator that registers an OCRBackend under its model name"""
+    BACKEND_REGISTRY[cls.name] = cls
+    return cls
+
+
+def parse_languages(lang) -> Optional[Tuple[str, ...]]:
+    """
+    Normalize a language selection ("en,fa", ["fa", "en"]) to a sorted tuple
+
+    Returns:
+        Tuple of language codes, or None for the default languages
+    """
+    if not lang:
+        return None
+    if isinstance(lang, str):
+        lang = lang.split(",")
+    languages = tuple(sorted({code.strip() for code in lang if code.strip()}))
+    return languages or None
+
+
+class ReaderPool:
+    """
+    Bounded LRU pool of recognizers keyed by language set
+
+    Readers are created on first use by the factory and the least recently
+    used one is dropped when the pool is full. Concurrent requests for the
+    same language set wait for a single load.
+    """
+
+    def __init__(self, factory: Callable, capacity: int = 2):
+        self.factory = factory
+        self.capacity = max(1, capacity)
+        self._readers: "OrderedDict[Tuple[str, ...], object]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[Tuple[str, ...], threading.Lock] = {}
+
+    def get(self, languages: Tuple[str, ...]):
+        with self._lock:
+            if languages in self._readers:
+                self._readers.move_to_end(languages)
+                return self._readers[languages]
+            load_lock = self._load_locks.setdefault(languages, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                if languages in self._readers:
+                    self._readers.move_to_end(languages)
+                    return self._readers[languages]
+            # Loading takes seconds, other language sets stay usable meanwhile
+            print(f"Loading reader for languages: {', '.join(languages)}")
+            reader = self.factory(languages)
+            with self._lock:
+                self._readers[languages] = reader
+                while len(self._readers) > self.capacity:
+                    evicted, _ = self._readers.popitem(last=False)
+                    print(f"Unloading reader for languages: {', '.join(evicted)}")
+            return reader
+
+    def languages(self) -> List[Tuple[str, ...]]:
+        with self._lock:
+            return list(self._readers)
+
+    def readers(self) -> List:
+        with self._lock:
+            return list(self._readers.values())
+
+    def clear(self):
+        with self._lock:
+            self._readers.clear()
+
+
+# A call with a deadline counts as abandoned once it is still running this
+# long after the deadline. Backends that check the deadline (tiles, TrOCR
+# generation) stop well within it; the others run until the model returns.
+ABANDON_GRACE_S = 5.0
+
+
+def torch_module_size_mb(*modules) -> float:
+    """Size of the parameters and buffers of torch modules in MB"""
+    total = 0
+    for module in modules:
+        if module is None:
+            continue
+        for tensor in list(module.parameters()) + list(module.buffers()):
+            total += tensor.numel() * tensor.element_size()
+    return total / (1024 * 1024)
+
+
+class OCRBackend:
+    """
+    Base class for OCR backends
+
+    Subclasses implement _load(), _unload(), loaded and _predict(). The
+    public methods wrap them with timing and the common error format.
+    """
+
+    name = "base"
+
+    # Capability flags
+    detects_regions = True  # Returns one bbox per text region (can be tiled)
+    supports_batch = False  # predict_batch is faster than calling predict in a loop
+    thread_safe = True  # predict may be called from several threads at once
+    preloaded = True  # Loaded at startup by initialize_models
+
+    # Libraries whose thread pools the backend runs on (see thread_budget.py)
+    thread_libraries: Tuple[str, ...] = ("torch", "opencv")
+
+    def __init__(self, tester):
+        # The tester provides the device and the shared configuration
+        # (input limits, model options)
+        self.tester = tester
+        self.error: Optional[str] = None
+        # Startup timing: library import and model load, measured separately
+        self.import_time_s: Optional[float] = None
+        self.load_time_s: Optional[float] = None
+        # Resident memory added by the import, the model load and the
+        # warm-up (process RSS difference, backends load one at a time)
+        self.memory_mb: Dict[str, Optional[float]] = {
+            "import": None,
+            "load": None,
+            "warmup": None,
+        }
+        # Serializes predict() calls for backends that are not thread-safe
+        self._predict_lock = threading.Lock()
+        # Deadlines of the calls with a deadline that are still running, by
+        # call id (see begin_call). Python threads cannot be stopped, so a
+        # call that overruns its deadline keeps its worker thread (and the
+        # lock of a backend that is not thread-safe) until the model returns.
+        self._running_calls: Dict[int, float] = {}
+        self._calls_lock = threading.Lock()
+        self._call_ids = itertools.count()
+        self.abandoned_total = 0
+
+    def library_error(self) -> Optional[str]:
+        """Error message if the backend's library is missing, otherwise None"""
+        return None
+
+    @property
+    def loaded(self) -> bool:
+        raise NotImplementedError
+
+    def _import(self):
+        """Import the backend's libraries (timed separately from the model load)"""
+        pass
+
+    def _load(self):
+        raise NotImplementedError
+
+    def _unload(self):
+        pass
+
+    def _predict(self, image, **kwargs) -> Dict:
+        raise NotImplementedError
+
+    def load(self) -> bool:
+        """Load the model, recording the error instead of raising on failure"""
+        library_error = self.library_error()
+        if library_error:
+            self.error = library_error
+            return False
+
+        print(f"Initializing {self.name}...")
+        start = time.perf_counter()
+        rss_start = process_rss_mb()
+        try:
+            self._import()
+            self.import_time_s = time.perf_counter() - start
+            self.memory_mb["import"] = self._rss_delta(rss_start)
+            # Newly imported libraries pick up the process thread budget
+            apply_thread_settings()
+
+            start = time.perf_counter()
+            rss_start = process_rss_mb()
+            self._load()
+            self.load_time_s = time.perf_counter() - start
+            self.memory_mb["load"] = self._rss_delta(rss_start)
+            print(f"[OK] {self.name} initialized successfully")
+            self.error = None
+        except Exception as e:
+            self.error = str(e)
+            print(f"[ERROR] {self.name} initialization failed: {self.error}")
+            self._unload()
+        return self.loaded
+
+    @staticmethod
+    def _rss_delta(rss_start: Optional[float]) -> Optional[float]:
+        rss_now = process_rss_mb()
+        if rss_start is None or rss_now is None:
+            return None
+        return round(rss_now - rss_start, 1)
+
+    def resident_memory_mb(self) -> Optional[float]:
+        """Measured resident memory of this backend (import + load + warm-up) in MB"""
+        measured = [value for value in self.memory_mb.values() if value is not None]
+        return round(sum(measured), 1) if measured else None
+
+    def startup_timing(self) -> Dict:
+        """Import and load time of this backend in milliseconds"""
+
+        def to_ms(seconds):
+            return round(seconds * 1000, 1) if seconds is not None else None
+
+        return {
+            "import_ms": to_ms(self.import_time_s),
+            "load_ms": to_ms(self.load_time_s),
+        }
+
+    def unload(self):
+        """Release the model"""
+        self._unload()
+
+    def warm_up(self, sizes: Sequence[Tuple[int, int]] = ((640, 480),)) -> Dict:
+        """
+        Run the model on synthetic images so lazy allocations and kernel
+        selection happen before the first real request
+
+        Args:
+            sizes: (width, height) of the synthetic images
+
+        Returns:
+            Dictionary mapping "WxH" to the warm-up time in milliseconds
+        """
+        timings = {}
+        rss_start = process_rss_mb()
+        for width, height in sizes:
+            image = np.full((height, width, 3), 255, dtype=np.uint8)
+            # A few dark bars so the detectors have something to find
+            for y in range(height // 8, height, max(1, height // 4)):
+                image[y : y + max(2, height // 20), width // 8 : width - width // 8] = 0
+            start = time.perf_counter()
+            self.predict(image)
+            timings[f"{width}x{height}"] = round(
+                (time.perf_counter() - start) * 1000, 2
+            )
+        self.memory_mb["warmup"] = self._rss_delta(rss_start)
+        return timings
+
+    def predict(
+        self,
+        image,
+        deadline: Optional[float] = None,
+        layout: bool = True,
+        **kwargs,
+    ) -> Dict:
+        """
+        Run OCR on one image
+
+        Args:
+            image: Image path or RGB uint8 array
+            deadline: time.monotonic() value after which the call gives up.
+                It is checked before the model runs (and while waiting for the
+                lock of backends that are not thread-safe); backends that can
+                stop early (TrOCR generation) also use it while running.
+            layout: Put the regions in reading order and add lines and
+                paragraphs (see layout.py); tiles skip this until they are merged
+
+        Returns:
+            Result dictionary with model, success, texts, full_text and
+            num_detections, or model, success and error on failure
+        """
+        if not self.loaded:
+            return self._error(f"{self.name} not initialized")
+        if deadline is not None and time.monotonic() >= deadline:
+            return self._timeout_error()
+        try:
+            if self.thread_safe:
+                result = self._predict(image, deadline=deadline, **kwargs)
+            else:
+                # Don't wait for the lock past the deadline (e.g. behind an
+                # abandoned call that is still running)
+                lock_timeout = -1
+                if deadline is not None:
+                    lock_timeout = max(0.0, deadline - time.monotonic())
+                if not self._predict_lock.acquire(timeout=lock_timeout):
+                    return self._timeout_error()
+                try:
+                    result = self._predict(image, deadline=deadline, **kwargs)
+                finally:
+                    self._predict_lock.release()
+            return apply_layout(result) if layout else result
+        except Exception as e:
+            return self._error(str(e))
+
+    def predict_batch(self, images: List, **kwargs) -> List[Dict]:
+        """Run OCR on several images, one result per image"""
+        return [self.predict(image, **kwargs) for image in images]
+
+    def begin_call(self, deadline: Optional[float]) -> Optional[int]:
+        """
+        Record a model call with a deadline as running
+
+        Returns:
+            Call id to pass to end_call (None for calls without a deadline)
+        """
+        if deadline is None:
+            return None
+        with self._calls_lock:
+            call_id = next(self._call_ids)
+            self._running_calls[call_id] = deadline
+        return call_id
+
+    def end_call(self, call_id: Optional[int]):
+        """Record a call started with begin_call as finished"""
+        if call_id is None:
+            return
+        with self._calls_lock:
+            deadline = self._running_calls.pop(call_id, None)
+            if deadline is not None and time.monotonic() > deadline + ABANDON_GRACE_S:
+                self.abandoned_total += 1
+
+    def abandoned_calls(self) -> int:
+        """Calls still running more than ABANDON_GRACE_S past their deadline"""
+        cutoff = time.monotonic() - ABANDON_GRACE_S
+        with self._calls_lock:
+            return sum(1 for deadline in self._running_calls.values() if deadline < cutoff)
+
+    def healthy(self, slots: Optional[int] = None) -> bool:
+        """
+        Whether new calls should be started
+
+        A backend is unhealthy while it has max_abandoned_calls (tester
+        setting) abandoned calls still running: they hold worker threads that
+        cannot be reclaimed, so new calls fail fast instead of piling up
+        behind them. It becomes healthy again when those calls return.
+
+        Args:
+            slots: Concurrent calls the caller allows for this model; the
+                backend is also unhealthy once abandoned calls hold all of them
+        """
+        limits = [self.tester.max_abandoned_calls, slots]
+        limits = [limit for limit in limits if limit]
+        return not limits or self.abandoned_calls() < min(limits)
+
+    def health(self, slots: Optional[int] = None) -> Dict:
+        """Abandoned call counts and whether new calls are accepted (see healthy)"""
+        return {
+            "healthy": self.healthy(slots),
+            "abandoned_calls": self.abandoned_calls(),
+            "abandoned_total": self.abandoned_total,
+            "max_abandoned_calls": self.tester.max_abandoned_calls or None,
+        }
+
+    def memory_estimate_mb(self) -> Optional[float]:
+        """Estimated memory held by the loaded model in MB (None if unknown)"""
+        return None
+
+    def capabilities(self) -> Dict:
+        """Capability flags of this backend"""
+        return {
+            "detects_regions": self.detects_regions,
+            "supports_batch": self.supports_batch,
+            "thread_safe": self.thread_safe,
+            "preloaded": self.preloaded,
+        }
+
+    def _prepare_input(self, image):
+        """Apply the tester's input size limits for this model"""
+        return self.tester._prepare_input(self.name, image)
+
+    def loaded_languages(self) -> Optional[List[str]]:
+        """Loaded language sets, e.g. ["en+fa", "en"] (None if not language-specific)"""
+        return None
+
+    def _error(self, message: str) -> Dict:
+        return {"model": self.name, "success": False, "error": message}
+
+    def _timeout_error(self, message: Optional[str] = None) -> Dict:
+        result = self._error(message or f"{self.name} timed out")
+        result["timed_out"] = True
+        return result
+
+    def _unhealthy_error(self) -> Dict:
+        result = self._error(
+            f"{self.name} is unhealthy: {self.abandoned_calls()} earlier calls "
+            "are still running past their timeout"
+        )
+        result["unhealthy"] = True
+        return result
+
+    def _result(self, texts: List[Dict], **extra) -> Dict:
+        result = {
+            "model": self.name,
+            "success": True,
+            "texts": texts,
+            "full_text": " ".join([item["text"] for item in texts]),
+            "num_detections": len(texts),
+        }
+        result.update(extra)
+        return result
+
+    def _result_from_arrays(
+        self,
+        polygons: np.ndarray,
+        scores: np.ndarray,
+        texts: List[str],
+        scale: Tuple[float, float] = (1.0, 1.0),
+        **extra,
+    ) -> Dict:
+        """
+        Build an array-form result from normalized arrays
+
+        The regions stay as arrays through layout, tiling and fusion; the
+        list of text dicts is built when the result is written out as JSON
+        (see result_normalization.py).
+        """
+        result = {
+            "model": self.name,
+            "success": True,
+            "polygons": rescale_polygons(polygons, scale),
+            "scores": scores,
+            "texts": texts,
+            "full_text": " ".join(texts),
+            "num_detections": len(texts),
+        }
+        result.update(extra)
+        return result
+
+
+@register_backend
+class EasyOCRBackend(OCRBackend):
+    """EasyOCR (CRAFT detector + CRNN recognizer, English and Persian)"""
+
+    name = "EasyOCR"
+    # Loaded at startup; other language sets are loaded on demand
+    default_languages = ("en", "fa")
+
+    def __init__(self, tester):
+        super().__init__(tester)
+        self.reader = None
+        self.reader_pool = ReaderPool(self._create_reader, tester.reader_pool_size)
+
+    def library_error(self) -> Optional[str]:
+        return None if EASYOCR_AVAILABLE else "EasyOCR library not installed"
+
+    @property
+    def loaded(self) -> bool:
+        return self.reader is not None
+
+    def _import(self):
+        import easyocr  # noqa: F401
+
+    def _create_reader(self, languages: Tuple[str, ...]):
+        import easyocr
+
+        use_gpu = self.tester.uses_cuda()
+        return easyocr.Reader(list(languages), gpu=use_gpu)
+
+    def _load(self):
+        self.reader = self._create_reader(self.default_languages)
+
+    def _unload(self):
+        self.reader = None
+        self.reader_pool.clear()
+
+    def _get_reader(self, lang=None):
+        """Reader for a language selection (the startup reader by default)"""
+        languages = parse_languages(lang)
+        if languages is None or languages == tuple(sorted(self.default_languages)):
+            return self.reader
+        return self.reader_pool.get(languages)
+
+    def _predict(self, image, lang=None, **kwargs) -> Dict:
+        reader = self._get_reader(lang)
+        image_input, scale = self._prepare_input(image)
+        polygons, scores, texts = normalize_easyocr(reader.readtext(image_input))
+        return self._result_from_arrays(polygons, scores, texts, scale)
+
+    def loaded_languages(self) -> Optional[List[str]]:
+        languages = [self.default_languages] if self.loaded else []
+        return ["+".join(codes) for codes in languages + self.reader_pool.languages()]
+
+    def memory_estimate_mb(self) -> Optional[float]:
+        if not self.loaded:
+            return None
+        readers = [self.reader] + self.reader_pool.readers()
+        return round(
+            sum(
+                torch_module_size_mb(
+                    getattr(reader, "detector", None),
+                    getattr(reader, "recognizer", None),
+                )
+                for reader in readers
+            ),
+            1,
+        )
+
+
+@register_backend
+class PaddleOCRBackend(OCRBackend):
+    """PaddleOCR (DB detector + SVTR/CRNN recognizer)"""
+
+    name = "PaddleOCR"
+    # The Paddle inference predictor is not safe to share between threads
+    thread_safe = False
+    thread_libraries = ("paddle", "opencv")
+    # PaddleOCR recognition models cover one language each
+    default_language = "en"
+
+    def __init__(self, tester):
+        super().__init__(tester)
+        self.reader = None
+        self.reader_pool = ReaderPool(self._create_reader, tester.reader_pool_size)
+
+    def library_error(self) -> Optional[str]:
+        return None if PADDLEOCR_AVAILABLE else "PaddleOCR library not installed"
+
+    @property
+    def loaded(self) -> bool:
+        return self.reader is not None
+
+    def _import(self):
+        import paddleocr  # noqa: F401
+
+    def _create_reader(self, languages: Tuple[str, ...]):
+        from paddleocr import PaddleOCR
+
+        (lang,) = languages
+        # Try different parameter combinations for different PaddleOCR versions
+        # Newer versions (3.x) don't support use_gpu or use_angle_cls
+        try:
+            # Try with use_gpu and use_angle_cls (older versions)
+            use_gpu = self.tester.uses_cuda()
+            return PaddleOCR(
+                use_angle_cls=True,
+                lang=lang,
+                use_gpu=use_gpu,
+                **paddle_thread_kwargs(),
+            )
+        except (TypeError, ValueError, Exception) as e:
+            error_str = str(e)
+            # If error mentions use_gpu or use_angle_cls, try without them
+            if (
+                "use_gpu" in error_str
+                or "use_angle_cls" in error_str
+                or "Unknown argument" in error_str
+            ):
+                # Try with just lang parameter (newer versions)
+                return PaddleOCR(lang=lang, **paddle_thread_kwargs())
+            else:
+                # Re-raise if it's a different error
+                raise
+
+    def _load(self):
+        self.reader = self._create_reader((self.default_language,))
+
+    def _unload(self):
+        self.reader = None
+        self.reader_pool.clear()
+
+    def _get_reader(self, lang=None):
+        """Reader for a language selection (the startup reader by default)"""
+        languages = parse_languages(lang)
+        if languages is None or languages == (self.default_language,):
+            return self.reader
+        if len(languages) > 1:
+            raise ValueError(
+                f"PaddleOCR recognizes one language per request, got: {', '.join(languages)}"
+            )
+        return self.reader_pool.get(languages)
+
+    def loaded_languages(self) -> Optional[List[str]]:
+        languages = [(self.default_language,)] if self.loaded else []
+        return ["+".join(codes) for codes in languages + self.reader_pool.languages()]
+
+    def _predict(self, image, lang=None, **kwargs) -> Dict:
+        reader = self._get_reader(lang)
+        image_input, scale = self._prepare_input(image)
+        if isinstance(image_input, np.ndarray):
+            # PaddleOCR expects BGR arrays (OpenCV channel order)
+            image_input = np.ascontiguousarray(image_input[:, :, ::-1])
+
+        # Try with cls parameter first (older versions), fallback without it (newer versions)
+        try:
+            results = reader.ocr(image_input, cls=True)
+        except (TypeError, ValueError) as e:
+            # Newer versions don't support cls parameter
+            if "cls" in str(e) or "Unknown argument" in str(e):
+                results = reader.ocr(image_input)
+            else:
+                raise
+
+        polygons, scores, texts = normalize_paddleocr(results)
+        return self._result_from_arrays(polygons, scores, texts, scale)
+
+
+@register_backend
+class TrOCRBackend(OCRBackend):
+    """TrOCR (ViT encoder + transformer decoder, recognition only)"""
+
+    name = "TrOCR"
+    detects_regions = False
+    supports_batch = True
+    thread_libraries = ("torch",)
+
+    model_name = "microsoft/trocr-base-printed"
+
+    def __init__(self, tester):
+        super().__init__(tester)
+        self.processor = None
+        self.model = None
+        # Fast-inference options and the outcome of applying them
+        self.options = dict(tester.trocr_options)
+        self.fast_info = None
+        # Precomputed image transform replacing the processor's preprocessing
+        self.transform = None
+        # Generation configs per decoding profile, built on first use
+        self.generation_configs: Dict[str, object] = {}
+
+    def library_error(self) -> Optional[str]:
+        if not TROCR_AVAILABLE:
+            return "TrOCR library not installed"
+        if not TORCH_AVAILABLE or self.tester.device is None:
+            return "TrOCR requires PyTorch"
+        return None
+
+    @property
+    def loaded(self) -> bool:
+        return self.processor is not None and self.model is not None
+
+    def _import(self):
+        import torch  # noqa: F401
+        import transformers  # noqa: F401
+
+    def _load(self):
+        from transformers import TrOCRProcessor, VisionEncoderDecoderModel
+
+        self.processor = TrOCRProcessor.from_pretrained(self.model_name)
+        self.model = VisionEncoderDecoderModel.from_pretrained(self.model_name)
+        self.model.to(self.tester.device)
+        self.model.eval()
+
+        from trocr_fast import MODEL_OPTIONS
+
+        self._load_transform()
+        if any(self.options.get(option) for option in MODEL_OPTIONS):
+            self._optimize()
+
+    def _load_transform(self):
+        """
+        Build the fast image transform and check it against the processor
+
+        The transform is only used if its pixel_values match the processor's
+        on the parity images; otherwise TrOCR preprocesses with the processor.
+        """
+        from trocr_fast import FastImageTransform, check_transform, default_parity_images
+
+        self.transform = None
+        try:
+            transform = FastImageTransform.from_processor(self.processor)
+            report = check_transform(
+                self.processor,
+                transform,
+                self.options.get("parity_images") or default_parity_images(),
+            )
+        except Exception as e:
+            print(f"[WARNING] TrOCR fast preprocessing unavailable, using the processor: {e}")
+            return
+        if not report["passed"]:
+            print(
+                "[WARNING] TrOCR fast preprocessing differs from the processor "
+                f"(max difference {report['max_abs_diff']}), using the processor"
+            )
+            return
+        self.transform = transform
+
+    def _unload(self):
+        self.processor = None
+        self.model = None
+        self.transform = None
+        self.generation_configs = {}
+
+    def _optimize(self):
+        """
+        Replace the fp32 model with its fast-inference variant
+
+        The fast model is compared against fp32 first (on the configured
+        parity images, or on synthetic text lines when none are given), with
+        its inputs preprocessed as in production, and discarded if its
+        outputs diverge. If building or checking it fails,
+        TrOCR keeps running in fp32.
+        """
+        from trocr_fast import check_parity, default_parity_images, optimize_trocr_model
+
+        try:
+            fast_model, applied = optimize_trocr_model(
+                self.model, self.model_name, self.options
+            )
+        except Exception as e:
+            self._use_fp32(f"fast inference unavailable: {e}")
+            return
+        self.fast_info = {"optimizations": applied, "parity": None}
+
+        parity_images = self.options.get("parity_images") or default_parity_images()
+        try:
+            report = check_parity(
+                self.processor,
+                self.model,
+                fast_model,
+                parity_images,
+                self.options,
+                device=self.tester.device,
+                min_similarity=self.options.get("min_similarity", 0.98),
+                transform=self.transform,
+            )
+        except Exception as e:
+            self._use_fp32(f"fast inference failed the parity check: {e}")
+            return
+        self.fast_info["parity"] = report
+        print(
+            f"TrOCR parity: similarity {report['mean_similarity']}, "
+            f"speedup {report['speedup']}x"
+        )
+        if not report["passed"]:
+            self._use_fp32("fast inference failed parity check", report)
+            return
+
+        self.model = fast_model
+        print(f"TrOCR fast inference: {', '.join(applied) or 'none'}")
+
+    def _use_fp32(self, reason: str, parity: Optional[Dict] = None):
+        """Keep the fp32 model and drop the fast-inference options"""
+        print(f"[WARNING] TrOCR {reason}, using fp32")
+        self.fast_info = {"optimizations": [], "parity": parity, "error": reason}
+        # Decoding settings don't depend on the model variant, keep them
+        self.options = {"decoding": self.options["decoding"]} if "decoding" in self.options else {}
+
+    def _to_pil(self, image):
+        from PIL import Image
+
+        image_input, _ = self._prepare_input(image)
+        if isinstance(image_input, np.ndarray):
+            return Image.fromarray(image_input)
+        return Image.open(image_input).convert("RGB")
+
+    def _generation_config(self, profile: str):
+        """Cached generation config of a decoding profile (None = model default)"""
+        if profile not in self.generation_configs:
+            from trocr_fast import build_generation_config
+
+            self.generation_configs[profile] = build_generation_config(self.model, profile)
+        return self.generation_configs[profile]
+
+    def _generate(
+        self,
+        images: List,
+        deadline: Optional[float] = None,
+        decoding: Optional[str] = None,
+    ) -> Tuple[List[str], Dict]:
+        """
+        Decode a batch of PIL images
+
+        Returns:
+            Tuple of (texts, decoding stats with profile, new tokens,
+            tokens/sec and preprocessing / generation time)
+        """
+        import torch
+        from trocr_fast import count_new_tokens, inference_context
+
+        profile = decoding or self.options.get("decoding", "default")
+        generation_config = self._generation_config(profile)
+
+        # TrOCR works best on cropped text regions
+        # For full image, we'll use the entire image
+        start = time.perf_counter()
+        if self.transform is not None:
+            pixel_values = self.transform(images)
+        else:
+            pixel_values = self.processor(images, return_tensors="pt").pixel_values
+        pixel_values = pixel_values.to(self.tester.device)
+        preprocess_s = time.perf_counter() - start
+
+        generate_kwargs = {}
+        if generation_config is not None:
+            generate_kwargs["generation_config"] = generation_config
+        if deadline is not None:
+            # generate() stops decoding once max_time seconds have passed
+            generate_kwargs["max_time"] = max(0.0, deadline - time.monotonic())
+        start = time.perf_counter()
+        with torch.no_grad(), inference_context(self.options, self.tester.device):
+            generated_ids = self.model.generate(pixel_values, **generate_kwargs)
+        generate_s = time.perf_counter() - start
+
+        new_tokens = count_new_tokens(
+            generated_ids, getattr(self.processor.tokenizer, "pad_token_id", None)
+        )
+        stats = {
+            "profile": profile,
+            "batch_size": len(images),
+            "new_tokens": new_tokens,
+            "tokens_per_sec": round(new_tokens / generate_s, 1) if generate_s > 0 else None,
+            "preprocess_ms": round(preprocess_s * 1000, 2),
+            "generate_ms": round(generate_s * 1000, 2),
+        }
+        return self.processor.batch_decode(generated_ids, skip_special_tokens=True), stats
+
+    def _text_result(self, generated_text: str, decoding: Optional[Dict] = None) -> Dict:
+        result = {
+            "model": "TrOCR",
+            "success": True,
+            "texts": [{"text": generated_text, "confidence": 1.0}],
+            "full_text": generated_text,
+            "num_detections": 1,
+            "note": "TrOCR processes full image as single text region",
+        }
+        if decoding is not None:
+            result["decoding"] = decoding
+        return result
+
+    def _predict(
+        self,
+        image,
+        deadline: Optional[float] = None,
+        decoding: Optional[str] = None,
+        **kwargs,
+    ) -> Dict:
+        texts, stats = self._generate([self._to_pil(image)], deadline, decoding)
+        result = self._text_result(texts[0], stats)
+        if deadline is not None and time.monotonic() >= deadline:
+            # Decoding was cut short, the text may be truncated
+            result["timed_out"] = True
+        return result
+
+    def predict_batch(
+        self,
+        images: List,
+        deadline: Optional[float] = None,
+        decoding: Optional[str] = None,
+        **kwargs,
+    ) -> List[Dict]:
+        """Run TrOCR on several images in a single generate() call"""
+        if not self.loaded:
+            return [self._error(f"{self.name} not initialized") for _ in images]
+        if deadline is not None and time.monotonic() >= deadline:
+            return [self._timeout_error() for _ in images]
+        try:
+            texts, stats = self._generate(
+                [self._to_pil(image) for image in images], deadline, decoding
+            )
+        except Exception:
+            # Fall back to per-image calls so one bad image does not fail the batch
+            return super().predict_batch(
+                images, deadline=deadline, decoding=decoding, **kwargs
+            )
+        results = [self._text_result(text, dict(stats)) for text in texts]
+        if deadline is not None and time.monotonic() >= deadline:
+            # Decoding was cut short, the texts may be truncated
+            for result in results:
+                result["timed_out"] = True
+        return results
+
+    def memory_estimate_mb(self) -> Optional[float]:
+        if not self.loaded or not hasattr(self.model, "parameters"):
+            return None
+        return round(torch_module_size_mb(self.model), 1)
+
+
+@register_backend
+class SwinTextSpotterBackend(OCRBackend):
+    """
+    SwinTextSpotter (detectron2, end-to-end detection + recognition)
+
+    Needs a separate setup, so it is not loaded at startup and reports its
+    setup errors per request.
+    """
+
+    name = "SwinTextSpotter"
+    preloaded = False
+
+    def __init__(self, tester):
+        super().__init__(tester)
+        self.config_path = None
+        self.weights_path = None
+
+    @property
+    def loaded(self) -> bool:
+        # Always available but may fail at runtime
+        return True
+
+    def _load(self):
+        pass
+
+    def _predict(
+        self, image, config_path: str = None, weights_path: str = None, **kwargs
+    ) -> Dict:
+        try:
+            from swintextspotter_integration import test_swintextspotter
+        except ImportError:
+            return {
+                "model": "SwinTextSpotter",
+                "success": False,
+                "error": "SwinTextSpotter requires separate setup. See README for installation instructions.",
+                "note": "SwinTextSpotter needs detectron2 and model weights. Check SwinTextSpotter repository for setup.",
+            }
+
+        image_input, scale = self._prepare_input(image)
+        if isinstance(image_input, np.ndarray):
+            # SwinTextSpotter (detectron2) expects BGR arrays
+            bgr_image = np.ascontiguousarray(image_input[:, :, ::-1])
+            image_path = "<array>"
+        else:
+            bgr_image = None
+            image_path = image_input
+
+        result = test_swintextspotter(
+            image_path,
+            config_path or self.config_path,
+            weights_path or self.weights_path,
+            image=bgr_image,
+            as_arrays=True,
+        )
+        if result.get("success"):
+            result["polygons"] = rescale_polygons(result["polygons"], scale)
+        return result
@@ -0,0 +1,284 @@
+"""
+Columnar export of OCR runs
+Writes results as partitioned Parquet datasets for offline analysis:
+
+    <export_dir>/regions/date=YYYY-MM-DD/model=<model>/part-<run_id>-0.parquet
+        one row per detected region: run_id, image_id, region, text,
+        confidence, polygon (list of [x, y] points)
+    <export_dir>/timings/date=YYYY-MM-DD/model=<model>/part-<run_id>-0.parquet
+        one row per image and model: run_id, image_id, success, timed_out,
+        reused, num_detections, processing_time_ms, queue_wait_ms, error
+
+Rows are buffered and written in large row groups. Reads memory-map the
+files and only decode the requested columns and partitions.
+
+Requires pyarrow (pip install pyarrow).
+
+Usage (per-model summary of all exported runs):
+    python parquet_export.py ocr_results/parquet
+"""
+
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+if PYARROW_AVAILABLE:
+    REGION_SCHEMA = pa.schema(
+        [
+            ("run_id", pa.string()),
+            ("date", pa.string()),
+            ("image_id", pa.string()),
+            ("model", pa.string()),
+            ("region", pa.int32()),
+            ("text", pa.string()),
+            ("confidence", pa.float32()),
+            ("polygon", pa.list_(pa.list_(pa.float32(), 2))),
+        ]
+    )
+    TIMING_SCHEMA = pa.schema(
+        [
+            ("run_id", pa.string()),
+            ("date", pa.string()),
+            ("image_id", pa.string()),
+            ("model", pa.string()),
+            ("success", pa.bool_()),
+            ("timed_out", pa.bool_()),
+            ("reused", pa.bool_()),
+            ("num_detections", pa.int32()),
+            ("processing_time_ms", pa.float64()),
+            ("queue_wait_ms", pa.float64()),
+            ("error", pa.string()),
+        ]
+    )
+
+# Hive partition columns, in directory order
+PARTITION_COLUMNS = ["date", "model"]
+
+
+def _require_pyarrow():
+    if not PYARROW_AVAILABLE:
+        raise ImportError("Parquet export requires pyarrow: pip install pyarrow")
+
+
+class ParquetExporter:
+    """
+    Buffered writer of region and timing rows
+
+    Args:
+        export_dir: Root directory of the regions/ and timings/ datasets
+        run_id: Identifier of this run, part of every row and file name
+            (default: timestamp plus random suffix)
+        batch_rows: Region rows buffered before they are written
+    """
+
+    def __init__(
+        self,
+        export_dir: str = "ocr_results/parquet",
+        run_id: Optional[str] = None,
+        batch_rows: int = 100000,
+    ):
+        _require_pyarrow()
+        self.export_dir = Path(export_dir)
+        self.run_id = run_id or f"{datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self.batch_rows = batch_rows
+        self._regions = {name: [] for name in REGION_SCHEMA.names}
+        self._timings = {name: [] for name in TIMING_SCHEMA.names}
+        self._parts = 0
+
+    def add(self, results: Dict, image_id: Optional[str] = None):
+        """
+        Buffer the rows of one image
+
+        Args:
+            results: test_all_models() output or an /ocr response (models,
+                timestamp, optionally ensemble)
+            image_id: Image identifier (default: image_id of the response, or
+                the file name of image_path)
+        """
+        image_id = (
+            image_id
+            or results.get("image_id")
+            or Path(results.get("image_path") or results.get("image_name", "")).name
+        )
+        date = (results.get("timestamp") or datetime.now().isoformat())[:10]
+        model_results = dict(results.get("models", {}))
+        if results.get("ensemble"):
+            model_results["Ensemble"] = results["ensemble"]
+
+        regions, timings = self._regions, self._timings
+        for model_name, result in model_results.items():
+            texts = (result.get("texts") or []) if result.get("success") else []
+            timings["run_id"].append(self.run_id)
+            timings["date"].append(date)
+            timings["image_id"].append(image_id)
+            timings["model"].append(model_name)
+            timings["success"].append(bool(result.get("success")))
+            timings["timed_out"].append(bool(result.get("timed_out")))
+            timings["reused"].append("reused_from" in result)
+            timings["num_detections"].append(result.get("num_detections", len(texts)))
+            timings["processing_time_ms"].append(result.get("processing_time_ms"))
+            timings["queue_wait_ms"].append(result.get("queue_wait_ms"))
+            timings["error"].append(result.get("error"))
+
+            for index, item in enumerate(texts):
+                regions["run_id"].append(self.run_id)
+                regions["date"].append(date)
+                regions["image_id"].append(image_id)
+                regions["model"].append(model_name)
+                regions["region"].append(index)
+                regions["text"].append(item.get("text", ""))
+                regions["confidence"].append(item.get("confidence"))
+                regions["polygon"].append(item.get("bbox"))
+
+        if len(regions["run_id"]) >= self.batch_rows:
+            self.flush()
+
+    def _write(self, name: str, columns: Dict[str, List], schema):
+        if not columns["run_id"]:
+            return
+        table = pa.Table.from_pydict(columns, schema=schema)
+        ds.write_dataset(
+            table,
+            str(self.export_dir / name),
+            format="parquet",
+            partitioning=PARTITION_COLUMNS,
+            partitioning_flavor="hive",
+            basename_template=f"part-{self.run_id}-{self._parts}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+        for values in columns.values():
+            values.clear()
+
+    def flush(self):
+        """Write the buffered rows as new files in each partition"""
+        self._write("regions", self._regions, REGION_SCHEMA)
+        self._write("timings", self._timings, TIMING_SCHEMA)
+        self._parts += 1
+
+    close = flush
+
+
+def export_results(
+    results: List[Dict], export_dir: str = "ocr_results/parquet", run_id: Optional[str] = None
+) -> str:
+    """
+    Export a list of image results (e.g. compare_results.load_results())
+
+    Returns:
+        The run_id of the export
+    """
+    exporter = ParquetExporter(export_dir, run_id=run_id)
+    for image_results in results:
+        exporter.add(image_results)
+    exporter.close()
+    return exporter.run_id
+
+
+def load_table(
+    export_dir: str = "ocr_results/parquet",
+    kind: str = "regions",
+    columns: Optional[List[str]] = None,
+    filters=None,
+):
+    """
+    Read an exported dataset as an Arrow table
+
+    Files are memory-mapped; only the requested columns are decoded and
+    partitions excluded by the filters (e.g. [("model", "=", "EasyOCR"),
+    ("date", ">=", "2026-01-01")]) are not read at all.
+
+    Args:
+        export_dir: Root directory of the export
+        kind: "regions" or "timings"
+        columns: Columns to read (default: all)
+        filters: pyarrow filter expression or list of (column, op, value)
+
+    Returns:
+        pyarrow.Table
+    """
+    _require_pyarrow()
+    return pq.read_table(
+        str(Path(export_dir) / kind),
+        columns=columns,
+        filters=filters,
+        memory_map=True,
+        partitioning="hive",
+    )
+
+
+def model_summary(export_dir: str = "ocr_results/parquet", filters=None) -> Dict[str, Dict]:
+    """
+    Per-model totals over all exported runs
+
+    Returns:
+        Dictionary mapping model name to images, success rate, mean
+        processing time, regions and mean region confidence
+    """
+    timings = load_table(
+        export_dir, "timings", ["model", "success", "processing_time_ms"], filters
+    )
+    timings = timings.append_column(
+        "succeeded", pc.cast(timings["success"], pa.float64())
+    ).group_by("model").aggregate(
+        [("succeeded", "count"), ("succeeded", "mean"), ("processing_time_ms", "mean")]
+    )
+    regions = load_table(
+        export_dir, "regions", ["model", "region", "confidence"], filters
+    ).group_by("model").aggregate([("region", "count"), ("confidence", "mean")])
+
+    summary = {}
+    for row in timings.to_pylist():
+        summary[row["model"]] = {
+            "images": row["succeeded_count"],
+            "success_rate": row["succeeded_mean"],
+            "mean_processing_time_ms": row["processing_time_ms_mean"],
+            "regions": 0,
+            "mean_confidence": None,
+        }
+    for row in regions.to_pylist():
+        entry = summary.setdefault(
+            row["model"],
+            {"images": 0, "success_rate": None, "mean_processing_time_ms": None},
+        )
+        entry["regions"] = row["region_count"]
+        entry["mean_confidence"] = row["confidence_mean"]
+    return summary
+
+
+def main():
+    """Print a per-model summary of the exported runs"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarize exported OCR runs")
+    parser.add_argument(
+        "export_dir", nargs="?", default="ocr_results/parquet", help="Export directory"
+    )
+    parser.add_argument("--since", type=str, default=None, help="Only runs on or after YYYY-MM-DD")
+    args = parser.parse_args()
+
+    filters = [("date", ">=", args.since)] if args.since else None
+    for model_name, entry in sorted(model_summary(args.export_dir, filters).items()):
+        parts = [f"{entry['images']} images"]
+        if entry["success_rate"] is not None:
+            parts.append(f"{entry['success_rate'] * 100:.1f}% success")
+        if entry["mean_processing_time_ms"] is not None:
+            parts.append(f"{entry['mean_processing_time_ms']:.1f} ms avg")
+        parts.append(f"{entry['regions']} regions")
+        if entry["mean_confidence"] is not None:
+            parts.append(f"confidence {entry['mean_confidence']:.3f}")
+        print(f"{model_name}: {', '.join(parts)}")
+
+
+if __name__ == "__main__":
+    main()
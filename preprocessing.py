@@ -0,0 +1,129 @@
+"""
+Input preprocessing for OCR models
+Downscales large images before inference and maps bboxes back to the original
+image coordinates
+"""
+
+import io
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+# Pillow 10.0+ moved the resampling filters into Image.Resampling
+try:
+    RESAMPLE_FILTER = Image.Resampling.BILINEAR
+except AttributeError:
+    RESAMPLE_FILTER = Image.BILINEAR
+
+
+def open_image_source(image: Union[str, bytes]):
+    """
+    Image.open() argument for an image path or encoded image bytes
+
+    Encoded bytes are images read from an archive member or another stream
+    that were never written to disk.
+    """
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return io.BytesIO(image)
+    return image
+
+
+def compute_target_size(
+    width: int,
+    height: int,
+    max_side: Optional[int] = None,
+    max_pixels: Optional[int] = None,
+) -> Tuple[int, int]:
+    """
+    Compute the largest size that fits within the given limits
+
+    Args:
+        width: Original image width
+        height: Original image height
+        max_side: Maximum length of the longest side (None = unlimited)
+        max_pixels: Maximum number of pixels (None = unlimited)
+
+    Returns:
+        (width, height) of the target size. Equal to the input size if the
+        image already fits, images are never upscaled.
+    """
+    ratio = 1.0
+    if max_side and max(width, height) > max_side:
+        ratio = min(ratio, max_side / float(max(width, height)))
+    if max_pixels and width * height > max_pixels:
+        ratio = min(ratio, (max_pixels / float(width * height)) ** 0.5)
+
+    if ratio >= 1.0:
+        return width, height
+    return max(1, int(width * ratio)), max(1, int(height * ratio))
+
+
+def load_image(
+    image_path: Union[str, bytes],
+    max_side: Optional[int] = None,
+    max_pixels: Optional[int] = None,
+) -> Tuple[np.ndarray, Tuple[float, float]]:
+    """
+    Load an image as an RGB array, downscaled to fit the given limits
+
+    JPEG images are decoded at reduced resolution (DCT scaling via
+    ``Image.draft``) when the target size allows it, so the full-resolution
+    bitmap is never materialized.
+
+    Args:
+        image_path: Path to input image or encoded image bytes
+        max_side: Maximum length of the longest side (None = unlimited)
+        max_pixels: Maximum number of pixels (None = unlimited)
+
+    Returns:
+        Tuple of (RGB uint8 array, (scale_x, scale_y)) where the scale factors
+        map coordinates in the returned array back to the original image
+    """
+    with Image.open(open_image_source(image_path)) as img:
+        orig_width, orig_height = img.size
+        target_width, target_height = compute_target_size(
+            orig_width, orig_height, max_side, max_pixels
+        )
+
+        if (target_width, target_height) != (orig_width, orig_height):
+            if img.format == "JPEG":
+                # draft() picks the smallest 1/2, 1/4 or 1/8 scale that is
+                # still at least the requested size
+                img.draft("RGB", (target_width, target_height))
+            img = img.convert("RGB")
+            if img.size != (target_width, target_height):
+                img = img.resize((target_width, target_height), RESAMPLE_FILTER)
+        else:
+            img = img.convert("RGB")
+
+        image = np.asarray(img)
+
+    height, width = image.shape[:2]
+    return image, (orig_width / float(width), orig_height / float(height))
+
+
+def rescale_bbox(bbox: List, scale: Tuple[float, float]) -> List:
+    """Map a bbox (list of [x, y] points) back to original image coordinates"""
+    scale_x, scale_y = scale
+    if scale_x == 1.0 and scale_y == 1.0:
+        return bbox
+    return [[float(x) * scale_x, float(y) * scale_y] for x, y in bbox]
+
+
+def rescale_polygons(polygons: np.ndarray, scale: Tuple[float, float]) -> np.ndarray:
+    """Map an (N, K, 2) polygon array back to original image coordinates"""
+    if scale == (1.0, 1.0):
+        return polygons
+    return polygons * np.asarray(scale, dtype=polygons.dtype)
+
+
+def rescale_texts(texts: List[Dict], scale: Tuple[float, float]) -> List[Dict]:
+    """Map the bboxes of a list of text results back to original coordinates"""
+    if scale == (1.0, 1.0):
+        return texts
+    for item in texts:
+        bbox = item.get("bbox")
+        if bbox and isinstance(bbox[0], (list, tuple)):
+            item["bbox"] = rescale_bbox(bbox, scale)
+    return texts
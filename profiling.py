@@ -0,0 +1,180 @@
+"""
+Per-request sampling profiler
+Samples the Python stacks of the threads working on one request at a fixed
+interval (sys._current_frames), so a slow request can be profiled inside the
+running service with little overhead and without touching other requests.
+
+Worker threads are registered with the profiler while they run the
+request's work (RequestProfiler.wrap); work they hand to further threads
+(e.g. tiles) is registered through inherit_profiler.
+
+Output:
+    - collapsed stacks ("frame;frame;frame count" per line), the input
+      format of flamegraph.pl, speedscope and similar tools
+    - top functions by cumulative (inclusive) and self time
+"""
+
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+_current = threading.local()
+
+
+def current_profiler() -> Optional["RequestProfiler"]:
+    """Profiler the calling thread is registered with, if any"""
+    return getattr(_current, "profiler", None)
+
+
+def inherit_profiler(func: Callable) -> Callable:
+    """
+    Register the threads that run func with the calling thread's profiler
+
+    Used for work handed to other threads (thread pools), so it shows up in
+    the profile of the request that started it. Returns func unchanged when
+    the calling thread is not being profiled.
+    """
+    profiler = current_profiler()
+    return profiler.wrap(func) if profiler is not None else func
+
+
+def _run_tracked(profiler: "RequestProfiler", func: Callable, args, kwargs):
+    """Run func with the calling thread registered with the profiler"""
+    thread_id = threading.get_ident()
+    previous = current_profiler()
+    _current.profiler = profiler
+    with profiler._threads_lock:
+        profiler._threads[thread_id] += 1
+    try:
+        return func(*args, **kwargs)
+    finally:
+        with profiler._threads_lock:
+            profiler._threads[thread_id] -= 1
+            if not profiler._threads[thread_id]:
+                del profiler._threads[thread_id]
+        _current.profiler = previous
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+class RequestProfiler:
+    """
+    Sampling profiler for the threads registered with it
+
+    Args:
+        interval: Sampling interval in seconds
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        # Sampling rounds; the sampler competes for the GIL, so the actual
+        # interval is measured (duration / ticks) instead of assumed
+        self.ticks = 0
+        self.duration_s = 0.0
+        self._threads: Counter = Counter()
+        self._threads_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._start = 0.0
+
+    def wrap(self, func: Callable) -> Callable:
+        """Return func registering its thread with this profiler while it runs"""
+
+        def tracked(*args, **kwargs):
+            return _run_tracked(self, func, args, kwargs)
+
+        return tracked
+
+    def start(self):
+        self._start = time.perf_counter()
+        self._sampler = threading.Thread(
+            target=self._run, name="request-profiler", daemon=True
+        )
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        self.duration_s = time.perf_counter() - self._start
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.ticks += 1
+            with self._threads_lock:
+                thread_ids = list(self._threads)
+            if not thread_ids:
+                continue
+            frames = sys._current_frames()
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                stack = []
+                # Frames above the registration (thread pool internals) are left out
+                while frame is not None and frame.f_code is not _run_tracked.__code__:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                if stack:
+                    # Root first, as in the collapsed-stack format
+                    self.stacks[";".join(reversed(stack))] += 1
+                    self.samples += 1
+
+    def collapsed(self) -> str:
+        """Collapsed stacks, one "frame;frame;frame count" line per stack"""
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+        )
+
+    def sample_interval_ms(self) -> float:
+        """Measured time between samples in ms"""
+        if not self.ticks:
+            return self.interval * 1000
+        return self.duration_s * 1000 / self.ticks
+
+    def top_functions(self, limit: int = 20) -> List[Dict]:
+        """
+        Functions with the most cumulative time
+
+        Times are sample counts times the measured sampling interval, summed
+        over all sampled threads.
+        """
+        cumulative: Counter = Counter()
+        own: Counter = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            # Count recursive functions once per sample
+            for name in set(frames):
+                cumulative[name] += count
+            own[frames[-1]] += count
+        interval_ms = self.sample_interval_ms()
+        return [
+            {
+                "function": name,
+                "cumulative_ms": round(count * interval_ms, 1),
+                "self_ms": round(own[name] * interval_ms, 1),
+                "samples": count,
+            }
+            for name, count in cumulative.most_common(limit)
+        ]
+
+    def summary(self, limit: int = 20) -> Dict:
+        return {
+            "duration_ms": round(self.duration_s * 1000, 2),
+            "interval_ms": round(self.sample_interval_ms(), 3),
+            "samples": self.samples,
+            "top_functions": self.top_functions(limit),
+        }
+
+    def save(self, path: str) -> str:
+        """Write the collapsed stacks to a file and return its path"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(self.collapsed(), encoding="utf-8")
+        return str(path)
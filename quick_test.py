@@ -61,8 +61,9 @@ def main():
     output_file.parent.mkdir(exist_ok=True)
     
     import json
+    from result_normalization import export_response
     with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(result, f, ensure_ascii=False, indent=2)
+        json.dump(export_response(result), f, ensure_ascii=False, indent=2)
     
     print(f"\nFull results saved to: {output_file}")
 
@@ -0,0 +1,262 @@
+"""
+Result normalization for OCR outputs
+Converts raw EasyOCR / PaddleOCR / detectron2 outputs into contiguous NumPy
+arrays (polygons and scores) plus a list of texts in one pass.
+
+Region results stay in this array form through tiling, layout, fusion and
+MessagePack packing: "polygons" and "scores" arrays next to "texts" as a list
+of strings (fused results add "votes" and "sources"). The JSON-ready list of
+{"text", "confidence", "bbox"} dicts is only built where results are written
+out as JSON, by export_result() / export_response().
+
+Polygons are float64 arrays of shape (N, K, 2). Regions without a bbox have
+NaN coordinates and are serialized as an empty bbox list.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EMPTY_POLYGONS = np.empty((0, 4, 2), dtype=np.float64)
+EMPTY_SCORES = np.empty(0, dtype=np.float64)
+
+# Per-region fields of an array-form result besides polygons, scores and
+# texts, written into each text dict by export_result()
+EXTRA_REGION_FIELDS = ("votes", "sources")
+
+
+def _empty() -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    return EMPTY_POLYGONS.copy(), EMPTY_SCORES.copy(), []
+
+
+def stack_polygons(polygons: Sequence) -> np.ndarray:
+    """
+    Stack a sequence of polygons into one (N, K, 2) float64 array
+
+    Missing polygons (empty lists / None) become NaN rows. Ragged inputs
+    (different point counts) are padded by repeating each polygon's last point,
+    which leaves its bounds and area unchanged.
+    """
+    if len(polygons) == 0:
+        return EMPTY_POLYGONS.copy()
+
+    try:
+        stacked = np.asarray(polygons, dtype=np.float64)
+        if stacked.ndim == 3 and stacked.shape[2] == 2:
+            return stacked
+    except (ValueError, TypeError):
+        pass
+
+    # Slow path: ragged or partially missing polygons
+    arrays = [
+        np.asarray(p, dtype=np.float64).reshape(-1, 2) if p is not None and len(p) else None
+        for p in polygons
+    ]
+    num_points = max((len(a) for a in arrays if a is not None), default=4)
+    stacked = np.full((len(arrays), num_points, 2), np.nan, dtype=np.float64)
+    for i, array in enumerate(arrays):
+        if array is not None:
+            stacked[i, : len(array)] = array
+            stacked[i, len(array) :] = array[-1]
+    return stacked
+
+
+def normalize_easyocr(results: List) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    """
+    Normalize EasyOCR readtext() output
+
+    Args:
+        results: List of (bbox, text, confidence) tuples
+
+    Returns:
+        Tuple of (polygons (N, 4, 2), scores (N,), texts)
+    """
+    if not results:
+        return _empty()
+    boxes, texts, scores = zip(*results)
+    return (
+        stack_polygons(boxes),
+        np.asarray(scores, dtype=np.float64),
+        [str(text) for text in texts],
+    )
+
+
+def normalize_paddleocr(results) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    """
+    Normalize PaddleOCR ocr() output, old and new (3.x) formats
+
+    Empty texts are dropped from the new format; the old format keeps every
+    line, as the results always have.
+
+    Returns:
+        Tuple of (polygons (N, K, 2), scores (N,), texts)
+    """
+    if not results or len(results) == 0:
+        return _empty()
+    result = results[0]
+
+    # Check if it's the new format (dict with rec_texts, rec_scores, rec_polys)
+    if isinstance(result, dict) and "rec_texts" in result:
+        # New PaddleOCR 3.x format, parallel arrays
+        texts = [str(text) if text is not None else "" for text in result.get("rec_texts", [])]
+        n = len(texts)
+        scores = np.zeros(n, dtype=np.float64)
+        rec_scores = np.asarray(result.get("rec_scores", [])[:n], dtype=np.float64)
+        scores[: len(rec_scores)] = rec_scores
+        rec_polys = list(result.get("rec_polys", [])[:n])
+        rec_polys += [None] * (n - len(rec_polys))
+        polygons = stack_polygons(rec_polys)
+
+        # Skip empty texts
+        keep = np.fromiter((bool(t.strip()) for t in texts), dtype=bool, count=len(texts))
+        if not keep.all():
+            texts = [t for t, k in zip(texts, keep) if k]
+            polygons = polygons[keep]
+            scores = scores[keep]
+    elif isinstance(result, list):
+        # Old PaddleOCR format: list of [bbox, (text, confidence)]
+        lines = [line for line in result if isinstance(line, list) and len(line) >= 2]
+        if not lines:
+            return _empty()
+        texts = []
+        score_list = []
+        for line in lines:
+            text_data = line[1]
+            if isinstance(text_data, tuple) and len(text_data) >= 2:
+                texts.append(str(text_data[0]))
+                score_list.append(text_data[1])
+            else:
+                texts.append(str(text_data))
+                score_list.append(0.0)
+        scores = np.asarray(score_list, dtype=np.float64)
+        polygons = stack_polygons([line[0] for line in lines])
+    else:
+        return _empty()
+
+    return polygons, scores, texts
+
+
+def normalize_xyxy_boxes(boxes) -> np.ndarray:
+    """Convert (N, 4) x1, y1, x2, y2 boxes into (N, 4, 2) corner polygons"""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    x1, y1, x2, y2 = boxes.T
+    return np.stack(
+        [
+            np.stack([x1, y1], axis=1),
+            np.stack([x2, y1], axis=1),
+            np.stack([x2, y2], axis=1),
+            np.stack([x1, y2], axis=1),
+        ],
+        axis=1,
+    )
+
+
+def build_text_items(
+    polygons: np.ndarray,
+    scores: np.ndarray,
+    texts: List[str],
+    extra: Optional[Dict[str, Sequence]] = None,
+) -> List[Dict]:
+    """
+    Build the JSON-ready list of text results
+
+    All numbers are converted to Python floats in a single tolist() call per
+    array instead of one float() call per coordinate.
+
+    Args:
+        extra: Further per-region values added to each item, by field name
+    """
+    bbox_lists = polygons.tolist()
+    missing = np.isnan(polygons).any(axis=(1, 2)) if len(polygons) else []
+    for i in np.flatnonzero(missing):
+        bbox_lists[i] = []
+    items = [
+        {"text": text, "confidence": confidence, "bbox": bbox}
+        for text, confidence, bbox in zip(texts, scores.tolist(), bbox_lists)
+    ]
+    for field, values in (extra or {}).items():
+        if isinstance(values, np.ndarray):
+            values = values.tolist()
+        for item, value in zip(items, values):
+            item[field] = value
+    return items
+
+
+def is_array_result(result: Dict) -> bool:
+    """Whether a model result holds its regions as arrays (see module docstring)"""
+    return "polygons" in result
+
+
+def region_arrays(result: Dict) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    """
+    Polygons, scores and texts of a model result
+
+    Array-form results are returned as they are; results with a list of text
+    dicts (TrOCR, SwinTextSpotter, results read back from JSON) are converted.
+    """
+    if is_array_result(result):
+        return result["polygons"], result["scores"], result["texts"]
+    return texts_to_arrays(result.get("texts") or [])
+
+
+def take_regions(result: Dict, index) -> Dict:
+    """Copy of an array-form result with only the regions at index, in that order"""
+    index = np.asarray(index, dtype=np.int64)
+    taken = dict(result)
+    taken["polygons"] = result["polygons"][index]
+    taken["scores"] = result["scores"][index]
+    for field in ("texts",) + EXTRA_REGION_FIELDS:
+        if field in result:
+            values = result[field]
+            taken[field] = (
+                values[index]
+                if isinstance(values, np.ndarray)
+                else [values[i] for i in index.tolist()]
+            )
+    taken["num_detections"] = len(index)
+    return taken
+
+
+def export_result(result: Dict) -> Dict:
+    """
+    JSON-ready copy of a model result
+
+    The arrays of an array-form result are replaced by the list of
+    {"text", "confidence", "bbox"} dicts; other results are returned as they are.
+    """
+    if not is_array_result(result):
+        return result
+    exported = dict(result)
+    extra = {field: exported.pop(field) for field in EXTRA_REGION_FIELDS if field in exported}
+    exported["texts"] = build_text_items(
+        exported.pop("polygons"), exported.pop("scores"), result["texts"], extra
+    )
+    return exported
+
+
+def export_response(content: Dict) -> Dict:
+    """
+    JSON-ready copy of a test_all_models() result, an /ocr response or an
+    /ocr/batch response (see export_result)
+    """
+    content = dict(content)
+    if "results" in content:
+        content["results"] = [export_response(item) for item in content["results"]]
+    if "models" in content:
+        content["models"] = {
+            name: export_result(result) for name, result in content["models"].items()
+        }
+    if content.get("ensemble"):
+        content["ensemble"] = export_result(content["ensemble"])
+    return content
+
+
+def texts_to_arrays(texts: List[Dict]) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    """Inverse of build_text_items, for consumers that work on arrays"""
+    if not texts:
+        return _empty()
+    return (
+        stack_polygons([item.get("bbox") for item in texts]),
+        np.asarray([item.get("confidence", 0.0) for item in texts], dtype=np.float64),
+        [item.get("text", "") for item in texts],
+    )
@@ -0,0 +1,289 @@
+"""
+SQLite results store
+Keeps OCR results in one embedded database instead of one JSON file per
+image: one row per image and model, with indexes on the image hash, model
+and timestamp so lookups don't scan a directory.
+
+The database runs in WAL mode (readers don't block the writer) and rows are
+written in batches, one transaction per batch.
+
+Usage:
+    store = ResultsStore("ocr_results/results.db")
+    store.add(results)        # test_all_models() output
+    store.flush()
+    results = store.load_results(model="EasyOCR")
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    image_id TEXT NOT NULL,
+    image_path TEXT NOT NULL,
+    image_hash TEXT,
+    model TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    success INTEGER NOT NULL,
+    num_detections INTEGER,
+    full_text TEXT,
+    processing_time_ms REAL,
+    result TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_image_hash ON results (image_hash);
+CREATE INDEX IF NOT EXISTS results_model ON results (model, timestamp);
+CREATE INDEX IF NOT EXISTS results_timestamp ON results (timestamp);
+CREATE INDEX IF NOT EXISTS results_image_id ON results (image_id);
+"""
+
+# Results of the fused model are stored as their own model rows
+ENSEMBLE_MODEL = "Ensemble"
+
+
+def file_hash(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a file's content (hex)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 of in-memory content (hex), equal to file_hash of the same bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class ResultsStore:
+    """
+    Batched writer and reader for the results database
+
+    Args:
+        path: Database file
+        batch_size: Rows buffered before they are written in one transaction
+        flush_interval: Maximum seconds rows stay buffered; a timer thread
+            writes them when no later add() does
+    """
+
+    def __init__(
+        self,
+        path: str = "ocr_results/results.db",
+        batch_size: int = 200,
+        flush_interval: float = 2.0,
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        # One connection shared by the API's worker threads, guarded by the lock
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WAL with synchronous=NORMAL only syncs at checkpoints
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._pending: List[tuple] = []
+        self._pending_since: Optional[float] = None
+        self._flush_timer: Optional[threading.Timer] = None
+        self._closed = False
+        self.rows_written = 0
+        # Stored image and row counts, counted once here and kept up to date
+        # by _flush so stats() does not scan the table
+        self._image_count, self._row_count = self._conn.execute(
+            "SELECT COUNT(DISTINCT image_id), COUNT(*) FROM results"
+        ).fetchone()
+
+    def add(
+        self,
+        results: Dict,
+        image_id: Optional[str] = None,
+        image_hash: Optional[str] = None,
+    ):
+        """
+        Buffer the results of one image
+
+        Args:
+            results: Dictionary with "image_path", "timestamp", "models" and
+                optionally "ensemble" (test_all_models() output or an /ocr
+                response); each model's own "processing_time_ms" is stored
+            image_id: Unique image identifier (default: the image path)
+            image_hash: Content hash of the image (see file_hash)
+        """
+        image_path = results["image_path"]
+        image_id = image_id or image_path
+        timestamp = results.get("timestamp")
+        model_results = dict(results.get("models", {}))
+        if results.get("ensemble"):
+            model_results[ENSEMBLE_MODEL] = results["ensemble"]
+
+        rows = [
+            (
+                image_id,
+                image_path,
+                image_hash,
+                model_name,
+                timestamp,
+                int(bool(result.get("success"))),
+                result.get("num_detections"),
+                result.get("full_text"),
+                result.get("processing_time_ms"),
+                json.dumps(result, ensure_ascii=False),
+            )
+            for model_name, result in model_results.items()
+        ]
+        with self._lock:
+            if not self._pending:
+                self._pending_since = time.monotonic()
+                self._schedule_flush()
+            self._pending.extend(rows)
+            if (
+                len(self._pending) >= self.batch_size
+                or time.monotonic() - self._pending_since >= self.flush_interval
+            ):
+                self._flush()
+
+    def _schedule_flush(self):
+        """Start the timer that writes the buffered rows after flush_interval"""
+        if self._flush_timer is not None:
+            return
+        self._flush_timer = threading.Timer(self.flush_interval, self._timed_flush)
+        self._flush_timer.daemon = True
+        self._flush_timer.start()
+
+    def _timed_flush(self):
+        with self._lock:
+            self._flush_timer = None
+            if self._closed:
+                return
+            try:
+                self._flush()
+            except sqlite3.Error as e:
+                # Rows stay buffered for the next flush
+                print(f"Warning: results store flush failed: {e}")
+
+    def flush(self):
+        """Write all buffered rows"""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        new_images = {row[0] for row in self._pending}
+        image_ids = list(new_images)
+        # Images already stored (through the image_id index), in chunks below
+        # SQLite's bound parameter limit
+        for start in range(0, len(image_ids), 500):
+            chunk = image_ids[start : start + 500]
+            stored = self._conn.execute(
+                "SELECT DISTINCT image_id FROM results "
+                f"WHERE image_id IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall()
+            new_images.difference_update(image_id for (image_id,) in stored)
+        with self._conn:  # One transaction per batch
+            self._conn.executemany(
+                "INSERT INTO results (image_id, image_path, image_hash, model, timestamp, "
+                "success, num_detections, full_text, processing_time_ms, result) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self._pending,
+            )
+        self.rows_written += len(self._pending)
+        self._row_count += len(self._pending)
+        self._image_count += len(new_images)
+        self._pending = []
+        self._pending_since = None
+
+    def load_results(
+        self,
+        model: Optional[str] = None,
+        image_hash: Optional[str] = None,
+        since: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict]:
+        """
+        Read stored results grouped per image, oldest first
+
+        When an image was processed more than once, its latest result per
+        model is returned.
+
+        Args:
+            model: Only rows of this model
+            image_hash: Only images with this content hash
+            since: Only rows with a timestamp at or after this ISO timestamp
+            limit: Maximum number of images (most recent ones)
+
+        Returns:
+            List of dictionaries in the test_all_models() format (image_path,
+            timestamp, models, and ensemble when stored) plus image_id
+        """
+        self.flush()
+        conditions, params = [], []
+        if model is not None:
+            conditions.append("model = ?")
+            params.append(model)
+        if image_hash is not None:
+            conditions.append("image_hash = ?")
+            params.append(image_hash)
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        if limit is not None:
+            # The most recently written images, found through the index
+            recent = (
+                f"SELECT image_id FROM results {where} "
+                "GROUP BY image_id ORDER BY MAX(id) DESC LIMIT ?"
+            )
+            where = f"{where} {'AND' if where else 'WHERE'} image_id IN ({recent})"
+            params = params + params + [limit]
+
+        query = (
+            "SELECT image_id, image_path, timestamp, model, result FROM results "
+            f"{where} ORDER BY id"
+        )
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        images: Dict[str, Dict] = {}
+        for image_id, image_path, timestamp, model_name, result in rows:
+            image = images.get(image_id)
+            if image is None:
+                image = images[image_id] = {
+                    "image_id": image_id,
+                    "image_path": image_path,
+                    "models": {},
+                }
+            # Later rows of the same image replace earlier results
+            image["timestamp"] = timestamp
+            if model_name == ENSEMBLE_MODEL:
+                image["ensemble"] = json.loads(result)
+            else:
+                image["models"][model_name] = json.loads(result)
+
+        return list(images.values())
+
+    def stats(self) -> Dict:
+        """Stored counts from the in-memory counters (no query, safe on the event loop)"""
+        return {
+            "path": str(self.path),
+            "images": self._image_count,
+            "rows": self._row_count,
+            "pending_rows": len(self._pending),
+        }
+
+    def close(self):
+        """Write buffered rows and close the database"""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            self._flush()
+            self._closed = True
+            self._conn.close()
@@ -3,6 +3,7 @@ Server startup script with different configurations
 Run this script to start the OCR API server
 """
 
+import os
 import uvicorn
 import sys
 import argparse
@@ -40,8 +41,247 @@ def main():
         choices=["critical", "error", "warning", "info", "debug", "trace"],
         help="Log level (default: info)"
     )
+    parser.add_argument(
+        "--max-side",
+        type=int,
+        default=None,
+        help="Downscale input images so the longest side is at most this many pixels"
+    )
+    parser.add_argument(
+        "--max-pixels",
+        type=int,
+        default=None,
+        help="Downscale input images to at most this many pixels"
+    )
+    parser.add_argument(
+        "--tile-min-side",
+        type=int,
+        default=None,
+        help="Process images whose longest side is at least this many pixels in tiles"
+    )
+    parser.add_argument(
+        "--trocr-fast",
+        type=str,
+        default=None,
+        help="Comma-separated TrOCR fast-inference options: quantize, bf16, compile, onnx"
+    )
+    parser.add_argument(
+        "--trocr-decoding",
+        type=str,
+        default=None,
+        help="TrOCR decoding profile: default, greedy, short, beam"
+    )
+    parser.add_argument(
+        "--cpu-threads",
+        type=int,
+        default=None,
+        help="Total CPU threads for each worker process (default: all cores)"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help="Concurrent inference slots per worker; each gets cpu-threads / concurrency threads"
+    )
+    parser.add_argument(
+        "--warmup-sizes",
+        type=str,
+        default=None,
+        help="Comma-separated WxH sizes of the warm-up images (default: 640x480,1280x960)"
+    )
+    parser.add_argument(
+        "--no-warmup",
+        action="store_true",
+        help="Skip the model warm-up at startup"
+    )
+    parser.add_argument(
+        "--max-upload-mb",
+        type=float,
+        default=None,
+        help="Maximum upload size per image in MB (default: 25)"
+    )
+    parser.add_argument(
+        "--max-archive-mb",
+        type=float,
+        default=None,
+        help="Maximum archive size for /ocr/archive in MB (default: 2048)"
+    )
+    parser.add_argument(
+        "--max-queue",
+        type=int,
+        default=None,
+        help="Maximum number of requests waiting per model before new ones get 429 (default: 8)"
+    )
+    parser.add_argument(
+        "--queue-timeout",
+        type=float,
+        default=None,
+        help="Maximum queue wait in seconds before a request gets 503 (default: 10)"
+    )
+    parser.add_argument(
+        "--model-timeout",
+        type=float,
+        default=None,
+        help="Timeout per model in seconds, 0 to disable (default: 60)"
+    )
+    parser.add_argument(
+        "--request-timeout",
+        type=float,
+        default=None,
+        help="Timeout for all models of one request in seconds, 0 to disable (default: 120)"
+    )
+    parser.add_argument(
+        "--max-abandoned-calls",
+        type=int,
+        default=None,
+        help="Timed-out calls still running after which a model is reported unhealthy "
+        "and skipped until they return, 0 for no limit (default: 2)"
+    )
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="Reuse the results of earlier identical images (same content hash)"
+    )
+    parser.add_argument(
+        "--dedup-distance",
+        type=int,
+        default=None,
+        help="Maximum perceptual hash distance for reusing earlier results (default: 4)"
+    )
+    parser.add_argument(
+        "--dedup-perceptual",
+        action="store_true",
+        help="With --dedup, also reuse results of similar images without a content match"
+    )
+    parser.add_argument(
+        "--no-dedup",
+        action="store_true",
+        help="Disable result reuse (the default)"
+    )
+    parser.add_argument(
+        "--results-db",
+        type=str,
+        default=None,
+        help="SQLite database for the results history (default: ocr_results/results.db)"
+    )
+    parser.add_argument(
+        "--no-results-store",
+        action="store_true",
+        help="Keep no results history"
+    )
+    parser.add_argument(
+        "--memory-budget-mb",
+        type=float,
+        default=None,
+        help="Refuse new requests with 503 while the process uses more memory than this (default: no budget)"
+    )
+    parser.add_argument(
+        "--tracemalloc",
+        action="store_true",
+        help="Report the peak Python allocation of each request (slows down allocations)"
+    )
+    parser.add_argument(
+        "--no-single-flight",
+        action="store_true",
+        help="Run identical concurrent requests separately instead of sharing one run"
+    )
+    parser.add_argument(
+        "--profiling",
+        action="store_true",
+        help="Allow per-request profiling (/ocr?profile=true); set OCR_PROFILE_TOKEN to require a token"
+    )
+    parser.add_argument(
+        "--no-search-index",
+        action="store_true",
+        help="Do not index recognized text (disables /search)"
+    )
+    parser.add_argument(
+        "--search-capacity",
+        type=int,
+        default=None,
+        help="Maximum number of images in the search index, 0 for no limit (default: 100000)"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=None,
+        help="Images per batch for models that support batching (TrOCR) in /ocr/batch "
+        "and /ocr/archive (default: 8)"
+    )
+    parser.add_argument(
+        "--reader-pool-size",
+        type=int,
+        default=None,
+        help="Language-specific readers kept loaded per model besides the startup reader (default: 2)"
+    )
     
     args = parser.parse_args()
+
+    # Settings are passed to the app through the environment so they also
+    # reach reloaded / additional worker processes
+    if args.max_side:
+        os.environ["OCR_MAX_SIDE"] = str(args.max_side)
+    if args.max_pixels:
+        os.environ["OCR_MAX_PIXELS"] = str(args.max_pixels)
+    if args.tile_min_side:
+        os.environ["OCR_TILE_MIN_SIDE"] = str(args.tile_min_side)
+    if args.trocr_fast:
+        os.environ["OCR_TROCR_FAST"] = args.trocr_fast
+    if args.trocr_decoding:
+        os.environ["OCR_TROCR_DECODING"] = args.trocr_decoding
+    if args.warmup_sizes:
+        os.environ["OCR_WARMUP_SIZES"] = args.warmup_sizes
+    if args.no_warmup:
+        os.environ["OCR_WARMUP"] = "0"
+    if args.max_upload_mb:
+        os.environ["OCR_MAX_UPLOAD_MB"] = str(args.max_upload_mb)
+    if args.max_archive_mb:
+        os.environ["OCR_MAX_ARCHIVE_MB"] = str(args.max_archive_mb)
+    if args.max_queue is not None:
+        os.environ["OCR_MAX_QUEUE"] = str(args.max_queue)
+    if args.queue_timeout is not None:
+        os.environ["OCR_QUEUE_TIMEOUT"] = str(args.queue_timeout)
+    if args.model_timeout is not None:
+        os.environ["OCR_MODEL_TIMEOUT"] = str(args.model_timeout)
+    if args.request_timeout is not None:
+        os.environ["OCR_REQUEST_TIMEOUT"] = str(args.request_timeout)
+    if args.batch_size is not None:
+        os.environ["OCR_BATCH_SIZE"] = str(args.batch_size)
+    if args.max_abandoned_calls is not None:
+        os.environ["OCR_MAX_ABANDONED_CALLS"] = str(args.max_abandoned_calls)
+    if args.dedup_distance is not None:
+        os.environ["OCR_DEDUP_MAX_DISTANCE"] = str(args.dedup_distance)
+    if args.dedup:
+        os.environ["OCR_DEDUP"] = "1"
+    if args.dedup_perceptual:
+        os.environ["OCR_DEDUP_VERIFY"] = "0"
+    if args.no_dedup:
+        os.environ["OCR_DEDUP"] = "0"
+    if args.results_db:
+        os.environ["OCR_RESULTS_DB"] = args.results_db
+    if args.no_results_store:
+        os.environ["OCR_RESULTS_STORE"] = "0"
+    if args.memory_budget_mb is not None:
+        os.environ["OCR_MEMORY_BUDGET_MB"] = str(args.memory_budget_mb)
+    if args.tracemalloc:
+        os.environ["OCR_TRACEMALLOC"] = "1"
+    if args.no_single_flight:
+        os.environ["OCR_SINGLE_FLIGHT"] = "0"
+    if args.profiling:
+        os.environ["OCR_PROFILING"] = "1"
+    if args.no_search_index:
+        os.environ["OCR_SEARCH_INDEX"] = "0"
+    if args.search_capacity is not None:
+        os.environ["OCR_SEARCH_CAPACITY"] = str(args.search_capacity)
+    if args.reader_pool_size:
+        os.environ["OCR_READER_POOL_SIZE"] = str(args.reader_pool_size)
+    if args.concurrency:
+        os.environ["OCR_CONCURRENCY"] = str(args.concurrency)
+    if args.cpu_threads:
+        os.environ["OCR_CPU_THREADS"] = str(args.cpu_threads)
+    elif args.workers > 1 and not args.reload:
+        # Worker processes share the host, split the cores between them
+        os.environ["OCR_CPU_THREADS"] = str(max(1, (os.cpu_count() or 1) // args.workers))
     
     print("=" * 60)
     print("Starting OCR API Server")
@@ -0,0 +1,187 @@
+"""
+Fast response serialization for the OCR API
+Serializes the internally generated result dicts directly with orjson
+(native NumPy support) instead of validating them through pydantic models
+and encoding them with the stdlib json module.
+
+Clients can also request a compact MessagePack encoding with
+"Accept: application/msgpack" (schema in API_USAGE.md).
+"""
+
+import json
+from typing import Any, Dict, Optional
+
+import numpy as np
+from fastapi.responses import Response
+
+from result_normalization import EXTRA_REGION_FIELDS, export_response, region_arrays
+
+try:
+    import orjson
+
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import msgpack
+
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+# Bumped whenever the packed layout changes (2: the ensemble result is packed too)
+PACKED_FORMAT_VERSION = 2
+
+
+def _json_default(obj: Any):
+    """Fallback encoder for types the stdlib json module does not handle"""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize to UTF-8 JSON bytes, NumPy arrays and scalars included"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(
+            content,
+            default=_json_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        )
+    return json.dumps(
+        content,
+        default=_json_default,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    """
+    JSON response for trusted, internally generated payloads
+
+    Returning this from an endpoint bypasses FastAPI's response_model
+    validation and jsonable_encoder pass; the declared response_model is
+    still used for the OpenAPI docs. Array-form model results are turned
+    into their list of text dicts here (see result_normalization.py).
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(export_response(content) if isinstance(content, dict) else content)
+
+
+def pack_model_result(result: Dict) -> Dict:
+    """
+    Replace a model result's regions with packed arrays
+
+    "texts" becomes a list of strings, "confidences" a little-endian float32
+    array and "polygons" a little-endian float32 array of shape
+    (num_detections, points_per_polygon, 2). Missing bboxes are NaN. The
+    arrays of array-form results are packed as they are.
+    """
+    if "texts" not in result:
+        return result
+    polygons, scores, texts = region_arrays(result)
+    packed = dict(result)
+    packed.pop("scores", None)
+    packed["texts"] = texts
+    for field in EXTRA_REGION_FIELDS:
+        if isinstance(packed.get(field), np.ndarray):
+            packed[field] = packed[field].tolist()
+    packed["confidences"] = scores.astype("<f4").tobytes()
+    packed["polygons"] = polygons.astype("<f4").tobytes()
+    packed["points_per_polygon"] = int(polygons.shape[1])
+    return packed
+
+
+def pack_response(content: Dict) -> Dict:
+    """Pack every model result (and the ensemble) of an /ocr or /ocr/batch response"""
+    content = dict(content)
+    if "results" in content:
+        content["results"] = [pack_response(item) for item in content["results"]]
+    if "models" in content:
+        content["models"] = {
+            name: pack_model_result(result) for name, result in content["models"].items()
+        }
+    if content.get("ensemble"):
+        content["ensemble"] = pack_model_result(content["ensemble"])
+    content["format"] = "packed"
+    content["format_version"] = PACKED_FORMAT_VERSION
+    return content
+
+
+def unpack_model_result(result: Dict) -> Dict:
+    """Inverse of pack_model_result, returns NumPy arrays instead of bbox lists"""
+    if "polygons" not in result:
+        return result
+    unpacked = dict(result)
+    num_points = result.get("points_per_polygon", 4)
+    unpacked["confidences"] = np.frombuffer(result["confidences"], dtype="<f4")
+    unpacked["polygons"] = np.frombuffer(result["polygons"], dtype="<f4").reshape(
+        -1, num_points, 2
+    )
+    return unpacked
+
+
+def unpack_response(content: Dict) -> Dict:
+    """Inverse of pack_response, returns NumPy arrays instead of packed bytes"""
+    if "results" in content:
+        content["results"] = [unpack_response(item) for item in content["results"]]
+    if "models" in content:
+        content["models"] = {
+            name: unpack_model_result(result) for name, result in content["models"].items()
+        }
+    if content.get("ensemble"):
+        content["ensemble"] = unpack_model_result(content["ensemble"])
+    return content
+
+
+def decode_packed_response(data: bytes) -> Dict:
+    """Decode a MessagePack /ocr or /ocr/batch response into NumPy arrays"""
+    return unpack_response(msgpack.unpackb(data, raw=False))
+
+
+class MsgpackResponse(Response):
+    """MessagePack response with bboxes and confidences packed as float32 arrays"""
+
+    media_type = "application/msgpack"
+
+    def render(self, content: Any) -> bytes:
+        return msgpack.packb(
+            pack_response(content), default=_json_default, use_bin_type=True
+        )
+
+
+def wants_msgpack(accept: Optional[str]) -> bool:
+    """Check whether the Accept header asks for MessagePack over JSON"""
+    if not accept or not MSGPACK_AVAILABLE:
+        return False
+    best_type, best_q = None, -1.0
+    for part in accept.split(","):
+        fields = [f.strip() for f in part.split(";")]
+        media_type = fields[0].lower()
+        q = 1.0
+        for param in fields[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if q <= 0:
+            continue
+        if media_type in MSGPACK_MEDIA_TYPES + ("application/json",) and q > best_q:
+            best_type, best_q = media_type, q
+    return best_type in MSGPACK_MEDIA_TYPES
+
+
+def negotiate_response(content: Dict, accept: Optional[str] = None) -> Response:
+    """Build a JSON or MessagePack response according to the Accept header"""
+    if wants_msgpack(accept):
+        return MsgpackResponse(content)
+    return FastJSONResponse(content)
@@ -0,0 +1,77 @@
+"""
+In-flight request coalescing for the OCR API
+Concurrent requests for the same work (same image content, models and
+options) attach to one running computation and all receive its result, so
+client retries or many users uploading the same image at once run the models
+only once. Nothing is kept after the computation finishes; reusing results
+of earlier requests is the job of the near-duplicate index (image_hash.py).
+
+Settings are read from the environment:
+    OCR_SINGLE_FLIGHT: Set to 0 to run every request on its own
+        (default: enabled)
+"""
+
+import asyncio
+import os
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class SingleFlight:
+    """Shares one running computation between all callers with the same key"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def run(
+        self, key: Hashable, func: Callable[[], Awaitable]
+    ) -> Tuple[object, bool]:
+        """
+        Run func() unless a computation with the same key is in flight
+
+        The computation runs as its own task: a caller that is cancelled
+        (client disconnected) stops waiting without cancelling it for the
+        other callers. Exceptions are raised to every caller.
+
+        Args:
+            key: Identity of the work
+            func: Coroutine function doing the work, only called if no
+                computation with this key is running
+
+        Returns:
+            Tuple of the result and whether it was shared from another
+            caller's computation
+        """
+        task = self._calls.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            self.started += 1
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key: Hashable, task: asyncio.Future):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Retrieve the exception of a computation nobody waits for anymore
+        # so asyncio does not log it as never retrieved
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight": len(self._calls),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
+
+
+def load_single_flight() -> Optional[SingleFlight]:
+    """Build the request coalescer unless OCR_SINGLE_FLIGHT is disabled"""
+    if os.environ.get("OCR_SINGLE_FLIGHT", "1").lower() in ("0", "false", "no"):
+        return None
+    return SingleFlight()
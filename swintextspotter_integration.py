@@ -14,8 +14,8 @@ See README.md for detailed setup instructions.
 import os
 import sys
 from pathlib import Path
-import cv2
 import json
+import numpy as np
 from typing import Dict, Optional
 
 # Fix PIL.Image compatibility issue for Pillow 10.0+
@@ -47,7 +47,11 @@ def setup_swintextspotter_path():
 
 
 def test_swintextspotter(
-    image_path: str, config_path: str = None, weights_path: str = None
+    image_path: str,
+    config_path: str = None,
+    weights_path: str = None,
+    image=None,
+    as_arrays: bool = False,
 ) -> Dict:
     """
     Test SwinTextSpotter on an image
@@ -56,6 +60,10 @@ def test_swintextspotter(
         image_path: Path to input image
         config_path: Path to SwinTextSpotter config file
         weights_path: Path to model weights
+        image: Optional preloaded BGR image array (skips reading image_path)
+        as_arrays: Return the regions as "polygons" and "scores" arrays and
+            "texts" as strings (see result_normalization.py) instead of a
+            list of text dicts
 
     Returns:
         Dictionary with results
@@ -128,7 +136,10 @@ def test_swintextspotter(
         predictor = DefaultPredictor(cfg)
 
         # Read and process image
-        image = cv2.imread(image_path)
+        if image is None:
+            import cv2
+
+            image = cv2.imread(image_path)
         if image is None:
             return {
                 "model": "SwinTextSpotter",
@@ -142,28 +153,37 @@ def test_swintextspotter(
         # Extract text detections and recognitions
         instances = outputs["instances"]
 
-        texts = []
+        from result_normalization import (
+            EMPTY_POLYGONS,
+            EMPTY_SCORES,
+            build_text_items,
+            normalize_xyxy_boxes,
+        )
+
+        polygons, scores, rec_texts = EMPTY_POLYGONS.copy(), EMPTY_SCORES.copy(), []
         if hasattr(instances, "pred_boxes") and hasattr(instances, "rec_texts"):
             boxes = instances.pred_boxes.tensor.cpu().numpy()
-            rec_texts = instances.rec_texts if hasattr(instances, "rec_texts") else []
-            scores = (
-                instances.scores.cpu().numpy() if hasattr(instances, "scores") else []
-            )
-
-            for i, (box, text) in enumerate(zip(boxes, rec_texts)):
-                x1, y1, x2, y2 = box
-                bbox = [[x1, y1], [x2, y1], [x2, y2], [x1, y2]]
-                confidence = float(scores[i]) if len(scores) > i else 1.0
-
-                texts.append({"text": text, "confidence": confidence, "bbox": bbox})
-
-        return {
+            rec_texts = [str(t) for t in instances.rec_texts][: len(boxes)]
+            boxes = boxes[: len(rec_texts)]
+            scores = np.ones(len(rec_texts), dtype=np.float64)
+            if hasattr(instances, "scores"):
+                instance_scores = instances.scores.cpu().numpy()[: len(rec_texts)]
+                scores[: len(instance_scores)] = instance_scores
+            polygons = normalize_xyxy_boxes(boxes)
+
+        result = {
             "model": "SwinTextSpotter",
             "success": True,
-            "texts": texts,
-            "full_text": " ".join([t["text"] for t in texts]),
-            "num_detections": len(texts),
+            "texts": rec_texts,
+            "full_text": " ".join(rec_texts),
+            "num_detections": len(rec_texts),
         }
+        if as_arrays:
+            result["polygons"] = polygons
+            result["scores"] = scores
+        else:
+            result["texts"] = build_text_items(polygons, scores, rec_texts)
+        return result
 
     except ImportError as e:
         return {
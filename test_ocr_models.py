@@ -22,14 +22,33 @@ except ImportError:
 
 import os
 import sys
-import cv2
+import time
 import numpy as np
 from pathlib import Path
 import json
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime
 from typing import Dict, List, Tuple, Optional
 import warnings
 
+from preprocessing import load_image, open_image_source
+from image_hash import NearDuplicateIndex, compute_hashes
+from fusion import fuse_results
+from layout import apply_layout
+from text_index import TextIndex
+from results_store import ResultsStore, content_hash, file_hash
+from result_normalization import export_response, region_arrays
+from archive_ingest import iter_archive_images
+from profiling import inherit_profiler
+from tiling import compute_tiles, merge_tile_regions
+from thread_budget import configure_thread_budget
+from ocr_backends import (
+    BACKEND_REGISTRY,
+    OCRBackend,
+    parse_languages,
+    TORCH_AVAILABLE,
+)
+
 # Fix Windows console encoding for Unicode characters
 if sys.platform == "win32":
     try:
@@ -48,80 +67,149 @@ if sys.platform == "win32":
 
 warnings.filterwarnings("ignore")
 
-# Import torch (required for device detection)
-try:
-    import torch
+class OCRTester:
+    """Main class for testing different OCR models"""
 
-    TORCH_AVAILABLE = True
-except ImportError:
-    TORCH_AVAILABLE = False
-    print("Warning: PyTorch not available. Some features may not work.")
+    def __init__(
+        self,
+        output_dir: str = "ocr_results",
+        input_limits: Optional[Dict[str, Dict]] = None,
+        tiling: Optional[Dict] = None,
+        trocr_options: Optional[Dict] = None,
+        timeouts: Optional[Dict] = None,
+        max_abandoned_calls: int = 2,
+        dedup: Optional[Dict] = None,
+        reader_pool_size: int = 2,
+        ensemble: Optional[Dict] = None,
+        search_index: Optional[Dict] = None,
+        results_db: Optional[str] = None,
+        json_output: bool = True,
+        parquet_dir: Optional[str] = None,
+        batch_size: int = 8,
+    ):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(exist_ok=True)
 
-# Try importing all OCR libraries
-try:
-    import easyocr
+        # Per-model input size limits, e.g. {"EasyOCR": {"max_side": 1600}}
+        # A "default" entry applies to models without their own entry
+        self.input_limits = input_limits or {}
+
+        # Tiling settings for very large images, e.g.
+        # {"min_side": 4000, "tile_size": 1280, "overlap": 160, "max_workers": 4}
+        # Tiling is disabled unless min_side or min_pixels is set
+        self.tiling = tiling or {}
+
+        # Fast-inference options for TrOCR (see trocr_fast.py), e.g.
+        # {"quantize": True, "bf16": True, "parity_images": ["dataset/7.jpg"]}
+        self.trocr_options = trocr_options or {}
+
+        # Timeouts in seconds, e.g. {"default": 60, "SwinTextSpotter": 120,
+        # "request": 180}. Per-model entries override "default"; "request"
+        # bounds all models of one image together. No timeout when unset.
+        self.timeouts = timeouts or {}
+        # Worker threads for model calls with a timeout. A call that times out
+        # keeps its thread until it reaches its next deadline check, or until
+        # the model returns for backends that cannot stop early.
+        self._timeout_executor = None
+        # Images per predict_batch call of models that support batching (see
+        # test_images); 1 runs every image on its own
+        self.batch_size = max(1, batch_size)
+
+        # Abandoned calls (still running past their timeout) after which a
+        # model is reported unhealthy and new calls fail fast (0 = no limit)
+        self.max_abandoned_calls = max_abandoned_calls
+
+        # Reuse of results for near-duplicate images (see image_hash.py),
+        # e.g. {"max_distance": 4}. Disabled when None (the default).
+        self.dedup_index = (
+            NearDuplicateIndex(**dedup) if dedup is not None else None
+        )
 
-    EASYOCR_AVAILABLE = True
-except ImportError:
-    EASYOCR_AVAILABLE = False
-    print("Warning: EasyOCR not available")
+        # Inverted index of recognized text for search (see text_index.py),
+        # e.g. {"ngram_size": 3}. Disabled when None.
+        self.text_index = (
+            TextIndex(**search_index) if search_index is not None else None
+        )
 
-try:
-    from paddleocr import PaddleOCR
+        # SQLite results store (see results_store.py). process_images writes
+        # the per-image and combined JSON files only when json_output is set
+        # or no store is configured.
+        self.results_store = ResultsStore(results_db) if results_db else None
+        self.json_output = json_output or self.results_store is None
 
-    PADDLEOCR_AVAILABLE = True
-except ImportError:
-    PADDLEOCR_AVAILABLE = False
-    print("Warning: PaddleOCR not available")
+        # Columnar export of each process_images run (see parquet_export.py),
+        # disabled when None
+        self.parquet_dir = parquet_dir
 
-try:
-    from transformers import TrOCRProcessor, VisionEncoderDecoderModel
-    import torch
+        # Store initialization errors
+        self.init_errors = {}
 
-    TROCR_AVAILABLE = True
-except ImportError:
-    TROCR_AVAILABLE = False
-    print("Warning: TrOCR not available")
+        # Torch device, resolved on first use so torch is only imported when
+        # a backend needs it
+        self._device = None
+        self._device_resolved = False
 
-try:
-    # Try to import SwinTextSpotter integration
-    from swintextspotter_integration import (
-        test_swintextspotter,
-        setup_swintextspotter_path,
-    )
+        # Fusion of all models' regions into one result (see fusion.py), e.g.
+        # {"weights": {"PaddleOCR": 1.5}, "min_votes": 2}. Disabled when None.
+        self.ensemble = ensemble
 
-    SWINTEXTSPOTTER_AVAILABLE = setup_swintextspotter_path()
-except ImportError:
-    SWINTEXTSPOTTER_AVAILABLE = False
-    print("Warning: SwinTextSpotter requires separate setup (see README)")
+        # Number of extra language-specific readers (besides the startup
+        # reader) each multilingual backend keeps loaded
+        self.reader_pool_size = reader_pool_size
 
+        # One backend instance per registered OCR model (see ocr_backends.py)
+        self.backends: Dict[str, OCRBackend] = {
+            name: backend_cls(self) for name, backend_cls in BACKEND_REGISTRY.items()
+        }
 
-class OCRTester:
-    """Main class for testing different OCR models"""
+    @property
+    def device(self):
+        """Torch device (default to CPU, None if torch is not available)"""
+        if not self._device_resolved:
+            self._device_resolved = True
+            if TORCH_AVAILABLE:
+                import torch
 
-    def __init__(self, output_dir: str = "ocr_results"):
-        self.output_dir = Path(output_dir)
-        self.output_dir.mkdir(exist_ok=True)
+                self._device = torch.device(
+                    "cuda" if torch.cuda.is_available() else "cpu"
+                )
+                print(f"Using device: {self._device}")
+            else:
+                print("Using CPU (PyTorch not available)")
+        return self._device
 
-        # Initialize models
-        self.easyocr_reader = None
-        self.paddleocr_reader = None
-        self.trocr_processor = None
-        self.trocr_model = None
+    def uses_cuda(self) -> bool:
+        """Whether models should run on the GPU"""
+        return self.device is not None and self.device.type == "cuda"
 
-        # Store initialization errors
-        self.init_errors = {}
+    # Direct access to the loaded models, kept for existing scripts
+    @property
+    def easyocr_reader(self):
+        return self.backends["EasyOCR"].reader
 
-        # Set device (default to CPU if torch not available)
-        if TORCH_AVAILABLE:
-            self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        else:
-            self.device = None
+    @property
+    def paddleocr_reader(self):
+        return self.backends["PaddleOCR"].reader
 
-        if self.device:
-            print(f"Using device: {self.device}")
-        else:
-            print("Using CPU (PyTorch not available)")
+    @property
+    def trocr_processor(self):
+        return self.backends["TrOCR"].processor
+
+    @property
+    def trocr_model(self):
+        return self.backends["TrOCR"].model
+
+    @property
+    def trocr_fast_info(self):
+        return self.backends["TrOCR"].fast_info
+
+    def model_names(self) -> List[str]:
+        """Names of all registered OCR models"""
+        return list(self.backends)
+
+    def get_backend(self, model_name: str) -> OCRBackend:
+        """Get the backend for a model name (raises KeyError for unknown models)"""
+        return self.backends[model_name]
 
     def initialize_models(self):
         """Initialize all available OCR models"""
@@ -129,299 +217,520 @@ class OCRTester:
         print("Initializing OCR Models...")
         print("=" * 50)
 
-        # Initialize EasyOCR
-        if EASYOCR_AVAILABLE:
-            print("Initializing EasyOCR...")
-            try:
-                use_gpu = TORCH_AVAILABLE and torch.cuda.is_available()
-                self.easyocr_reader = easyocr.Reader(["en", "fa"], gpu=use_gpu)
-                print("[OK] EasyOCR initialized successfully")
-                self.init_errors["EasyOCR"] = None
-            except Exception as e:
-                error_msg = str(e)
-                print(f"[ERROR] EasyOCR initialization failed: {error_msg}")
-                self.easyocr_reader = None
-                self.init_errors["EasyOCR"] = error_msg
-        else:
-            self.init_errors["EasyOCR"] = "EasyOCR library not installed"
-
-        # Initialize PaddleOCR
-        if PADDLEOCR_AVAILABLE:
-            print("Initializing PaddleOCR...")
-            try:
-                # Try different parameter combinations for different PaddleOCR versions
-                # Newer versions (3.x) don't support use_gpu or use_angle_cls
-                try:
-                    # Try with use_gpu and use_angle_cls (older versions)
-                    use_gpu = TORCH_AVAILABLE and torch.cuda.is_available()
-                    self.paddleocr_reader = PaddleOCR(
-                        use_angle_cls=True, lang="en", use_gpu=use_gpu
-                    )
-                except (TypeError, ValueError, Exception) as e:
-                    error_str = str(e)
-                    # If error mentions use_gpu or use_angle_cls, try without them
-                    if (
-                        "use_gpu" in error_str
-                        or "use_angle_cls" in error_str
-                        or "Unknown argument" in error_str
-                    ):
-                        # Try with just lang parameter (newer versions)
-                        self.paddleocr_reader = PaddleOCR(lang="en")
-                    else:
-                        # Re-raise if it's a different error
-                        raise
-                print("[OK] PaddleOCR initialized successfully")
-                self.init_errors["PaddleOCR"] = None
-            except Exception as e:
-                error_msg = str(e)
-                print(f"[ERROR] PaddleOCR initialization failed: {error_msg}")
-                self.paddleocr_reader = None
-                self.init_errors["PaddleOCR"] = error_msg
-        else:
-            self.init_errors["PaddleOCR"] = "PaddleOCR library not installed"
-
-        # Initialize TrOCR
-        if TROCR_AVAILABLE:
-            print("Initializing TrOCR...")
-            try:
-                if not TORCH_AVAILABLE or self.device is None:
-                    error_msg = "TrOCR requires PyTorch"
-                    print(f"✗ {error_msg}")
-                    self.trocr_processor = None
-                    self.trocr_model = None
-                    self.init_errors["TrOCR"] = error_msg
-                else:
-                    processor_name = "microsoft/trocr-base-printed"
-                    model_name = "microsoft/trocr-base-printed"
-
-                    self.trocr_processor = TrOCRProcessor.from_pretrained(
-                        processor_name
-                    )
-                    self.trocr_model = VisionEncoderDecoderModel.from_pretrained(
-                        model_name
-                    )
-                    self.trocr_model.to(self.device)
-                    self.trocr_model.eval()
-                    print("[OK] TrOCR initialized successfully")
-                    self.init_errors["TrOCR"] = None
-            except Exception as e:
-                error_msg = str(e)
-                print(f"[ERROR] TrOCR initialization failed: {error_msg}")
-                self.trocr_processor = None
-                self.trocr_model = None
-                self.init_errors["TrOCR"] = error_msg
-        else:
-            self.init_errors["TrOCR"] = "TrOCR library not installed"
+        for name, backend in self.backends.items():
+            if backend.preloaded:
+                backend.load()
+            self.init_errors[name] = backend.error
 
+        self.print_startup_report()
         print("=" * 50 + "\n")
 
+    def warm_up_models(
+        self, sizes: List[Tuple[int, int]] = [(640, 480), (1280, 960)]
+    ) -> Dict[str, Dict]:
+        """
+        Run every loaded model on synthetic images of representative sizes
+
+        The first call to each model pays for lazy allocations, kernel
+        selection and library first-run overhead; warming up moves that cost
+        to startup.
+
+        Args:
+            sizes: (width, height) of the synthetic warm-up images
+
+        Returns:
+            Dictionary mapping model name to {"WxH": milliseconds}
+        """
+        timings = {}
+        for name, backend in self.backends.items():
+            # Backends that are not preloaded would be set up by the warm-up itself
+            if not backend.preloaded or not backend.loaded:
+                continue
+            print(f"Warming up {name}...")
+            timings[name] = backend.warm_up(sizes)
+        return timings
+
+    def startup_report(self) -> Dict[str, Dict]:
+        """Import and load time per backend in milliseconds"""
+        return {name: backend.startup_timing() for name, backend in self.backends.items()}
+
+    def print_startup_report(self):
+        """Print the per-backend startup timing breakdown"""
+        print("-" * 50)
+        print(f"{'Model':<18}{'Import (ms)':>14}{'Load (ms)':>14}")
+        for name, timing in self.startup_report().items():
+            import_ms = timing["import_ms"] if timing["import_ms"] is not None else "-"
+            load_ms = timing["load_ms"] if timing["load_ms"] is not None else "-"
+            print(f"{name:<18}{import_ms:>14}{load_ms:>14}")
+
+    def _prepare_input(self, model_name: str, image_path: str):
+        """
+        Prepare the model input for an image according to the model's size limits
+
+        Returns:
+            Tuple of (model input, (scale_x, scale_y)). The input is the original
+            path when no limit is configured, otherwise an RGB array downscaled
+            to fit the limits. The scale maps output coordinates back to the
+            original image. Arrays are passed through unchanged; encoded image
+            bytes (archive members) are always decoded to an array.
+        """
+        if isinstance(image_path, np.ndarray):
+            return image_path, (1.0, 1.0)
+
+        limits = self.input_limits.get(model_name, self.input_limits.get("default"))
+        if not limits or not (limits.get("max_side") or limits.get("max_pixels")):
+            if isinstance(image_path, bytes):
+                return load_image(image_path)
+            return image_path, (1.0, 1.0)
+
+        return load_image(
+            image_path,
+            max_side=limits.get("max_side"),
+            max_pixels=limits.get("max_pixels"),
+        )
+
     def test_easyocr(self, image_path: str) -> Dict:
         """Test EasyOCR on an image"""
-        if not self.easyocr_reader:
-            return {
-                "model": "EasyOCR",
-                "success": False,
-                "error": "EasyOCR not initialized",
-            }
-
-        try:
-            results = self.easyocr_reader.readtext(image_path)
-
-            extracted_texts = []
-            for bbox, text, confidence in results:
-                # Convert numpy types to native Python types for JSON serialization
-                bbox_list = [[float(x), float(y)] for x, y in bbox]
-                extracted_texts.append(
-                    {"text": text, "confidence": float(confidence), "bbox": bbox_list}
-                )
-
-            return {
-                "model": "EasyOCR",
-                "success": True,
-                "texts": extracted_texts,
-                "full_text": " ".join([item["text"] for item in extracted_texts]),
-                "num_detections": len(extracted_texts),
-            }
-        except Exception as e:
-            return {"model": "EasyOCR", "success": False, "error": str(e)}
+        return self.backends["EasyOCR"].predict(image_path)
 
     def test_paddleocr(self, image_path: str) -> Dict:
         """Test PaddleOCR on an image"""
-        if not self.paddleocr_reader:
-            return {
-                "model": "PaddleOCR",
-                "success": False,
-                "error": "PaddleOCR not initialized",
-            }
-
-        try:
-            # Try with cls parameter first (older versions), fallback without it (newer versions)
-            try:
-                results = self.paddleocr_reader.ocr(image_path, cls=True)
-            except (TypeError, ValueError) as e:
-                # Newer versions don't support cls parameter
-                if "cls" in str(e) or "Unknown argument" in str(e):
-                    results = self.paddleocr_reader.ocr(image_path)
-                else:
-                    raise
-
-            extracted_texts = []
-            if results and len(results) > 0:
-                result = results[0]
-                
-                # Check if it's the new format (dict with rec_texts, rec_scores, rec_polys)
-                if isinstance(result, dict) and 'rec_texts' in result:
-                    # New PaddleOCR 3.x format
-                    rec_texts = result.get('rec_texts', [])
-                    rec_scores = result.get('rec_scores', [])
-                    rec_polys = result.get('rec_polys', [])
-                    
-                    for i, text in enumerate(rec_texts):
-                        if text and text.strip():  # Skip empty texts
-                            confidence = rec_scores[i] if i < len(rec_scores) else 0.0
-                            bbox = rec_polys[i] if i < len(rec_polys) else []
-                            
-                            # Convert bbox to list format - check if bbox is not empty before accessing
-                            if len(bbox) > 0:
-                                if hasattr(bbox, 'tolist'):
-                                    bbox_list = bbox.tolist()
-                                elif isinstance(bbox, (list, tuple)) and len(bbox) > 0 and isinstance(bbox[0], (list, tuple)):
-                                    bbox_list = [[float(x), float(y)] for x, y in bbox]
-                                else:
-                                    bbox_list = bbox if isinstance(bbox, list) else []
-                            else:
-                                bbox_list = []
-                            
-                            extracted_texts.append({
-                                "text": str(text),
-                                "confidence": float(confidence),
-                                "bbox": bbox_list,
-                            })
-                else:
-                    # Old PaddleOCR format: list of [bbox, (text, confidence)]
-                    for line in result if isinstance(result, list) else []:
-                        if isinstance(line, list) and len(line) >= 2:
-                            bbox = line[0]
-                            text_data = line[1]
-                            
-                            if isinstance(text_data, tuple) and len(text_data) >= 2:
-                                text, confidence = text_data[0], text_data[1]
-                            else:
-                                text, confidence = text_data, 0.0
-                            
-                            # Convert numpy types to native Python types for JSON serialization
-                            # Check if bbox is not empty before accessing bbox[0]
-                            if len(bbox) > 0 and isinstance(bbox[0], (list, tuple)):
-                                bbox_list = [[float(x), float(y)] for x, y in bbox]
-                            else:
-                                bbox_list = bbox if bbox else []
-                            
-                            extracted_texts.append({
-                                "text": str(text),
-                                "confidence": float(confidence),
-                                "bbox": bbox_list,
-                            })
-
-            return {
-                "model": "PaddleOCR",
-                "success": True,
-                "texts": extracted_texts,
-                "full_text": " ".join([item["text"] for item in extracted_texts]),
-                "num_detections": len(extracted_texts),
-            }
-        except Exception as e:
-            return {"model": "PaddleOCR", "success": False, "error": str(e)}
+        return self.backends["PaddleOCR"].predict(image_path)
 
     def test_trocr(self, image_path: str) -> Dict:
         """Test TrOCR on an image"""
-        if not self.trocr_processor or not self.trocr_model:
-            return {
-                "model": "TrOCR",
-                "success": False,
-                "error": "TrOCR not initialized",
-            }
+        return self.backends["TrOCR"].predict(image_path)
 
-        try:
-            if not TORCH_AVAILABLE or self.device is None:
-                return {
-                    "model": "TrOCR",
-                    "success": False,
-                    "error": "PyTorch not available. TrOCR requires PyTorch.",
-                }
+    def test_swintextspotter(
+        self, image_path: str, config_path: str = None, weights_path: str = None
+    ) -> Dict:
+        """Test SwinTextSpotter on an image"""
+        return self.backends["SwinTextSpotter"].predict(
+            image_path, config_path=config_path, weights_path=weights_path
+        )
 
-            from PIL import Image
+    def run_order(self) -> List[str]:
+        """Model names in the order test_all_models runs them"""
+        # Order: PaddleOCR, TrOCR, SwinTextSpotter, EasyOCR, then any other backends
+        preferred = ["PaddleOCR", "TrOCR", "SwinTextSpotter", "EasyOCR"]
+        return [name for name in preferred if name in self.backends] + [
+            name for name in self.backends if name not in preferred
+        ]
 
-            image = Image.open(image_path).convert("RGB")
+    def run_model(
+        self,
+        model_name: str,
+        image_path: str,
+        tiled: Optional[bool] = None,
+        deadline: Optional[float] = None,
+        lang: Optional[str] = None,
+    ) -> Dict:
+        """
+        Run one model on an image, using tiled processing for very large images
+        when the model detects text regions
+
+        Args:
+            model_name: Registered model name
+            image_path: Path to input image
+            tiled: Whether the image needs tiling (checked from the image if None)
+            deadline: time.monotonic() value after which the model gives up
+            lang: Comma-separated language codes (default: the model's
+                startup languages). Ignored by English-only models.
+        """
+        backend = self.backends[model_name]
+        if not backend.healthy():
+            return backend._unhealthy_error()
+        call_id = backend.begin_call(deadline)
+        try:
+            if backend.detects_regions:
+                if tiled is None:
+                    tiled = self.should_tile(image_path)
+                if tiled:
+                    return self.test_tiled(
+                        model_name, image_path, deadline=deadline, lang=lang
+                    )
+            return backend.predict(image_path, deadline=deadline, lang=lang)
+        finally:
+            backend.end_call(call_id)
 
-            # TrOCR works best on cropped text regions
-            # For full image, we'll use the entire image
-            pixel_values = self.trocr_processor(image, return_tensors="pt").pixel_values
-            pixel_values = pixel_values.to(self.device)
+    def model_timeout(self, model_name: str) -> Optional[float]:
+        """Timeout in seconds for one model (None = no timeout)"""
+        return self.timeouts.get(model_name, self.timeouts.get("default"))
 
-            with torch.no_grad():
-                generated_ids = self.trocr_model.generate(pixel_values)
-                generated_text = self.trocr_processor.batch_decode(
-                    generated_ids, skip_special_tokens=True
-                )[0]
+    def run_model_with_timeout(
+        self,
+        model_name: str,
+        image_path: str,
+        tiled: Optional[bool] = None,
+        timeout: Optional[float] = None,
+        lang: Optional[str] = None,
+    ) -> Dict:
+        """
+        Run one model and stop waiting for it after a timeout
+
+        Python threads cannot be killed, so the model call is abandoned rather
+        than stopped: it gets a deadline and its result is discarded. Tiled
+        calls skip their remaining tiles and TrOCR stops decoding once the
+        deadline passes; the other backends keep their worker thread until
+        the model returns. A model with max_abandoned_calls such calls still
+        running is unhealthy and fails fast (see OCRBackend.healthy).
+
+        Returns:
+            The model result, or an error result with "timed_out": True
+            ("unhealthy": True when the model was not run)
+        """
+        if timeout is None:
+            return self.run_model(model_name, image_path, tiled=tiled, lang=lang)
+
+        backend = self.backends[model_name]
+        if timeout <= 0:
+            return backend._timeout_error(
+                f"{model_name} skipped, request timeout reached"
+            )
+        if not backend.healthy():
+            return backend._unhealthy_error()
+        if self._timeout_executor is None:
+            # Room for the abandoned calls each model may hold plus one
+            # running call per model
+            self._timeout_executor = ThreadPoolExecutor(
+                max_workers=max(4, (self.max_abandoned_calls + 1) * len(self.backends)),
+                thread_name_prefix="ocr-model",
+            )
+        deadline = time.monotonic() + timeout
+        future = self._timeout_executor.submit(
+            inherit_profiler(self.run_model), model_name, image_path, tiled, deadline, lang
+        )
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # Only drops a call that has not started yet; a running call is
+            # left to finish in the background
+            future.cancel()
+            return backend._timeout_error(
+                f"{model_name} timed out after {timeout:g} s"
+            )
+
+    def run_model_batch(
+        self,
+        model_name: str,
+        images: List,
+        timeout: Optional[float] = None,
+        lang: Optional[str] = None,
+    ) -> List[Dict]:
+        """
+        Run one model on several images
+
+        Backends that support batching (TrOCR) get one predict_batch call,
+        the others (and images that need tiling) run image by image.
+
+        Args:
+            timeout: Timeout per image; a batch call gets timeout * len(images)
+
+        Returns:
+            One result per image, each with its share of the time as
+            processing_time_ms
+        """
+        backend = self.backends[model_name]
+        if (
+            not backend.supports_batch
+            or len(images) < 2
+            or (backend.detects_regions and any(self.should_tile(image) for image in images))
+        ):
+            results = []
+            for image in images:
+                start = time.perf_counter()
+                result = self.run_model_with_timeout(model_name, image, timeout=timeout, lang=lang)
+                result["processing_time_ms"] = round((time.perf_counter() - start) * 1000, 2)
+                results.append(result)
+            return results
+
+        if not backend.healthy():
+            return [backend._unhealthy_error() for _ in images]
+        deadline = time.monotonic() + timeout * len(images) if timeout is not None else None
+        call_id = backend.begin_call(deadline)
+        start = time.perf_counter()
+        try:
+            results = backend.predict_batch(images, deadline=deadline, lang=lang)
+        finally:
+            backend.end_call(call_id)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        for result in results:
+            result["processing_time_ms"] = round(elapsed_ms / len(images), 2)
+        return results
 
-            return {
-                "model": "TrOCR",
-                "success": True,
-                "texts": [{"text": generated_text, "confidence": 1.0}],
-                "full_text": generated_text,
-                "num_detections": 1,
-                "note": "TrOCR processes full image as single text region",
-            }
+    @staticmethod
+    def _reuse_key(model_name: str, lang: Optional[str]) -> str:
+        """Results are only reused for the same language selection"""
+        languages = parse_languages(lang)
+        return f"{model_name}@{'+'.join(languages)}" if languages else model_name
+
+    def find_reusable_results(
+        self, image_path: str, model_names: List[str], lang: Optional[str] = None
+    ) -> Tuple[Optional[Dict], Dict[str, Dict]]:
+        """
+        Look up results of a near-duplicate image processed before
+
+        Returns:
+            Tuple of (perceptual hashes of the image, reusable results by
+            model name). The hashes are None when reuse is disabled or the
+            image could not be hashed.
+        """
+        if self.dedup_index is None:
+            return None, {}
+        try:
+            hashes = compute_hashes(image_path)
         except Exception as e:
-            return {"model": "TrOCR", "success": False, "error": str(e)}
+            print(f"[WARNING] Could not hash {image_path}: {e}")
+            return None, {}
+        keys = {self._reuse_key(name, lang): name for name in model_names}
+        reused = self.dedup_index.lookup(hashes, keys)
+        return hashes, {keys[key]: result for key, result in reused.items()}
 
-    def test_swintextspotter(
-        self, image_path: str, config_path: str = None, weights_path: str = None
-    ) -> Dict:
-        """Test SwinTextSpotter on an image"""
-        try:
-            from swintextspotter_integration import test_swintextspotter
+    def remember_results(
+        self,
+        hashes: Optional[Dict],
+        results: Dict[str, Dict],
+        lang: Optional[str] = None,
+    ):
+        """Index the model results of an image for near-duplicate reuse"""
+        if self.dedup_index is not None and hashes is not None:
+            self.dedup_index.add(
+                hashes,
+                {self._reuse_key(model, lang): result for model, result in results.items()},
+            )
+
+    def index_results(
+        self,
+        image_id: str,
+        results: Dict[str, Dict],
+        name: Optional[str] = None,
+        fused: Optional[Dict] = None,
+    ):
+        """Add the model results (and fused result) of an image to the search index"""
+        if self.text_index is None:
+            return
+        if fused is not None:
+            results = dict(results, Ensemble=fused)
+        self.text_index.add(image_id, results, name=name)
+
+    def should_tile(self, image_path: str) -> bool:
+        """Check whether an image is large enough to be processed in tiles"""
+        min_side = self.tiling.get("min_side")
+        min_pixels = self.tiling.get("min_pixels")
+        if not (min_side or min_pixels):
+            return False
+
+        from PIL import Image
+
+        # Only the header is read here, not the pixel data
+        with Image.open(open_image_source(image_path)) as img:
+            width, height = img.size
+        return bool(
+            (min_side and max(width, height) >= min_side)
+            or (min_pixels and width * height >= min_pixels)
+        )
 
-            return test_swintextspotter(image_path, config_path, weights_path)
-        except ImportError:
+    def test_tiled(
+        self,
+        model_name: str,
+        image_path: str,
+        tile_size: Optional[int] = None,
+        overlap: Optional[int] = None,
+        max_workers: Optional[int] = None,
+        deadline: Optional[float] = None,
+        lang: Optional[str] = None,
+    ) -> Dict:
+        """
+        Test a detection model on a large image by splitting it into overlapping tiles
+
+        Tiles are processed in parallel at full resolution, their boxes are
+        translated back to image coordinates and duplicates across tile seams
+        are merged with polygon NMS. Tiles not started before the deadline
+        are skipped and the merged result is marked as timed out.
+        """
+        backend = self.backends[model_name]
+        if not backend.detects_regions:
             return {
-                "model": "SwinTextSpotter",
+                "model": model_name,
                 "success": False,
-                "error": "SwinTextSpotter requires separate setup. See README for installation instructions.",
-                "note": "SwinTextSpotter needs detectron2 and model weights. Check SwinTextSpotter repository for setup.",
+                "error": f"{model_name} does not support tiled processing",
             }
 
-    def test_all_models(self, image_path: str) -> Dict:
-        """Test all available models on a single image"""
-        print(f"\nTesting image: {image_path}")
+        tile_size = tile_size or self.tiling.get("tile_size", 1280)
+        overlap = overlap or self.tiling.get("overlap", 160)
+        max_workers = max_workers or self.tiling.get("max_workers") or os.cpu_count()
+        if not backend.thread_safe:
+            max_workers = 1
+
+        try:
+            image, _ = load_image(image_path)
+            height, width = image.shape[:2]
+            tiles = compute_tiles(width, height, tile_size, overlap)
+
+            def run_tile(window):
+                x0, y0, x1, y1 = window
+                return window, backend.predict(
+                    np.ascontiguousarray(image[y0:y1, x0:x1]),
+                    deadline=deadline,
+                    lang=lang,
+                    layout=False,
+                )
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                tile_outputs = list(executor.map(inherit_profiler(run_tile), tiles))
+
+            succeeded = [(w, r) for w, r in tile_outputs if r.get("success")]
+            timed_out = any(r.get("timed_out") for _, r in tile_outputs)
+            if not succeeded:
+                return tile_outputs[0][1]
+
+            polygons, scores, texts = merge_tile_regions(
+                [(window, region_arrays(result)) for window, result in succeeded],
+                iou_threshold=self.tiling.get("iou_threshold", 0.5),
+            )
+            return apply_layout(
+                {
+                    "model": model_name,
+                    "success": True,
+                    "polygons": polygons,
+                    "scores": scores,
+                    "texts": texts,
+                    "full_text": " ".join(texts),
+                    "num_detections": len(texts),
+                    "num_tiles": len(tiles),
+                    "failed_tiles": len(tile_outputs) - len(succeeded),
+                    "timed_out": timed_out,
+                }
+            )
+        except Exception as e:
+            return {"model": model_name, "success": False, "error": str(e)}
+
+    def test_all_models(
+        self,
+        image_path,
+        lang: Optional[str] = None,
+        name: Optional[str] = None,
+        precomputed: Optional[Dict[str, Dict]] = None,
+    ) -> Dict:
+        """
+        Test all available models on a single image
+
+        Args:
+            image_path: Path to input image, or encoded image bytes (archive
+                member) together with name
+            lang: Comma-separated language codes (default: each model's
+                startup languages)
+            name: Image name stored as image_path in the results (default:
+                image_path)
+            precomputed: Results of models already run on this image as part
+                of a batch (see test_images), by model name
+
+        Returns:
+            Dictionary with image_path, timestamp, models (and ensemble).
+            Region results are in array form; export_response() in
+            result_normalization.py converts them to JSON-ready dicts.
+        """
+        precomputed = precomputed or {}
+        name = name or str(image_path)
+        print(f"\nTesting image: {name}")
         print("-" * 50)
 
         results = {
-            "image_path": str(image_path),
+            "image_path": name,
             "timestamp": datetime.now().isoformat(),
             "models": {},
         }
 
-        # Test all models - always attempt all models (they handle errors internally)
-        # Order: PaddleOCR, TrOCR, SwinTextSpotter, EasyOCR
-        print("Running PaddleOCR...")
-        results["models"]["PaddleOCR"] = self.test_paddleocr(image_path)
+        # Near-duplicates of earlier images reuse their results
+        hashes, reused = self.find_reusable_results(
+            image_path, self.run_order(), lang=lang
+        )
 
-        print("Running TrOCR...")
-        results["models"]["TrOCR"] = self.test_trocr(image_path)
+        # Very large images are split into tiles for the detection models
+        tiled = self.should_tile(image_path)
+        if tiled:
+            print("Large image, using tiled processing")
 
-        print("Running SwinTextSpotter...")
-        results["models"]["SwinTextSpotter"] = self.test_swintextspotter(image_path)
+        # The request timeout bounds all models together; a model that times
+        # out is marked as such and the remaining models still run
+        request_timeout = self.timeouts.get("request")
+        request_deadline = (
+            time.monotonic() + request_timeout if request_timeout is not None else None
+        )
 
-        print("Running EasyOCR...")
-        results["models"]["EasyOCR"] = self.test_easyocr(image_path)
+        # Test all models - always attempt all models (they handle errors internally)
+        for model_name in self.run_order():
+            if model_name in reused:
+                print(
+                    f"Reusing {model_name} results of an earlier image "
+                    f"(distance {reused[model_name]['reused_from']['distance']})"
+                )
+                results["models"][model_name] = reused[model_name]
+                continue
+            if model_name in precomputed:
+                results["models"][model_name] = precomputed[model_name]
+                continue
+            print(f"Running {model_name}...")
+            timeout = self.model_timeout(model_name)
+            if request_deadline is not None:
+                remaining = request_deadline - time.monotonic()
+                timeout = remaining if timeout is None else min(timeout, remaining)
+            start = time.perf_counter()
+            results["models"][model_name] = self.run_model_with_timeout(
+                model_name, image_path, tiled=tiled, timeout=timeout, lang=lang
+            )
+            results["models"][model_name]["processing_time_ms"] = round(
+                (time.perf_counter() - start) * 1000, 2
+            )
+
+        self.remember_results(hashes, results["models"], lang=lang)
+
+        if self.ensemble is not None:
+            results["ensemble"] = fuse_results(results["models"], **self.ensemble)
 
         return results
 
+    def test_images(
+        self, images: List, lang: Optional[str] = None, names: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """
+        Test all available models on several images
+
+        Models that support batching run once on all images (see
+        run_model_batch), the others image by image in test_all_models.
+
+        Args:
+            images: Image paths, or encoded image bytes together with names
+            lang: Comma-separated language codes
+            names: Image names stored as image_path in the results
+
+        Returns:
+            One test_all_models() result per image
+        """
+        names = names or [str(image) for image in images]
+        batched = {}
+        if len(images) > 1:
+            for model_name in self.run_order():
+                if self.backends[model_name].supports_batch:
+                    print(f"\nRunning {model_name} on {len(images)} images in one batch...")
+                    batched[model_name] = self.run_model_batch(
+                        model_name, images, timeout=self.model_timeout(model_name), lang=lang
+                    )
+        return [
+            self.test_all_models(
+                image,
+                lang=lang,
+                name=name,
+                precomputed={model_name: results[index] for model_name, results in batched.items()},
+            )
+            for index, (image, name) in enumerate(zip(images, names))
+        ]
+
     def process_images(
         self,
         image_dir: str = "dataset",
         extensions: List[str] = [".jpg", ".jpeg", ".png", ".JPG", ".PNG"],
+        lang: Optional[str] = None,
     ):
         """Process all images in a directory (default: dataset/)"""
         image_dir = Path(image_dir)
@@ -447,37 +756,281 @@ class OCRTester:
 
         print(f"\nFound {len(image_files)} images to process")
 
+        exporter = self._parquet_exporter()
+
+        all_results = []
+        image_files = sorted(image_files)
+        for start in range(0, len(image_files), self.batch_size):
+            batch = [str(img_path) for img_path in image_files[start : start + self.batch_size]]
+            for img_path, results in zip(batch, self.test_images(batch, lang=lang)):
+                all_results.append(self._save_image_results(results, file_hash(img_path), exporter))
+
+        return self._finish_run(all_results, exporter)
+
+    def _parquet_exporter(self):
+        """ParquetExporter for one run, or None when parquet_dir is not set"""
+        if self.parquet_dir is None:
+            return None
+        # Imported here so pyarrow is only loaded when exporting
+        from parquet_export import ParquetExporter
+
+        return ParquetExporter(self.parquet_dir)
+
+    def process_archive(self, archive_path: str, lang: Optional[str] = None):
+        """
+        Process all images in a tar (.tar, .tar.gz, .tar.bz2, .tar.xz) or zip
+        archive
+
+        Members are decompressed one at a time and processed from memory in
+        batches of batch_size, nothing is extracted to disk. Results are
+        named after the member path.
+        """
+        print(f"\nProcessing images from {archive_path}")
+
+        exporter = self._parquet_exporter()
+
         all_results = []
-        for img_path in sorted(image_files):
-            results = self.test_all_models(str(img_path))
-            all_results.append(results)
 
+        def process_batch(batch: List[Dict]):
+            images = [member["data"] for member in batch]
+            names = [member["name"] for member in batch]
+            for member, results in zip(batch, self.test_images(images, lang=lang, names=names)):
+                all_results.append(
+                    self._save_image_results(results, content_hash(member["data"]), exporter)
+                )
+
+        batch = []
+        with open(archive_path, "rb") as f:
+            for member in iter_archive_images(f):
+                if "error" in member:
+                    print(f"\nSkipping {member['name']}: {member['error']}")
+                    continue
+                batch.append(member)
+                if len(batch) >= self.batch_size:
+                    process_batch(batch)
+                    batch = []
+        if batch:
+            process_batch(batch)
+
+        if not all_results:
+            print(f"No images found in {archive_path}")
+            return
+        return self._finish_run(all_results, exporter)
+
+    def _save_image_results(self, results: Dict, image_hash: str, exporter=None) -> Dict:
+        """
+        Index, store and export the results of one processed image
+
+        The array-form model results are converted to their JSON form once
+        here and that copy is used for the store, the Parquet export and the
+        JSON files.
+
+        Args:
+            exporter: ParquetExporter of the run (see _parquet_exporter), or None
+
+        Returns:
+            The JSON-ready results
+        """
+        results = export_response(results)
+        image_path = Path(results["image_path"])
+        # Indexed under the full path (the results store's image_id) so images
+        # sharing a basename in different folders do not replace each other
+        self.index_results(
+            results["image_path"],
+            results["models"],
+            name=image_path.name,
+            fused=results.get("ensemble"),
+        )
+
+        if self.results_store is not None:
+            self.results_store.add(results, image_hash=image_hash)
+        if exporter is not None:
+            exporter.add(results)
+
+        if self.json_output:
             # Save individual results
-            output_file = self.output_dir / f"{img_path.stem}_results.json"
+            output_file = self.output_dir / f"{image_path.stem}_results.json"
             with open(output_file, "w", encoding="utf-8") as f:
                 json.dump(results, f, ensure_ascii=False, indent=2)
             print(f"Results saved to {output_file}")
+        return results
 
-        # Save combined results
-        combined_file = self.output_dir / "all_results.json"
-        with open(combined_file, "w", encoding="utf-8") as f:
-            json.dump(all_results, f, ensure_ascii=False, indent=2)
-
-        print(f"\nAll results saved to {combined_file}")
+    def _finish_run(self, all_results: List[Dict], exporter=None) -> List[Dict]:
+        """Flush the store and export and write the combined JSON file"""
+        if self.results_store is not None:
+            self.results_store.flush()
+            print(f"\nAll results saved to {self.results_store.path}")
+        if exporter is not None:
+            exporter.close()
+            print(f"Parquet export (run {exporter.run_id}) saved to {self.parquet_dir}")
+
+        if self.json_output:
+            # Save combined results
+            combined_file = self.output_dir / "all_results.json"
+            with open(combined_file, "w", encoding="utf-8") as f:
+                json.dump(all_results, f, ensure_ascii=False, indent=2)
+
+            print(f"\nAll results saved to {combined_file}")
         return all_results
 
 
 def main():
     """Main function to run OCR tests"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run all OCR models on a dataset")
+    parser.add_argument(
+        "--image-dir", type=str, default="dataset", help="Directory with input images"
+    )
+    parser.add_argument(
+        "--archive",
+        type=str,
+        default=None,
+        help="Process the images in this tar or zip archive instead of --image-dir "
+        "(read member by member, not extracted)",
+    )
+    parser.add_argument(
+        "--cpu-threads",
+        type=int,
+        default=None,
+        help="Total CPU threads (default: OCR_CPU_THREADS or all cores)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help="Concurrent inference slots (default: OCR_CONCURRENCY or 1)",
+    )
+    parser.add_argument(
+        "--model-timeout",
+        type=float,
+        default=None,
+        help="Per-model timeout in seconds (default: no timeout)",
+    )
+    parser.add_argument(
+        "--image-timeout",
+        type=float,
+        default=None,
+        help="Timeout in seconds for all models on one image (default: no timeout)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=8,
+        help="Images per batch for models that support batching (TrOCR, default: 8)",
+    )
+    parser.add_argument(
+        "--max-abandoned-calls",
+        type=int,
+        default=2,
+        help="Timed-out calls still running after which a model is skipped "
+        "until they return, 0 for no limit (default: 2)",
+    )
+    parser.add_argument(
+        "--lang",
+        type=str,
+        default=None,
+        help="Comma-separated language codes, e.g. en (default: en,fa for EasyOCR, en for PaddleOCR)",
+    )
+    parser.add_argument(
+        "--ensemble",
+        action="store_true",
+        help="Fuse the regions of all models into one merged result per image",
+    )
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="Reuse the results of an earlier identical image (same content hash)",
+    )
+    parser.add_argument(
+        "--dedup-distance",
+        type=int,
+        default=4,
+        help="Maximum perceptual hash distance (0-64) of a reusable match (default: 4)",
+    )
+    parser.add_argument(
+        "--dedup-perceptual",
+        action="store_true",
+        help="With --dedup, also reuse results of perceptually similar images "
+        "without a content match (unsafe for images that differ only in small text)",
+    )
+    parser.add_argument(
+        "--no-dedup",
+        action="store_true",
+        help="Run all models on every image (the default)",
+    )
+    parser.add_argument(
+        "--results-db",
+        type=str,
+        default="ocr_results/results.db",
+        help="SQLite results database (default: ocr_results/results.db)",
+    )
+    parser.add_argument(
+        "--parquet",
+        type=str,
+        default=None,
+        help="Also export the results as partitioned Parquet to this directory "
+        "(requires pyarrow)",
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Also write one JSON file per image and all_results.json (the default)",
+    )
+    parser.add_argument(
+        "--no-json",
+        action="store_true",
+        help="Only write the results database, no JSON files",
+    )
+    parser.add_argument(
+        "--search",
+        type=str,
+        default=None,
+        help="After processing, list the images whose text contains these words (fuzzy match)",
+    )
+    args = parser.parse_args()
+
+    thread_settings = configure_thread_budget(args.cpu_threads, args.concurrency)
+    print(
+        f"CPU threads: {thread_settings['total_threads']} total, "
+        f"{thread_settings['threads_per_slot']} per inference slot"
+    )
+
     print("=" * 60)
     print("Snappify OCR Model Testing Framework")
     print("=" * 60)
 
-    tester = OCRTester()
+    timeouts = {}
+    if args.model_timeout:
+        timeouts["default"] = args.model_timeout
+    if args.image_timeout:
+        timeouts["request"] = args.image_timeout
+
+    dedup = None
+    if args.dedup and not args.no_dedup:
+        dedup = {
+            "max_distance": args.dedup_distance,
+            "verify_content": not args.dedup_perceptual,
+        }
+
+    tester = OCRTester(
+        timeouts=timeouts,
+        max_abandoned_calls=args.max_abandoned_calls,
+        batch_size=args.batch_size,
+        dedup=dedup,
+        ensemble={} if args.ensemble else None,
+        search_index={} if args.search else None,
+        results_db=args.results_db,
+        json_output=args.json or not args.no_json,
+        parquet_dir=args.parquet,
+    )
     tester.initialize_models()
 
-    # Process all images in current directory
-    results = tester.process_images()
+    # Process all images in the archive or the dataset directory
+    if args.archive:
+        results = tester.process_archive(args.archive, lang=args.lang)
+    else:
+        results = tester.process_images(args.image_dir, lang=args.lang)
 
     # Print summary
     print("\n" + "=" * 60)
@@ -494,6 +1047,15 @@ def main():
                 else:
                     error = model_result.get("error", "Unknown error")
                     print(f"  {model_name}: Failed - {error}")
+            if "ensemble" in result:
+                print(f"  Ensemble: {result['ensemble']['num_detections']} detections")
+
+    if args.search:
+        found = tester.text_index.search(args.search, fuzzy=True)
+        print(f"\n{found['total']} images match '{args.search}'")
+        for result in found["results"]:
+            matches = ", ".join(f"'{match['text']}'" for match in result["matches"][:5])
+            print(f"  {result['image_name']} (score: {result['score']}): {matches}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,351 @@
+"""
+Searchable inverted index over OCR results
+Maps normalized words to the images and text regions they were recognized in,
+so finding the images that contain a word is a dictionary lookup instead of
+a scan over every result file. The index is updated as images are processed;
+re-indexing an image replaces its earlier entries. It holds at most
+`capacity` images; the least recently indexed ones are dropped first. The
+SQLite results store keeps the full history, and the index can be rebuilt
+from it (index_store).
+
+Fuzzy search goes through a second index from character n-grams to
+vocabulary words, which also matches Persian words that OCR split, joined or
+misspelled by a letter.
+
+Usage (search the results of earlier runs in ocr_results/):
+    python text_index.py "pizza" --fuzzy
+"""
+
+import json
+import math
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from results_store import ResultsStore
+
+WORD_PATTERN = re.compile(r"\w+")
+
+# Arabic code points used interchangeably with their Persian forms, Arabic
+# and Persian digits, and marks that do not change the word
+PERSIAN_TRANSLATION = str.maketrans(
+    {
+        "ي": "ی",  # Arabic yeh -> Persian yeh
+        "ى": "ی",  # Alef maksura -> Persian yeh
+        "ك": "ک",  # Arabic kaf -> Persian keheh
+        "ة": "ه",  # Teh marbuta -> heh
+        "\u0640": None,  # Tatweel
+        "\u200c": None,  # Zero-width non-joiner
+        **{chr(0x0660 + digit): str(digit) for digit in range(10)},
+        **{chr(0x06F0 + digit): str(digit) for digit in range(10)},
+    }
+)
+# Harakat and other combining marks
+DIACRITICS_PATTERN = re.compile("[\u064b-\u065f\u0670]")
+
+
+def normalize_text(text: str) -> str:
+    """Case-fold and unify Unicode, Arabic/Persian letter and digit forms"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return DIACRITICS_PATTERN.sub("", text.translate(PERSIAN_TRANSLATION))
+
+
+def tokenize(text: str) -> List[str]:
+    """Normalized words of a text"""
+    return WORD_PATTERN.findall(normalize_text(text))
+
+
+def char_ngrams(token: str, n: int) -> Set[str]:
+    """Character n-grams of a word padded with boundary markers"""
+    padded = f"#{token}#"
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i : i + n] for i in range(len(padded) - n + 1)}
+
+
+class TextIndex:
+    """
+    Incrementally maintained inverted index of recognized text
+
+    Args:
+        ngram_size: Character n-gram length for fuzzy search (0 disables it)
+        min_similarity: Minimum n-gram Dice similarity of a fuzzy match
+        capacity: Maximum number of indexed images (None for no limit)
+    """
+
+    def __init__(
+        self,
+        ngram_size: int = 3,
+        min_similarity: float = 0.5,
+        capacity: Optional[int] = 100000,
+    ):
+        self.ngram_size = ngram_size
+        self.min_similarity = min_similarity
+        self.capacity = capacity
+        self.evicted = 0
+        # image id -> {"name", "regions": [{"model", "text", "bbox", "confidence"}], "tokens"},
+        # in indexing order (oldest first)
+        self.documents: Dict[str, Dict] = {}
+        # word -> {image id -> [region indices]}
+        self.postings: Dict[str, Dict[str, List[int]]] = {}
+        # n-gram -> words containing it
+        self.ngrams: Dict[str, Set[str]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def add(self, image_id: str, model_results: Dict[str, Dict], name: Optional[str] = None):
+        """
+        Index the results of one image, replacing its earlier entries
+
+        Args:
+            image_id: Unique image identifier
+            model_results: Dictionary mapping model name to model result;
+                failed results are skipped
+            name: Display name of the image (default: image_id)
+        """
+        regions = []
+        for model_name, result in model_results.items():
+            if not result.get("success"):
+                continue
+            if result.get("texts"):
+                for item in result["texts"]:
+                    regions.append(
+                        {
+                            "model": model_name,
+                            "text": item.get("text", ""),
+                            "bbox": item.get("bbox"),
+                            "confidence": item.get("confidence"),
+                        }
+                    )
+            elif result.get("full_text"):
+                # Region-less models (TrOCR) are indexed without a bbox
+                regions.append(
+                    {"model": model_name, "text": result["full_text"], "bbox": None, "confidence": None}
+                )
+
+        token_regions: Dict[str, List[int]] = defaultdict(list)
+        for region_id, region in enumerate(regions):
+            for token in set(tokenize(region["text"])):
+                token_regions[token].append(region_id)
+
+        with self._lock:
+            self._remove(image_id)
+            self.documents[image_id] = {
+                "name": name or image_id,
+                "regions": regions,
+                "tokens": set(token_regions),
+            }
+            for token, region_ids in token_regions.items():
+                if token not in self.postings:
+                    self.postings[token] = {}
+                    if self.ngram_size:
+                        for ngram in char_ngrams(token, self.ngram_size):
+                            self.ngrams[ngram].add(token)
+                self.postings[token][image_id] = region_ids
+            if self.capacity is not None:
+                while len(self.documents) > self.capacity:
+                    self._remove(next(iter(self.documents)))
+                    self.evicted += 1
+
+    def remove(self, image_id: str):
+        """Drop an image from the index"""
+        with self._lock:
+            self._remove(image_id)
+
+    def _remove(self, image_id: str):
+        document = self.documents.pop(image_id, None)
+        if document is None:
+            return
+        for token in document["tokens"]:
+            postings = self.postings[token]
+            del postings[image_id]
+            if not postings:
+                del self.postings[token]
+                if self.ngram_size:
+                    for ngram in char_ngrams(token, self.ngram_size):
+                        self.ngrams[ngram].discard(token)
+                        if not self.ngrams[ngram]:
+                            del self.ngrams[ngram]
+
+    def _expand(self, token: str, fuzzy: bool) -> Dict[str, float]:
+        """Indexed words matching a query word, with their similarity"""
+        matches = {token: 1.0} if token in self.postings else {}
+        if not fuzzy or not self.ngram_size:
+            return matches
+        query_ngrams = char_ngrams(token, self.ngram_size)
+        shared: Dict[str, int] = defaultdict(int)
+        for ngram in query_ngrams:
+            for candidate in self.ngrams.get(ngram, ()):
+                shared[candidate] += 1
+        for candidate, count in shared.items():
+            # Dice coefficient of the two n-gram sets
+            similarity = 2 * count / (
+                len(query_ngrams) + len(char_ngrams(candidate, self.ngram_size))
+            )
+            if similarity >= self.min_similarity:
+                matches[candidate] = max(matches.get(candidate, 0.0), similarity)
+        return matches
+
+    def search(
+        self,
+        query: str,
+        fuzzy: bool = False,
+        model: Optional[str] = None,
+        limit: int = 20,
+    ) -> Dict:
+        """
+        Find the images containing all words of a query
+
+        Images are ranked by the sum over query words of match similarity
+        times inverse document frequency, so rare words weigh more.
+
+        Args:
+            query: Words to search for
+            fuzzy: Also match similar words (character n-gram similarity)
+            model: Only match regions recognized by this model
+            limit: Maximum number of images returned
+
+        Returns:
+            Dictionary with "query", "total" (number of matching images) and
+            "results": image_id, image_name, score and the matching regions
+            (model, text, bbox, confidence) per image
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return {"query": query, "total": 0, "results": []}
+
+        with self._lock:
+            num_documents = max(len(self.documents), 1)
+            scores: Optional[Dict[str, float]] = None
+            matched_regions: Dict[str, Set[int]] = defaultdict(set)
+            for token in tokens:
+                token_scores: Dict[str, float] = {}
+                for word, similarity in self._expand(token, fuzzy).items():
+                    postings = self.postings[word]
+                    idf = math.log(1 + num_documents / len(postings))
+                    for image_id, region_ids in postings.items():
+                        if model is not None:
+                            regions = self.documents[image_id]["regions"]
+                            region_ids = [i for i in region_ids if regions[i]["model"] == model]
+                            if not region_ids:
+                                continue
+                        token_scores[image_id] = max(
+                            token_scores.get(image_id, 0.0), similarity * idf
+                        )
+                        matched_regions[image_id].update(region_ids)
+                # Every query word must match
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {
+                        image_id: score + token_scores[image_id]
+                        for image_id, score in scores.items()
+                        if image_id in token_scores
+                    }
+                if not scores:
+                    break
+
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+            results = []
+            for image_id, score in ranked[:limit]:
+                document = self.documents[image_id]
+                results.append(
+                    {
+                        "image_id": image_id,
+                        "image_name": document["name"],
+                        "score": round(score, 4),
+                        "matches": [
+                            dict(document["regions"][region_id])
+                            for region_id in sorted(matched_regions[image_id])
+                        ],
+                    }
+                )
+        return {"query": query, "total": len(ranked), "results": results}
+
+    def add_image_results(self, results: Dict):
+        """Index one image's results in the test_all_models() format"""
+        model_results = dict(results.get("models", {}))
+        if "ensemble" in results:
+            model_results["Ensemble"] = results["ensemble"]
+        name = Path(results["image_path"]).name
+        self.add(results.get("image_id") or results["image_path"], model_results, name=name)
+
+    def index_store(self, store: ResultsStore) -> int:
+        """
+        Index the most recent images of a results store (up to capacity)
+
+        Returns:
+            Number of indexed images
+        """
+        image_results = store.load_results(limit=self.capacity)
+        for results in image_results:
+            self.add_image_results(results)
+        return len(image_results)
+
+    def index_result_files(self, results_dir: str = "ocr_results") -> int:
+        """
+        Index the results of earlier runs: the SQLite results store
+        (results.db) if there is one, else the per-image JSON files
+
+        Returns:
+            Number of indexed images
+        """
+        db_path = Path(results_dir) / "results.db"
+        if db_path.exists():
+            store = ResultsStore(str(db_path))
+            try:
+                return self.index_store(store)
+            finally:
+                store.close()
+
+        count = 0
+        for path in sorted(Path(results_dir).glob("*_results.json")):
+            with open(path, "r", encoding="utf-8") as f:
+                results = json.load(f)
+            results.setdefault("image_path", path.stem)
+            self.add_image_results(results)
+            count += 1
+        return count
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "images": len(self.documents),
+                "words": len(self.postings),
+                "ngrams": len(self.ngrams),
+                "capacity": self.capacity,
+                "evicted": self.evicted,
+            }
+
+
+def main():
+    """Search the result files of earlier runs"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Search OCR result files")
+    parser.add_argument("query", type=str, help="Words to search for")
+    parser.add_argument(
+        "--results-dir",
+        type=str,
+        default="ocr_results",
+        help="Directory with results.db or result JSON files",
+    )
+    parser.add_argument("--fuzzy", action="store_true", help="Also match similar words")
+    parser.add_argument("--model", type=str, default=None, help="Only search this model's results")
+    parser.add_argument("--limit", type=int, default=20, help="Maximum number of images")
+    args = parser.parse_args()
+
+    index = TextIndex()
+    count = index.index_result_files(args.results_dir)
+    found = index.search(args.query, fuzzy=args.fuzzy, model=args.model, limit=args.limit)
+    print(f"{found['total']} of {count} images match '{args.query}'")
+    for result in found["results"]:
+        print(f"\n{result['image_name']} (score: {result['score']})")
+        for match in result["matches"]:
+            print(f"  {match['model']}: '{match['text']}' {match['bbox']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+CPU thread budgeting for the OCR libraries
+Splits the available cores between concurrent inference slots and sets the
+intra-op thread pools of torch, Paddle, OpenCV and the BLAS/OpenMP runtimes
+accordingly, so concurrent backends do not oversubscribe the CPU. The number
+of slots is the number of inference calls that may run at the same time
+across all models (the API passes the sum of its per-model admission limits).
+
+Configure it before the models are loaded. torch and OpenCV are configured as
+soon as they are imported (see apply_thread_settings):
+
+    from thread_budget import configure_thread_budget
+    configure_thread_budget(concurrency=2)
+
+Settings are read from the environment when not passed explicitly:
+    OCR_CPU_THREADS: Total CPU threads for this process (default: all cores)
+    OCR_CONCURRENCY: Number of concurrent inference slots (default: 1)
+
+Thread variables of the OpenMP / BLAS runtimes (THREAD_ENV_VARS) that are
+already set when this module is imported are left as they are and reported
+as overrides.
+"""
+
+import os
+import sys
+from typing import Dict, Optional
+
+# Environment variables read by the OpenMP / BLAS runtimes at load time
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "FLAGS_cpu_math_library_num_threads",  # Paddle
+)
+
+# Thread variables set by the operator before the budget was configured
+ENV_OVERRIDES: Dict[str, str] = {
+    var: os.environ[var] for var in THREAD_ENV_VARS if os.environ.get(var)
+}
+
+# Effective settings of the last configure_thread_budget() call
+_effective_settings: Dict = {}
+
+
+def available_cpus() -> int:
+    """Number of CPUs this process may run on (respects affinity masks)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _int_or(value: Optional[str], default: int) -> int:
+    """Integer value of an environment variable, or default if unset or invalid"""
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return default
+
+
+def configure_thread_budget(
+    total_threads: Optional[int] = None, concurrency: Optional[int] = None
+) -> Dict:
+    """
+    Set per-library thread counts from a total CPU budget
+
+    Each concurrent inference slot gets total_threads // concurrency intra-op
+    threads (at least 1). Can be called again (e.g. once the number of loaded
+    models is known); torch and OpenCV are then reconfigured.
+
+    Args:
+        total_threads: Total CPU threads for this process
+            (default: OCR_CPU_THREADS or all available cores)
+        concurrency: Number of inference calls that may run at the same time,
+            over all models (default: OCR_CONCURRENCY or 1)
+
+    Returns:
+        Dictionary with the effective settings per library
+    """
+    global _effective_settings
+
+    if total_threads is None:
+        total_threads = int(os.environ.get("OCR_CPU_THREADS") or available_cpus())
+    if concurrency is None:
+        concurrency = int(os.environ.get("OCR_CONCURRENCY") or 1)
+    total_threads = max(1, total_threads)
+    concurrency = max(1, concurrency)
+    per_slot = max(1, total_threads // concurrency)
+
+    # Propagate to child processes and to runtimes that are not loaded yet,
+    # except for the variables the operator set
+    os.environ["OCR_CPU_THREADS"] = str(total_threads)
+    env = {}
+    for var in THREAD_ENV_VARS:
+        if var in ENV_OVERRIDES:
+            env[var] = ENV_OVERRIDES[var]
+        else:
+            os.environ[var] = env[var] = str(per_slot)
+
+    settings = {
+        "total_threads": total_threads,
+        "concurrency": concurrency,
+        "threads_per_slot": per_slot,
+        "env": env,
+        "overrides": dict(ENV_OVERRIDES),
+    }
+
+    # Paddle has no runtime setter, its CPU math library reads the
+    # FLAGS_cpu_math_library_num_threads environment variable at import
+    settings["paddle"] = _int_or(ENV_OVERRIDES.get("FLAGS_cpu_math_library_num_threads"), per_slot)
+    settings["torch"] = None
+    settings["opencv"] = None
+
+    _effective_settings = settings
+    apply_thread_settings()
+    return dict(_effective_settings)
+
+
+def apply_thread_settings() -> None:
+    """
+    Apply the configured budget to torch and OpenCV if they are imported
+
+    Libraries are imported lazily by the OCR backends, so this is called again
+    after each backend load. Libraries that are not imported yet are skipped
+    rather than imported here.
+    """
+    if not _effective_settings:
+        return
+    per_slot = _effective_settings["threads_per_slot"]
+
+    torch = sys.modules.get("torch")
+    if torch is not None and _effective_settings.get("torch") is None:
+        # torch sizes its intra-op pool from OMP_NUM_THREADS itself
+        torch.set_num_threads(_int_or(ENV_OVERRIDES.get("OMP_NUM_THREADS"), per_slot))
+        try:
+            # Can only be set once, before any inter-op parallel work has started
+            torch.set_num_interop_threads(
+                min(_effective_settings["concurrency"], _effective_settings["total_threads"])
+            )
+        except RuntimeError:
+            pass
+        _effective_settings["torch"] = {
+            "intra_op": torch.get_num_threads(),
+            "inter_op": torch.get_num_interop_threads(),
+        }
+
+    cv2 = sys.modules.get("cv2")
+    if cv2 is not None and _effective_settings.get("opencv") is None:
+        # OpenCV calls happen inside the inference slots, so they share the slot budget
+        cv2.setNumThreads(per_slot)
+        _effective_settings["opencv"] = cv2.getNumThreads()
+
+
+def paddle_thread_kwargs() -> Dict:
+    """Keyword arguments that pin a PaddleOCR instance to the slot thread budget"""
+    if not _effective_settings:
+        return {}
+    return {"cpu_threads": _effective_settings["paddle"]}
+
+
+def get_thread_settings() -> Dict:
+    """Effective thread settings of the last configure_thread_budget() call"""
+    return dict(_effective_settings)
@@ -0,0 +1,165 @@
+"""
+Tiled OCR helpers
+Splits very large images into overlapping tiles and merges the per-tile
+detections back into a single result
+"""
+
+from typing import List, Tuple
+
+import numpy as np
+
+from result_normalization import EMPTY_POLYGONS, EMPTY_SCORES, stack_polygons
+
+
+def compute_tiles(
+    width: int, height: int, tile_size: int = 1280, overlap: int = 160
+) -> List[Tuple[int, int, int, int]]:
+    """
+    Compute overlapping tile windows covering an image
+
+    Args:
+        width: Image width
+        height: Image height
+        tile_size: Tile side length in pixels
+        overlap: Overlap between neighbouring tiles in pixels. Should be larger
+            than the tallest expected text line so every line is fully
+            contained in at least one tile.
+
+    Returns:
+        List of (x0, y0, x1, y1) tile windows
+    """
+    if overlap >= tile_size:
+        raise ValueError("Tile overlap must be smaller than the tile size")
+
+    def starts(length: int) -> List[int]:
+        if length <= tile_size:
+            return [0]
+        stride = tile_size - overlap
+        positions = list(range(0, length - tile_size, stride))
+        positions.append(length - tile_size)  # last tile is flush with the edge
+        return positions
+
+    return [
+        (x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height))
+        for y0 in starts(height)
+        for x0 in starts(width)
+    ]
+
+
+def polygon_bounds(polygons: np.ndarray) -> np.ndarray:
+    """Axis-aligned bounds (N, 4) as x0, y0, x1, y1 of an (N, K, 2) polygon array"""
+    return np.concatenate([polygons.min(axis=1), polygons.max(axis=1)], axis=1)
+
+
+def polygon_nms(
+    polygons: np.ndarray, scores: np.ndarray, iou_threshold: float = 0.5
+) -> np.ndarray:
+    """
+    Greedy non-maximum suppression over text polygons
+
+    Overlap is measured on the polygons' axis-aligned bounds as intersection
+    over the smaller area, so a word cut at a tile seam is suppressed by the
+    complete detection from the neighbouring tile. Each step compares the kept
+    box against all remaining boxes in one vectorized operation.
+
+    Args:
+        polygons: (N, K, 2) array of polygon points
+        scores: (N,) array of confidences
+        iou_threshold: Overlap above which the lower-scoring box is dropped
+
+    Returns:
+        Indices of the kept polygons, highest score first
+    """
+    if len(polygons) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    bounds = polygon_bounds(polygons)
+    x0, y0, x1, y1 = bounds.T
+    areas = np.maximum(x1 - x0, 0) * np.maximum(y1 - y0, 0)
+
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+
+        inter_w = np.maximum(
+            np.minimum(x1[i], x1[rest]) - np.maximum(x0[i], x0[rest]), 0
+        )
+        inter_h = np.maximum(
+            np.minimum(y1[i], y1[rest]) - np.maximum(y0[i], y0[rest]), 0
+        )
+        inter = inter_w * inter_h
+        min_area = np.maximum(np.minimum(areas[i], areas[rest]), 1e-6)
+        order = rest[inter / min_area <= iou_threshold]
+
+    return np.asarray(keep, dtype=np.int64)
+
+
+def merge_tile_regions(
+    tile_results: List[Tuple[Tuple[int, int, int, int], Tuple[np.ndarray, np.ndarray, List[str]]]],
+    iou_threshold: float = 0.5,
+    seam_margin: float = 2.0,
+) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    """
+    Translate per-tile regions to image coordinates and merge duplicates
+
+    Detections touching an inner tile edge are likely clipped, so they lose
+    against any overlapping detection that does not touch a seam.
+
+    Args:
+        tile_results: List of (tile window, (polygons, scores, texts)) pairs,
+            polygons in tile coordinates (see result_normalization.py)
+        iou_threshold: Overlap threshold for duplicate suppression
+        seam_margin: Distance in pixels from an inner tile edge that counts as touching
+
+    Returns:
+        Merged (polygons, scores, texts) in image coordinates, in reading
+        order (top to bottom, left to right)
+    """
+    if not tile_results:
+        return EMPTY_POLYGONS.copy(), EMPTY_SCORES.copy(), []
+    image_width = max(window[2] for window, _ in tile_results)
+    image_height = max(window[3] for window, _ in tile_results)
+
+    polygons_list, scores_list, seams_list, texts = [], [], [], []
+    for (x0, y0, x1, y1), (polygons, scores, tile_texts) in tile_results:
+        # Regions without a bbox can't be placed in the image
+        valid = ~np.isnan(polygons).any(axis=(1, 2))
+        if not valid.any():
+            continue
+        polygons = polygons[valid] + np.array([x0, y0], dtype=np.float64)
+        mins, maxs = polygons.min(axis=1), polygons.max(axis=1)
+        # Inner edges of this tile, image borders are not seams
+        seams = np.zeros(len(polygons), dtype=bool)
+        if x0 > 0:
+            seams |= mins[:, 0] <= x0 + seam_margin
+        if y0 > 0:
+            seams |= mins[:, 1] <= y0 + seam_margin
+        if x1 < image_width:
+            seams |= maxs[:, 0] >= x1 - seam_margin
+        if y1 < image_height:
+            seams |= maxs[:, 1] >= y1 - seam_margin
+        polygons_list.append(polygons)
+        scores_list.append(np.asarray(scores, dtype=np.float64)[valid])
+        seams_list.append(seams)
+        texts.extend(text for text, ok in zip(tile_texts, valid) if ok)
+
+    if not texts:
+        return EMPTY_POLYGONS.copy(), EMPTY_SCORES.copy(), []
+
+    if len({polygons.shape[1] for polygons in polygons_list}) == 1:
+        polygons = np.concatenate(polygons_list)
+    else:
+        # Point counts differ between tiles, pad them to the same count
+        polygons = stack_polygons([polygon for tile in polygons_list for polygon in tile])
+    scores = np.concatenate(scores_list)
+    # Confidences are in [0, 1], so a penalty of 1 ranks every clipped
+    # detection below every unclipped one
+    keep = polygon_nms(polygons, scores - np.concatenate(seams_list), iou_threshold)
+
+    # Restore a stable top-to-bottom, left-to-right order
+    bounds = polygon_bounds(polygons[keep])
+    keep = keep[np.lexsort((bounds[:, 0], bounds[:, 1]))]
+    return polygons[keep], scores[keep], [texts[i] for i in keep.tolist()]
@@ -0,0 +1,487 @@
+"""
+Fast CPU inference options for TrOCR
+Dynamic int8 quantization, bf16 autocast, torch.compile and ONNX Runtime
+export, plus a parity check against the fp32 model. Also provides decoding
+profiles with cached generation configs and a precomputed image transform
+that replaces the processor's per-call preprocessing.
+
+Options (all optional, default off):
+    quantize: Dynamic int8 quantization of the nn.Linear layers (CPU only)
+    bf16: Run generation under bf16 autocast
+    compile: Compile the encoder and decoder with torch.compile
+    onnx: Export to ONNX and run with ONNX Runtime (requires optimum[onnxruntime])
+    decoding: Decoding profile name (see DECODING_PROFILES, default: "default")
+"""
+
+import contextlib
+import copy
+import difflib
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+# Options that replace the fp32 model (decoding only changes generate() settings)
+MODEL_OPTIONS = ("quantize", "bf16", "compile", "onnx")
+
+# generate() settings per decoding profile. All but "default" decode with the
+# KV-cache and a bounded number of new tokens.
+DECODING_PROFILES = {
+    # The model's own generation config, as before
+    "default": {},
+    # One token per step, no beam bookkeeping
+    "greedy": {"num_beams": 1, "do_sample": False, "use_cache": True, "max_new_tokens": 48},
+    # Greedy for short text lines (menu items, prices)
+    "short": {"num_beams": 1, "do_sample": False, "use_cache": True, "max_new_tokens": 16},
+    # Small beam for harder images
+    "beam": {
+        "num_beams": 3,
+        "do_sample": False,
+        "use_cache": True,
+        "max_new_tokens": 48,
+        "early_stopping": True,
+    },
+}
+
+
+def build_generation_config(model, profile: str):
+    """
+    Generation config of a decoding profile, built once and reused per call
+
+    Returns:
+        GenerationConfig derived from the model's own config, or None for the
+        "default" profile / models without a generation config
+    """
+    if profile not in DECODING_PROFILES:
+        raise ValueError(
+            f"Unknown decoding profile: {profile}. "
+            f"Available: {', '.join(DECODING_PROFILES)}"
+        )
+    base_config = getattr(model, "generation_config", None)
+    if not DECODING_PROFILES[profile] or base_config is None:
+        return None
+    generation_config = copy.deepcopy(base_config)
+    # max_new_tokens takes precedence over the model config's max_length
+    generation_config.update(**DECODING_PROFILES[profile])
+    return generation_config
+
+
+def count_new_tokens(generated_ids, pad_token_id: Optional[int] = None) -> int:
+    """Number of generated tokens, without the decoder start token and padding"""
+    new_ids = generated_ids[:, 1:]
+    if pad_token_id is None:
+        return int(new_ids.numel())
+    return int((new_ids != pad_token_id).sum())
+
+
+class FastImageTransform:
+    """
+    Precomputed replacement for the TrOCR processor's image preprocessing
+
+    Rescaling and normalization are folded into one uint8 -> float32 lookup
+    table per channel, so each pixel costs a single table lookup written
+    straight into a preallocated (per thread) pixel_values buffer.
+
+    The returned tensor is a view of that buffer: it is valid until the next
+    call from the same thread.
+    """
+
+    def __init__(
+        self,
+        size: Tuple[int, int] = (384, 384),
+        mean=(0.5, 0.5, 0.5),
+        std=(0.5, 0.5, 0.5),
+        rescale_factor: float = 1 / 255,
+        resample=None,
+    ):
+        from PIL import Image
+
+        self.width, self.height = size
+        self.resample = resample if resample is not None else Image.BILINEAR
+        values = np.arange(256, dtype=np.float32)[None, :] * np.float32(rescale_factor)
+        mean = np.asarray(mean, dtype=np.float32)[:, None]
+        std = np.asarray(std, dtype=np.float32)[:, None]
+        # (3, 256) table: normalized value of each uint8 level per channel
+        self.lut = np.ascontiguousarray((values - mean) / std, dtype=np.float32)
+        self._local = threading.local()
+
+    @classmethod
+    def from_processor(cls, processor) -> "FastImageTransform":
+        """Build the transform from a TrOCRProcessor's image processor settings"""
+        image_processor = getattr(processor, "image_processor", None) or processor.feature_extractor
+        size = image_processor.size
+        if isinstance(size, dict):
+            size = (size["width"], size["height"])
+        elif isinstance(size, int):
+            size = (size, size)
+        rescale_factor = (
+            getattr(image_processor, "rescale_factor", 1 / 255)
+            if getattr(image_processor, "do_rescale", True)
+            else 1.0
+        )
+        mean, std = (0.0, 0.0, 0.0), (1.0, 1.0, 1.0)
+        if getattr(image_processor, "do_normalize", True):
+            mean, std = image_processor.image_mean, image_processor.image_std
+        return cls(
+            size=tuple(size),
+            mean=mean,
+            std=std,
+            rescale_factor=rescale_factor,
+            resample=getattr(image_processor, "resample", None),
+        )
+
+    def _buffer(self, batch_size: int) -> torch.Tensor:
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or buffer.shape[0] < batch_size:
+            buffer = torch.empty((batch_size, 3, self.height, self.width), dtype=torch.float32)
+            self._local.buffer = buffer
+        return buffer[:batch_size]
+
+    def __call__(self, images: List) -> torch.Tensor:
+        """Convert PIL images to normalized (N, 3, H, W) pixel_values"""
+        pixel_values = self._buffer(len(images))
+        output = pixel_values.numpy()
+        for index, image in enumerate(images):
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            if image.size != (self.width, self.height):
+                image = image.resize((self.width, self.height), self.resample)
+            pixels = np.asarray(image)
+            for channel in range(3):
+                np.take(self.lut[channel], pixels[:, :, channel], out=output[index, channel])
+        return pixel_values
+
+
+def optimize_trocr_model(model, model_name: str, options: Dict) -> Tuple[object, List[str]]:
+    """
+    Build a fast-inference variant of a loaded fp32 TrOCR model
+
+    Args:
+        model: Loaded VisionEncoderDecoderModel (left unchanged)
+        model_name: HuggingFace model name, used for the ONNX export
+        options: Fast-inference options (see module docstring)
+
+    Returns:
+        Tuple of (model to use for inference, list of applied optimizations)
+    """
+    applied = []
+
+    if options.get("onnx"):
+        try:
+            from optimum.onnxruntime import ORTModelForVision2Seq
+        except ImportError:
+            raise ImportError(
+                "ONNX Runtime export requires optimum: pip install optimum[onnxruntime]"
+            )
+        # The ONNX graph replaces the torch model entirely, the other
+        # options do not apply to it
+        return ORTModelForVision2Seq.from_pretrained(model_name, export=True), ["onnx"]
+
+    fast_model = model
+    if options.get("quantize"):
+        fast_model = torch.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+        applied.append("int8_dynamic")
+
+    if options.get("compile"):
+        if not hasattr(torch, "compile"):
+            raise RuntimeError("torch.compile requires PyTorch 2.0+")
+        if fast_model is model:
+            # Keep the fp32 reference model untouched for the parity check
+            fast_model = copy.deepcopy(model)
+        # generate() runs Python-level decoding loops, so the submodules are
+        # compiled instead of the whole model
+        fast_model.encoder = torch.compile(fast_model.encoder)
+        fast_model.decoder = torch.compile(fast_model.decoder)
+        applied.append("compile")
+
+    if options.get("bf16"):
+        applied.append("bf16_autocast")
+
+    fast_model.eval()
+    return fast_model, applied
+
+
+def inference_context(options: Dict, device=None):
+    """Context manager for TrOCR generation with the configured autocast"""
+    if options.get("bf16") and not options.get("onnx"):
+        device_type = device.type if device is not None else "cpu"
+        return torch.autocast(device_type=device_type, dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+def generate_text(
+    processor, model, image, options: Dict, device=None, transform=None, **generate_kwargs
+) -> str:
+    """Run TrOCR on a PIL image (preprocessed by transform if given) and return the decoded text"""
+    if transform is not None:
+        pixel_values = transform([image])
+    else:
+        pixel_values = processor(image, return_tensors="pt").pixel_values
+    if device is not None and not options.get("onnx"):
+        pixel_values = pixel_values.to(device)
+
+    with torch.no_grad(), inference_context(options, device):
+        generated_ids = model.generate(pixel_values, **generate_kwargs)
+    return processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
+
+
+def benchmark_profiles(
+    processor,
+    model,
+    images: List,
+    profiles: List[str],
+    options: Dict,
+    device=None,
+) -> Dict[str, Dict]:
+    """
+    Decode sample images with each decoding profile
+
+    Args:
+        processor: TrOCR processor
+        model: Model to benchmark
+        images: List of PIL images or image paths
+        profiles: Decoding profile names
+        options: Fast-inference options used for the model
+        device: Torch device of the model
+
+    Returns:
+        Dictionary mapping profile to tokens/sec, mean latency and texts
+    """
+    images = open_images(images)
+    transform = FastImageTransform.from_processor(processor)
+    pad_token_id = getattr(processor.tokenizer, "pad_token_id", None)
+
+    report = {}
+    for profile in profiles:
+        generation_config = build_generation_config(model, profile)
+        generate_kwargs = {"generation_config": generation_config} if generation_config else {}
+        tokens = 0
+        elapsed = 0.0
+        texts = []
+        for image in images:
+            start = time.perf_counter()
+            pixel_values = transform([image])
+            if device is not None and not options.get("onnx"):
+                pixel_values = pixel_values.to(device)
+            with torch.no_grad(), inference_context(options, device):
+                generated_ids = model.generate(pixel_values, **generate_kwargs)
+            elapsed += time.perf_counter() - start
+            tokens += count_new_tokens(generated_ids, pad_token_id)
+            texts.append(processor.batch_decode(generated_ids, skip_special_tokens=True)[0])
+        report[profile] = {
+            "tokens_per_sec": round(tokens / elapsed, 1) if elapsed > 0 else None,
+            "mean_ms": round(elapsed * 1000 / max(1, len(images)), 1),
+            "new_tokens": tokens,
+            "texts": texts,
+        }
+    return report
+
+
+# Text lines rendered for the parity check when no sample images are configured
+DEFAULT_PARITY_LINES = (
+    "PIZZA MARGHERITA 12.50",
+    "Grilled chicken salad",
+    "Espresso 3.00  Latte 4.25",
+    "Total: 1,240,000",
+)
+
+
+def default_parity_images() -> List:
+    """Synthetic text line images (black on white) for the parity check"""
+    from PIL import Image, ImageDraw, ImageFont
+
+    try:
+        font = ImageFont.load_default(size=32)
+    except TypeError:
+        # Pillow < 10.1: fixed-size bitmap font
+        font = ImageFont.load_default()
+    images = []
+    for line in DEFAULT_PARITY_LINES:
+        left, top, right, bottom = font.getbbox(line)
+        image = Image.new("RGB", (right - left + 24, bottom - top + 24), "white")
+        ImageDraw.Draw(image).text((12 - left, 12 - top), line, fill="black", font=font)
+        images.append(image)
+    return images
+
+
+def open_images(images: List) -> List:
+    """Open image paths as RGB PIL images, passing PIL images through"""
+    from PIL import Image
+
+    return [
+        image if isinstance(image, Image.Image) else Image.open(image).convert("RGB")
+        for image in images
+    ]
+
+
+def check_transform(processor, transform: FastImageTransform, images: List, atol: float = 1e-3) -> Dict:
+    """
+    Compare FastImageTransform's pixel_values against the processor's
+
+    Args:
+        processor: TrOCR processor the transform replaces
+        transform: Transform to check
+        images: List of PIL images or image paths
+        atol: Maximum absolute difference of any pixel value to pass
+
+    Returns:
+        Dictionary with the maximum absolute difference and pass flag
+    """
+    max_diff = 0.0
+    for image in open_images(images):
+        expected = processor(image, return_tensors="pt").pixel_values
+        actual = transform([image])
+        if tuple(actual.shape) != tuple(expected.shape):
+            return {
+                "passed": False,
+                "max_abs_diff": None,
+                "error": f"shape {tuple(actual.shape)} != {tuple(expected.shape)}",
+            }
+        max_diff = max(max_diff, float((actual - expected).abs().max()))
+    return {"passed": max_diff <= atol, "max_abs_diff": round(max_diff, 6)}
+
+
+def check_parity(
+    processor,
+    reference_model,
+    fast_model,
+    images: List,
+    options: Dict,
+    device=None,
+    min_similarity: float = 0.98,
+    transform: Optional[FastImageTransform] = None,
+) -> Dict:
+    """
+    Compare the fast model's outputs against the fp32 reference model
+
+    The reference side always preprocesses with the processor. With a
+    transform, the fast side goes through it, as in production, and its
+    pixel_values must also match the processor's (see check_transform).
+
+    Args:
+        processor: TrOCR processor
+        reference_model: fp32 model
+        fast_model: Optimized model
+        images: List of PIL images or image paths
+        options: Fast-inference options used for fast_model
+        device: Torch device of the models
+        min_similarity: Minimum mean character similarity to pass
+        transform: FastImageTransform used with fast_model, or None
+
+    Returns:
+        Dictionary with per-image outputs, mean similarity, speedup, the
+        transform check (when a transform is given) and pass flag
+    """
+    from PIL import Image
+
+    transform_report = None
+    if transform is not None:
+        transform_report = check_transform(processor, transform, images)
+
+    samples = []
+    reference_time = 0.0
+    fast_time = 0.0
+    for image in images:
+        name = str(image) if not isinstance(image, Image.Image) else "<image>"
+        if not isinstance(image, Image.Image):
+            image = Image.open(image).convert("RGB")
+
+        start = time.perf_counter()
+        reference_text = generate_text(processor, reference_model, image, {}, device)
+        reference_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        fast_text = generate_text(processor, fast_model, image, options, device, transform)
+        fast_time += time.perf_counter() - start
+
+        samples.append(
+            {
+                "image": name,
+                "reference": reference_text,
+                "fast": fast_text,
+                "similarity": difflib.SequenceMatcher(
+                    None, reference_text, fast_text
+                ).ratio(),
+            }
+        )
+
+    mean_similarity = (
+        sum(s["similarity"] for s in samples) / len(samples) if samples else 1.0
+    )
+    return {
+        "passed": mean_similarity >= min_similarity
+        and (transform_report is None or transform_report["passed"]),
+        "mean_similarity": round(mean_similarity, 4),
+        "transform": transform_report,
+        "exact_matches": sum(s["reference"] == s["fast"] for s in samples),
+        "num_samples": len(samples),
+        "speedup": round(reference_time / fast_time, 2) if fast_time > 0 else None,
+        "samples": samples,
+    }
+
+
+def main():
+    """Run the parity check on sample images"""
+    import argparse
+    import json
+
+    from transformers import TrOCRProcessor, VisionEncoderDecoderModel
+
+    parser = argparse.ArgumentParser(
+        description="Compare fast TrOCR inference against fp32"
+    )
+    parser.add_argument("images", nargs="+", help="Sample images")
+    parser.add_argument("--model", default="microsoft/trocr-base-printed")
+    parser.add_argument("--quantize", action="store_true", help="Dynamic int8 quantization")
+    parser.add_argument("--bf16", action="store_true", help="bf16 autocast")
+    parser.add_argument("--compile", action="store_true", help="torch.compile")
+    parser.add_argument("--onnx", action="store_true", help="ONNX Runtime export")
+    parser.add_argument(
+        "--profiles",
+        type=str,
+        default=None,
+        help=f"Comma-separated decoding profiles to benchmark ({', '.join(DECODING_PROFILES)})",
+    )
+    args = parser.parse_args()
+
+    options = {
+        "quantize": args.quantize,
+        "bf16": args.bf16,
+        "compile": args.compile,
+        "onnx": args.onnx,
+    }
+
+    processor = TrOCRProcessor.from_pretrained(args.model)
+    reference_model = VisionEncoderDecoderModel.from_pretrained(args.model).eval()
+    fast_model, applied = optimize_trocr_model(reference_model, args.model, options)
+    print(f"Applied optimizations: {', '.join(applied) or 'none'}")
+
+    report = check_parity(
+        processor,
+        reference_model,
+        fast_model,
+        args.images,
+        options,
+        transform=FastImageTransform.from_processor(processor),
+    )
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    if args.profiles:
+        profiles = [name.strip() for name in args.profiles.split(",") if name.strip()]
+        profile_report = benchmark_profiles(
+            processor, fast_model, args.images, profiles, options
+        )
+        print(json.dumps(profile_report, indent=2, ensure_ascii=False))
+        for profile, stats in profile_report.items():
+            print(
+                f"{profile:<10}{str(stats['tokens_per_sec']):>10} tokens/s"
+                f"{stats['mean_ms']:>10} ms/image"
+            )
+
+
+if __name__ == "__main__":
+    main()
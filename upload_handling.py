@@ -0,0 +1,201 @@
+"""
+Upload handling for the OCR API
+Caps request bodies as they are received, streams uploads to disk in
+fixed-size chunks with a size cap, checks the file type from its magic bytes
+and validates image dimensions from the header before anything is fully
+decoded.
+
+Limits are read from the environment:
+    OCR_MAX_UPLOAD_MB: Maximum upload size per image in MB (default: 25)
+    OCR_MAX_IMAGE_PIXELS: Maximum image size in pixels (default: 100000000)
+    OCR_MAX_IMAGE_SIDE: Maximum image width or height in pixels (default: 20000)
+"""
+
+import asyncio
+import os
+import tempfile
+from typing import Callable, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+from preprocessing import open_image_source
+
+CHUNK_SIZE = 1024 * 1024
+
+# File signatures of the supported image formats, mapped to a file extension
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"BM", ".bmp"),
+    (b"II*\x00", ".tiff"),
+    (b"MM\x00*", ".tiff"),
+)
+
+
+def max_upload_bytes() -> int:
+    """Maximum upload size per image in bytes"""
+    return int(float(os.environ.get("OCR_MAX_UPLOAD_MB", "25")) * 1024 * 1024)
+
+
+def max_image_pixels() -> int:
+    """Maximum decoded image size in pixels"""
+    return int(os.environ.get("OCR_MAX_IMAGE_PIXELS", "100000000"))
+
+
+def max_image_side() -> int:
+    """Maximum image width or height in pixels"""
+    return int(os.environ.get("OCR_MAX_IMAGE_SIDE", "20000"))
+
+
+def sniff_image_type(header: bytes) -> Optional[str]:
+    """
+    Detect the image format from the first bytes of a file
+
+    Returns:
+        File extension of the detected format, or None if it is not a
+        supported image
+    """
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return ".webp"
+    for signature, extension in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return extension
+    return None
+
+
+class RequestSizeLimitMiddleware:
+    """
+    ASGI middleware rejecting POST bodies larger than a per-path limit
+
+    Requests whose Content-Length exceeds the limit get a 413 before the body
+    is read. Bodies without a Content-Length (chunked uploads) are counted as
+    they are received, and reading past the limit raises a 413 HTTPException,
+    so the multipart parser never spools more than the limit to disk.
+
+    Args:
+        app: ASGI application
+        limit_for: Returns the body size limit in bytes for a request path
+    """
+
+    def __init__(self, app, limit_for: Callable[[str], int]):
+        self.app = app
+        self.limit_for = limit_for
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        max_body = self.limit_for(scope["path"])
+        detail = f"Request body too large (limit {max_body} bytes)"
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > max_body:
+            response = JSONResponse(status_code=413, content={"detail": detail})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def save_upload(
+    file: UploadFile, max_bytes: Optional[int] = None
+) -> Tuple[str, str, int]:
+    """
+    Stream an uploaded image to a temporary file
+
+    The upload is copied in CHUNK_SIZE pieces and rejected as soon as it
+    exceeds max_bytes or its first bytes are not a supported image format,
+    so at most one chunk is held in memory.
+
+    Args:
+        file: Uploaded file
+        max_bytes: Size limit in bytes (default: OCR_MAX_UPLOAD_MB)
+
+    Returns:
+        Tuple of (temporary file path, sniffed extension, size in bytes).
+        The caller is responsible for deleting the file.
+    """
+    if max_bytes is None:
+        max_bytes = max_upload_bytes()
+
+    # Reject early when the multipart parser already knows the size
+    if getattr(file, "size", None) and file.size > max_bytes:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File too large. Maximum size: {max_bytes // (1024 * 1024)} MB",
+        )
+
+    first_chunk = await file.read(CHUNK_SIZE)
+    file_ext = sniff_image_type(first_chunk[:16])
+    if file_ext is None:
+        raise HTTPException(
+            status_code=415,
+            detail="File content is not a supported image (JPEG, PNG, BMP, TIFF, WebP)",
+        )
+
+    # Disk writes run in a worker thread, off the event loop
+    loop = asyncio.get_running_loop()
+    size = 0
+    tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix=file_ext)
+    try:
+        chunk = first_chunk
+        while chunk:
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"File too large. Maximum size: {max_bytes // (1024 * 1024)} MB",
+                )
+            await loop.run_in_executor(None, tmp_file.write, chunk)
+            chunk = await file.read(CHUNK_SIZE)
+        tmp_file.close()
+    except BaseException:
+        tmp_file.close()
+        os.unlink(tmp_file.name)
+        raise
+
+    return tmp_file.name, file_ext, size
+
+
+def check_image_dimensions(image_path) -> Tuple[int, int]:
+    """
+    Validate image dimensions from the file header without decoding pixels
+
+    Args:
+        image_path: Path to the image or encoded image bytes
+
+    Returns:
+        (width, height) of the image
+    """
+    from PIL import Image
+
+    try:
+        # Image.open only parses the header, pixel data is decoded lazily
+        with Image.open(open_image_source(image_path)) as img:
+            width, height = img.size
+    except Image.DecompressionBombError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image file: {e}")
+
+    if max(width, height) > max_image_side() or width * height > max_image_pixels():
+        raise HTTPException(
+            status_code=413,
+            detail=(
+                f"Image dimensions {width}x{height} exceed the limit "
+                f"({max_image_side()} px per side, {max_image_pixels()} pixels)"
+            ),
+        )
+    return width, height